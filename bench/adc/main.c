@@ -0,0 +1,151 @@
+/* Sigma-delta ADC benchmark: sample rate and accuracy.
+ *
+ * Needs --adc. Samples are streamed into a ring buffer; each level is
+ * measured on the second half of the ring, after the first pass has let the
+ * input settle. In simulation (python -m orangecrab_feather --sim --adc
+ * --sim-bench), the input is a model of the board's RC network whose level
+ * is set through sim_analog, so the measured samples are checked against
+ * it. On hardware, only channel 0 is sampled and reported. */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#include <irq.h>
+#include <libbase/uart.h>
+#include <generated/csr.h>
+#include <generated/soc.h>
+
+#include "bench.h"
+
+#ifndef BENCH_ADC_SAMPLES
+#define BENCH_ADC_SAMPLES 256
+#endif
+#ifndef BENCH_ADC_DIVIDER
+#define BENCH_ADC_DIVIDER 4
+#endif
+#ifndef BENCH_ADC_DECIMATION
+#define BENCH_ADC_DECIMATION 8
+#endif
+/* Allowed mean error, in 16-bit LSBs. */
+#ifndef BENCH_ADC_TOLERANCE
+#define BENCH_ADC_TOLERANCE 256
+#endif
+
+#ifdef CSR_ADC_BASE
+
+#define ADC_EV_HALF (1 << 0)
+#define ADC_EV_FULL (1 << 1)
+#define HALF (BENCH_ADC_SAMPLES/2)
+
+static uint16_t ring[BENCH_ADC_SAMPLES] __attribute__((aligned(4)));
+
+static void adc_wait(uint32_t ev)
+{
+	while (!(adc_ev_pending_read() & ev));
+	adc_ev_pending_write(ev);
+}
+
+struct adc_result {
+	uint32_t cycles;  /* for the second half of the ring */
+	uint32_t mean;
+	uint32_t min;
+	uint32_t max;
+};
+
+/* Fill the ring once, then time and analyse its second half. */
+static void adc_capture(struct adc_result *r)
+{
+	int i;
+
+	bench_flush_caches();
+	adc_control_write(0);
+	adc_ev_pending_write(ADC_EV_HALF | ADC_EV_FULL);
+	adc_overrun_write(1);
+	adc_control_write(1 << CSR_ADC_CONTROL_ENABLE_OFFSET);
+
+	adc_wait(ADC_EV_HALF);
+	bench_timer_start();
+	adc_wait(ADC_EV_FULL);
+	r->cycles = bench_timer_cycles();
+	adc_control_write(0);
+
+	bench_flush_caches();
+	r->mean = 0;
+	r->min = 0xffff;
+	r->max = 0;
+	for (i = HALF; i < BENCH_ADC_SAMPLES; i++) {
+		r->mean += ring[i];
+		if (ring[i] < r->min)
+			r->min = ring[i];
+		if (ring[i] > r->max)
+			r->max = ring[i];
+	}
+	r->mean /= HALF;
+
+	if (adc_overrun_read())
+		printf("adc: overrun\n");
+}
+
+static void bench_adc(void)
+{
+	struct adc_result r;
+	uint32_t rate;
+#ifdef CSR_SIM_ANALOG_BASE
+	static const uint16_t levels[] = {0x0800, 0x4000, 0x8000, 0xc000, 0xf800};
+	uint32_t max_error = 0, max_noise = 0;
+	uint32_t error;
+	unsigned int i;
+#endif
+
+	adc_divider_write(BENCH_ADC_DIVIDER);
+	adc_decimation_write(BENCH_ADC_DECIMATION);
+	adc_base_write((uint32_t)ring);
+	adc_size_write(sizeof(ring));
+
+#ifdef CSR_SIM_ANALOG_BASE
+	for (i = 0; i < sizeof(levels)/sizeof(levels[0]); i++) {
+		sim_analog_level_write(levels[i]);
+		adc_capture(&r);
+		error = r.mean > levels[i] ? r.mean - levels[i] : levels[i] - r.mean;
+		if (error > BENCH_ADC_TOLERANCE)
+			printf("adc: level 0x%04x measured 0x%04lx\n", levels[i], (unsigned long)r.mean);
+		if (error > max_error)
+			max_error = error;
+		if (r.max - r.min > max_noise)
+			max_noise = r.max - r.min;
+	}
+	bench_report_value("adc_max_error", max_error, "LSB");
+	bench_report_value("adc_max_noise_pp", max_noise, "LSB");
+#else
+	adc_capture(&r);
+	bench_report_value("adc_ch0_mean", r.mean, "LSB");
+	bench_report_value("adc_ch0_noise_pp", r.max - r.min, "LSB");
+#endif
+
+	rate = (uint32_t)(((uint64_t)HALF*CONFIG_CLOCK_FREQUENCY)/r.cycles);
+	bench_report_value("adc_sample_rate", rate, "S/s");
+	bench_report_value("adc_expected_sample_rate",
+		CONFIG_CLOCK_FREQUENCY/(BENCH_ADC_DIVIDER << BENCH_ADC_DECIMATION), "S/s");
+}
+
+#endif
+
+int main(void)
+{
+#ifdef CONFIG_CPU_HAS_INTERRUPT
+	irq_setmask(0);
+	irq_setie(1);
+#endif
+	uart_init();
+
+	printf("\nADC benchmark\n");
+#ifdef CSR_ADC_BASE
+	bench_adc();
+#else
+	printf("No ADC in this SoC (build with --adc).\n");
+#endif
+	bench_done();
+
+	while (1);
+	return 0;
+}
@@ -0,0 +1,71 @@
+#ifndef __BENCH_H
+#define __BENCH_H
+
+/* Timing and reporting helpers shared by the benchmark firmware.
+ *
+ * Every result is printed twice: once for humans and once as a single
+ * "BENCH {...}" JSON line, which is what host-side tools look for. */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#include <generated/csr.h>
+#include <generated/soc.h>
+#include <system.h>
+
+/* timer0 counts down at sys_clk, so one run can span 2^32 cycles (~89s at
+ * 48MHz). */
+static inline void bench_timer_start(void)
+{
+	timer0_en_write(0);
+	timer0_reload_write(0);
+	timer0_load_write(0xffffffff);
+	timer0_en_write(1);
+	timer0_update_value_write(1);
+}
+
+static inline uint32_t bench_timer_cycles(void)
+{
+	timer0_update_value_write(1);
+	return 0xffffffff - timer0_value_read();
+}
+
+static inline void bench_flush_caches(void)
+{
+	flush_cpu_dcache();
+#ifdef CONFIG_L2_SIZE
+	flush_l2_cache();
+#endif
+}
+
+/* Throughput in kB/s (1 kB = 1000 bytes). */
+static inline uint32_t bench_kbps(uint64_t bytes, uint32_t cycles)
+{
+	if (cycles == 0)
+		return 0;
+	return (uint32_t)((bytes * CONFIG_CLOCK_FREQUENCY) / ((uint64_t)cycles * 1000));
+}
+
+static inline void bench_report_throughput(const char *name, uint64_t bytes, uint32_t cycles)
+{
+	uint32_t kbps = bench_kbps(bytes, cycles);
+
+	printf("%-32s %8lu bytes %10lu cycles %4lu.%03lu MB/s\n", name,
+		(unsigned long)bytes, (unsigned long)cycles,
+		(unsigned long)(kbps/1000), (unsigned long)(kbps%1000));
+	printf("BENCH {\"name\": \"%s\", \"bytes\": %lu, \"cycles\": %lu, \"kB/s\": %lu}\n", name,
+		(unsigned long)bytes, (unsigned long)cycles, (unsigned long)kbps);
+}
+
+static inline void bench_report_value(const char *name, uint32_t value, const char *unit)
+{
+	printf("%-32s %10lu %s\n", name, (unsigned long)value, unit);
+	printf("BENCH {\"name\": \"%s\", \"%s\": %lu}\n", name, unit, (unsigned long)value);
+}
+
+static inline void bench_done(void)
+{
+	printf("BENCH {\"done\": true}\n");
+}
+
+#endif /* __BENCH_H */
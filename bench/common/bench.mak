@@ -0,0 +1,42 @@
+# Shared rules for the benchmark firmware. Each benchmark sets BENCH (the
+# image name) and OBJECTS, then includes this file. Point BUILD_DIR at the
+# SoC build directory if it isn't the default one.
+COMMON_DIR := $(dir $(lastword $(MAKEFILE_LIST)))
+BUILD_DIR ?= $(COMMON_DIR)../../build/gsd_orangecrab
+
+include $(BUILD_DIR)/software/include/generated/variables.mak
+include $(SOC_DIRECTORY)/software/common.mak
+
+CFLAGS  += -I$(COMMON_DIR)
+OBJECTS += crt0.o
+
+all: $(BENCH).bin
+
+%.bin: %.elf
+	$(OBJCOPY) -O binary $< $@
+
+vpath %.a $(PACKAGES:%=../%)
+
+$(BENCH).elf: $(OBJECTS)
+	$(CC) $(LDFLAGS) -T $(COMMON_DIR)linker.ld -N -o $@ \
+		$(OBJECTS) \
+		$(PACKAGES:%=-L$(BUILD_DIR)/software/%) \
+		-Wl,--whole-archive \
+		-Wl,--gc-sections \
+		-Wl,-Map,$@.map \
+		$(LIBS:lib%=-l%)
+
+-include $(OBJECTS:.o=.d)
+
+VPATH = $(BIOS_DIRECTORY):$(BIOS_DIRECTORY)/cmds:$(CPU_DIRECTORY)
+
+%.o: %.c
+	$(compile)
+
+%.o: %.S
+	$(assemble)
+
+clean:
+	$(RM) $(OBJECTS) $(OBJECTS:.o=.d) $(BENCH).elf $(BENCH).elf.map $(BENCH).bin
+
+.PHONY: all clean
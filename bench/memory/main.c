@@ -0,0 +1,168 @@
+/* Main RAM bandwidth and latency benchmark.
+ *
+ * Works on a buffer in the upper half of main RAM (the firmware runs from
+ * the bottom), so that it is larger than the L1 and L2 caches. Sequential
+ * and random accesses are 32-bit; random addresses come from an LCG whose
+ * cost is included. Latency is measured by chasing a random cyclic chain of
+ * pointers, one per 64-byte line. */
+
+#include <stdio.h>
+#include <stdint.h>
+
+#include <irq.h>
+#include <libbase/uart.h>
+#include <generated/csr.h>
+#include <generated/mem.h>
+#include <generated/soc.h>
+
+#include "bench.h"
+
+#ifndef BENCH_MEM_SIZE
+#if MAIN_RAM_SIZE/4 < 1024*1024
+#define BENCH_MEM_SIZE (MAIN_RAM_SIZE/4)
+#else
+#define BENCH_MEM_SIZE (1024*1024)
+#endif
+#endif
+#ifndef BENCH_MEM_BASE
+#define BENCH_MEM_BASE (MAIN_RAM_BASE + MAIN_RAM_SIZE/2)
+#endif
+
+#define WORDS (BENCH_MEM_SIZE/4)
+#define LINE_WORDS 16
+#define LINES (WORDS/LINE_WORDS)
+
+static volatile uint32_t *const buf = (volatile uint32_t *)BENCH_MEM_BASE;
+
+static uint32_t lcg_state;
+
+static inline uint32_t lcg(void)
+{
+	lcg_state = lcg_state*1664525 + 1013904223;
+	return lcg_state;
+}
+
+/* LCG-derived index below n (n a power of two). */
+static inline uint32_t rand_index(uint32_t n)
+{
+	return (lcg() >> 8) & (n - 1);
+}
+
+static void bench_seq_write(void)
+{
+	uint32_t cycles;
+	uint32_t i;
+
+	bench_flush_caches();
+	bench_timer_start();
+	for (i = 0; i < WORDS; i++)
+		buf[i] = i;
+	bench_flush_caches();
+	cycles = bench_timer_cycles();
+	bench_report_throughput("mem_seq_write", BENCH_MEM_SIZE, cycles);
+}
+
+static void bench_seq_read(void)
+{
+	uint32_t sum = 0;
+	uint32_t cycles;
+	uint32_t i;
+
+	bench_flush_caches();
+	bench_timer_start();
+	for (i = 0; i < WORDS; i++)
+		sum += buf[i];
+	cycles = bench_timer_cycles();
+	bench_report_throughput("mem_seq_read", BENCH_MEM_SIZE, cycles);
+	if (sum != (uint32_t)((uint64_t)WORDS*(WORDS - 1)/2))
+		printf("mem_seq_read: data mismatch\n");
+}
+
+static void bench_rand_write(void)
+{
+	uint32_t cycles;
+	uint32_t i;
+
+	lcg_state = 1;
+	bench_flush_caches();
+	bench_timer_start();
+	for (i = 0; i < WORDS; i++)
+		buf[rand_index(WORDS)] = i;
+	bench_flush_caches();
+	cycles = bench_timer_cycles();
+	bench_report_throughput("mem_rand_write", BENCH_MEM_SIZE, cycles);
+}
+
+static void bench_rand_read(void)
+{
+	uint32_t sum = 0;
+	uint32_t cycles;
+	uint32_t i;
+
+	lcg_state = 1;
+	bench_flush_caches();
+	bench_timer_start();
+	for (i = 0; i < WORDS; i++)
+		sum += buf[rand_index(WORDS)];
+	cycles = bench_timer_cycles();
+	bench_report_throughput("mem_rand_read", BENCH_MEM_SIZE, cycles);
+	(void)sum;
+}
+
+/* Sattolo's algorithm gives a single cycle through all lines. */
+static void build_chain(void)
+{
+	uint32_t i, j, tmp;
+
+	for (i = 0; i < LINES; i++)
+		buf[i*LINE_WORDS] = i;
+	lcg_state = 1;
+	for (i = LINES - 1; i > 0; i--) {
+		j = (lcg() >> 8) % i;
+		tmp = buf[i*LINE_WORDS];
+		buf[i*LINE_WORDS] = buf[j*LINE_WORDS];
+		buf[j*LINE_WORDS] = tmp;
+	}
+	for (i = 0; i < LINES; i++)
+		buf[i*LINE_WORDS] = (uint32_t)&buf[buf[i*LINE_WORDS]*LINE_WORDS];
+}
+
+static void bench_latency(void)
+{
+	volatile uint32_t *p = buf;
+	uint32_t cycles;
+	uint32_t i;
+
+	build_chain();
+	bench_flush_caches();
+	bench_timer_start();
+	for (i = 0; i < LINES; i++)
+		p = (volatile uint32_t *)*p;
+	cycles = bench_timer_cycles();
+
+	if (p != buf)
+		printf("mem_latency: broken chain\n");
+	bench_report_value("mem_latency", cycles/LINES, "cycles");
+	bench_report_value("mem_latency_ns", (uint32_t)((uint64_t)cycles*1000000000/CONFIG_CLOCK_FREQUENCY/LINES), "ns");
+}
+
+int main(void)
+{
+#ifdef CONFIG_CPU_HAS_INTERRUPT
+	irq_setmask(0);
+	irq_setie(1);
+#endif
+	uart_init();
+
+	printf("\nMain RAM benchmark: %lu bytes at 0x%08lx\n",
+		(unsigned long)BENCH_MEM_SIZE, (unsigned long)BENCH_MEM_BASE);
+	bench_seq_write();
+	bench_seq_read();
+	bench_rand_write();
+	bench_rand_read();
+	bench_latency();
+	bench_done();
+
+	while (1);
+	return 0;
+}
@@ -0,0 +1,391 @@
+/* Feather peripheral and memory benchmarks.
+ *
+ * Meant for the simulation (python -m orangecrab_feather --sim-bench), whose
+ * stand-in pads loop SPI MOSI to MISO and the Feather UART's TX to RX. On
+ * hardware, add the same jumpers. I2C transactions are timed whether or not
+ * anything ACKs them. The GPIO test (--gpio) captures the pattern it plays
+ * on the same pins, which read back what they drive. */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+
+#include <irq.h>
+#include <libbase/uart.h>
+#include <generated/csr.h>
+#include <generated/mem.h>
+#include <generated/soc.h>
+
+#include "bench.h"
+
+#ifndef BENCH_SPI_BYTES
+#define BENCH_SPI_BYTES 256
+#endif
+#ifndef BENCH_UART_BYTES
+#define BENCH_UART_BYTES 64
+#endif
+#ifndef BENCH_I2C_TRANSACTIONS
+#define BENCH_I2C_TRANSACTIONS 4
+#endif
+#ifndef BENCH_I2C_FREQ
+#define BENCH_I2C_FREQ 400000
+#endif
+#ifndef BENCH_GPIO_SAMPLES
+#define BENCH_GPIO_SAMPLES 128
+#endif
+#ifndef BENCH_GPIO_TOGGLES
+#define BENCH_GPIO_TOGGLES 64
+#endif
+/* The main RAM buffer is in the upper half of main RAM: .bss is in the
+ * integrated SRAM, which is too small for it. */
+#ifndef BENCH_MEM_SIZE
+#if MAIN_RAM_SIZE/4 < 16*1024
+#define BENCH_MEM_SIZE (MAIN_RAM_SIZE/4)
+#else
+#define BENCH_MEM_SIZE (16*1024)
+#endif
+#endif
+#ifndef BENCH_MEM_BASE
+#define BENCH_MEM_BASE (MAIN_RAM_BASE + MAIN_RAM_SIZE/2)
+#endif
+
+static uint8_t tx_buf[BENCH_SPI_BYTES] __attribute__((aligned(4)));
+static uint8_t rx_buf[BENCH_SPI_BYTES] __attribute__((aligned(4)));
+static volatile uint32_t *const mem_buf = (volatile uint32_t *)BENCH_MEM_BASE;
+
+static void fill_tx_buf(void)
+{
+	int i;
+
+	for (i = 0; i < BENCH_SPI_BYTES; i++)
+		tx_buf[i] = i*7 + 1;
+	memset(rx_buf, 0, sizeof(rx_buf));
+}
+
+static int check_rx_buf(const char *name, int n)
+{
+	if (memcmp(tx_buf, rx_buf, n)) {
+		printf("%s: loopback data mismatch\n", name);
+		return 0;
+	}
+	return 1;
+}
+
+/* SPI -------------------------------------------------------------------- */
+
+#if defined(CSR_SPI_TX_BASE_ADDR)
+
+/* DMA SPI engine (--spi-dma): one transfer for the whole buffer. */
+static void bench_spi(void)
+{
+	uint32_t cycles;
+
+	fill_tx_buf();
+	spi_clk_divider_write(1);
+	bench_flush_caches();
+
+	bench_timer_start();
+	spi_tx_base_write((uint32_t)tx_buf);
+	spi_rx_base_write((uint32_t)rx_buf);
+	spi_length_write(BENCH_SPI_BYTES);
+	spi_control_write((1 << CSR_SPI_CONTROL_START_OFFSET) |
+		(1 << CSR_SPI_CONTROL_TX_ENABLE_OFFSET) |
+		(1 << CSR_SPI_CONTROL_RX_ENABLE_OFFSET));
+	while (spi_status_read() & (1 << CSR_SPI_STATUS_BUSY_OFFSET));
+	cycles = bench_timer_cycles();
+
+	bench_flush_caches();
+	check_rx_buf("spi_dma", BENCH_SPI_BYTES);
+	bench_report_throughput("spi_dma", BENCH_SPI_BYTES, cycles);
+	bench_report_value("spi_dma_cycles_per_byte", cycles/BENCH_SPI_BYTES, "cycles");
+}
+
+#elif defined(CSR_SPI_BASE)
+
+/* LiteX's SPIMaster: one CSR round trip per byte. */
+static void bench_spi(void)
+{
+	uint32_t cycles;
+	int i;
+
+	fill_tx_buf();
+#ifdef CSR_SPI_CLK_DIVIDER_ADDR
+	spi_clk_divider_write(2);
+#endif
+
+	bench_timer_start();
+	for (i = 0; i < BENCH_SPI_BYTES; i++) {
+		spi_mosi_write(tx_buf[i]);
+		spi_control_write(8*(1 << CSR_SPI_CONTROL_LENGTH_OFFSET) | (1 << CSR_SPI_CONTROL_START_OFFSET));
+		while ((spi_status_read() & (1 << CSR_SPI_STATUS_DONE_OFFSET)) == 0);
+		rx_buf[i] = spi_miso_read();
+	}
+	cycles = bench_timer_cycles();
+
+	check_rx_buf("spi", BENCH_SPI_BYTES);
+	bench_report_throughput("spi", BENCH_SPI_BYTES, cycles);
+	bench_report_value("spi_cycles_per_byte", cycles/BENCH_SPI_BYTES, "cycles");
+}
+
+#endif
+
+/* Feather UART ----------------------------------------------------------- */
+
+#define FEATHER_UART_EV_RX (1 << 1)
+
+#if defined(CSR_FEATHER_UART_RX_DMA_BASE)
+
+/* RX DMA (--feather-uart-rx-dma): received bytes land in a ring buffer. */
+static void bench_uart(void)
+{
+	uint32_t cycles;
+	int sent = 0;
+
+	fill_tx_buf();
+	bench_flush_caches();
+	feather_uart_rx_dma_control_write(0);
+	feather_uart_rx_dma_base_write((uint32_t)rx_buf);
+	feather_uart_rx_dma_size_write(BENCH_SPI_BYTES);
+	feather_uart_rx_dma_read_offset_write(0);
+	feather_uart_rx_dma_control_write(1 << CSR_FEATHER_UART_RX_DMA_CONTROL_ENABLE_OFFSET);
+
+	bench_timer_start();
+	while (feather_uart_rx_dma_level_read() < BENCH_UART_BYTES) {
+		if (sent < BENCH_UART_BYTES && !feather_uart_txfull_read())
+			feather_uart_rxtx_write(tx_buf[sent++]);
+	}
+	cycles = bench_timer_cycles();
+
+	bench_flush_caches();
+	check_rx_buf("feather_uart_rx_dma", BENCH_UART_BYTES);
+	bench_report_throughput("feather_uart_rx_dma", BENCH_UART_BYTES, cycles);
+}
+
+#elif defined(CSR_FEATHER_UART_BASE)
+
+static void bench_uart(void)
+{
+	uint32_t cycles;
+	int sent = 0, received = 0;
+
+	fill_tx_buf();
+	while (!feather_uart_rxempty_read())
+		feather_uart_ev_pending_write(FEATHER_UART_EV_RX);
+
+	bench_timer_start();
+	while (received < BENCH_UART_BYTES) {
+		if (sent < BENCH_UART_BYTES && !feather_uart_txfull_read())
+			feather_uart_rxtx_write(tx_buf[sent++]);
+		if (!feather_uart_rxempty_read()) {
+			rx_buf[received++] = feather_uart_rxtx_read();
+			feather_uart_ev_pending_write(FEATHER_UART_EV_RX);
+		}
+	}
+	cycles = bench_timer_cycles();
+
+	check_rx_buf("feather_uart", BENCH_UART_BYTES);
+	bench_report_throughput("feather_uart", BENCH_UART_BYTES, cycles);
+}
+
+#endif
+
+/* I2C -------------------------------------------------------------------- */
+
+#if defined(CSR_I2C_BURST_BASE)
+
+#define I2C_BURST_CMD(field) (1 << CSR_I2C_BURST_CMD_##field##_OFFSET)
+#define I2C_BURST_EV_DONE (1 << 0)
+
+/* I2C burst engine (--i2c-burst): the same register write, queued as two
+ * commands, with one completion event. Without a device the address is
+ * NACKed and the engine stops early. */
+static void i2c_write_reg(void)
+{
+	i2c_burst_ev_pending_write(I2C_BURST_EV_DONE);
+	i2c_burst_cmd_write(I2C_BURST_CMD(START) | (0x50 << 1));
+	i2c_burst_cmd_write(I2C_BURST_CMD(STOP) | 0x00);
+	while (!(i2c_burst_ev_pending_read() & I2C_BURST_EV_DONE));
+}
+
+static void bench_i2c(void)
+{
+	uint32_t speed = BENCH_I2C_FREQ >= 1000000 ? 2 : BENCH_I2C_FREQ >= 400000 ? 1 : 0;
+	uint32_t cycles;
+	int i;
+
+	i2c_burst_control_write((speed << CSR_I2C_BURST_CONTROL_SPEED_OFFSET) |
+		(1 << CSR_I2C_BURST_CONTROL_RESET_OFFSET));
+
+	bench_timer_start();
+	for (i = 0; i < BENCH_I2C_TRANSACTIONS; i++)
+		i2c_write_reg();
+	cycles = bench_timer_cycles()/BENCH_I2C_TRANSACTIONS;
+
+	bench_report_value("i2c_burst_write_latency", cycles, "cycles");
+	bench_report_value("i2c_burst_write_latency_us", cycles/(CONFIG_CLOCK_FREQUENCY/1000000), "us");
+}
+
+#elif defined(CSR_BETRUSTED_I2C_BASE)
+
+#define I2C_CMD(field) (1 << CSR_BETRUSTED_I2C_COMMAND_##field##_OFFSET)
+
+static void i2c_wait(void)
+{
+	while (betrusted_i2c_status_read() & (1 << CSR_BETRUSTED_I2C_STATUS_TIP_OFFSET));
+}
+
+/* A one byte register write to address 0x50: START, address, data, STOP. */
+static void i2c_write_reg(void)
+{
+	betrusted_i2c_txr_write(0x50 << 1);
+	betrusted_i2c_command_write(I2C_CMD(STA) | I2C_CMD(WR));
+	i2c_wait();
+	betrusted_i2c_txr_write(0x00);
+	betrusted_i2c_command_write(I2C_CMD(WR) | I2C_CMD(STO));
+	i2c_wait();
+}
+
+static void bench_i2c(void)
+{
+	uint32_t cycles;
+	int i;
+
+	betrusted_i2c_prescale_write(CONFIG_CLOCK_FREQUENCY/(5*BENCH_I2C_FREQ) - 1);
+	betrusted_i2c_control_write(1 << CSR_BETRUSTED_I2C_CONTROL_EN_OFFSET);
+
+	bench_timer_start();
+	for (i = 0; i < BENCH_I2C_TRANSACTIONS; i++)
+		i2c_write_reg();
+	cycles = bench_timer_cycles()/BENCH_I2C_TRANSACTIONS;
+
+	bench_report_value("i2c_write_latency", cycles, "cycles");
+	bench_report_value("i2c_write_latency_us", cycles/(CONFIG_CLOCK_FREQUENCY/1000000), "us");
+}
+
+#endif
+
+/* GPIO ------------------------------------------------------------------- */
+
+#if defined(CSR_GPIO_BASE)
+
+#define GPIO_EV_CAPTURE  (1 << CSR_GPIO_EV_PENDING_CAPTURE_OFFSET)
+#define GPIO_EV_PLAYBACK (1 << CSR_GPIO_EV_PENDING_PLAYBACK_OFFSET)
+
+static uint16_t gpio_pattern[BENCH_GPIO_SAMPLES] __attribute__((aligned(4)));
+static uint16_t gpio_capture[BENCH_GPIO_SAMPLES] __attribute__((aligned(4)));
+
+/* Toggling pins from the CPU against playing a pattern at sys_clk rate,
+ * captured at the same rate. The pattern fits in the playback FIFO, so it
+ * plays at full rate wherever it is in memory. */
+static void bench_gpio(void)
+{
+	uint32_t cycles;
+	int i, errors = 0;
+
+	gpio_oe_write(0xffff);
+	gpio_out_write(0);
+
+	bench_timer_start();
+	for (i = 0; i < BENCH_GPIO_TOGGLES; i++)
+		gpio_out_write(i & 1);
+	cycles = bench_timer_cycles()/BENCH_GPIO_TOGGLES;
+	bench_report_value("gpio_cpu_toggle", cycles, "cycles");
+	gpio_out_write(0);
+
+	/* Start capturing on the pattern's first sample. */
+	for (i = 0; i < BENCH_GPIO_SAMPLES; i++) {
+		gpio_pattern[i] = i + 1;
+		gpio_capture[i] = 0;
+	}
+	bench_flush_caches();
+	gpio_ev_pending_write(GPIO_EV_CAPTURE | GPIO_EV_PLAYBACK);
+
+	gpio_capture_divider_write(1);
+	gpio_capture_trigger_mask_write(0xffff);
+	gpio_capture_trigger_value_write(1);
+	gpio_capture_base_write((uint32_t)gpio_capture);
+	gpio_capture_length_write(BENCH_GPIO_SAMPLES);
+	gpio_capture_control_write(1 << CSR_GPIO_CAPTURE_CONTROL_START_OFFSET);
+
+	gpio_playback_divider_write(1);
+	gpio_playback_base_write((uint32_t)gpio_pattern);
+	gpio_playback_length_write(BENCH_GPIO_SAMPLES);
+
+	bench_timer_start();
+	gpio_playback_control_write(1 << CSR_GPIO_PLAYBACK_CONTROL_START_OFFSET);
+	while ((gpio_ev_pending_read() & (GPIO_EV_CAPTURE | GPIO_EV_PLAYBACK)) !=
+		(GPIO_EV_CAPTURE | GPIO_EV_PLAYBACK));
+	cycles = bench_timer_cycles();
+	gpio_ev_pending_write(GPIO_EV_CAPTURE | GPIO_EV_PLAYBACK);
+
+	/* oe reads back only the pins that exist. */
+	bench_flush_caches();
+	for (i = 0; i < BENCH_GPIO_SAMPLES; i++) {
+		if ((gpio_capture[i] ^ gpio_pattern[i]) & gpio_oe_read())
+			errors++;
+	}
+	if (errors)
+		printf("gpio: %d samples differ\n", errors);
+
+	bench_report_value("gpio_playback", cycles, "cycles");
+	bench_report_value("gpio_capture_count", gpio_capture_count_read(), "samples");
+	bench_report_value("gpio_capture_errors", errors, "samples");
+	gpio_oe_write(0);
+}
+
+#endif
+
+/* Memory ----------------------------------------------------------------- */
+
+static void bench_mem(void)
+{
+	volatile uint32_t *p = mem_buf;
+	uint32_t sum = 0;
+	uint32_t cycles;
+	int i;
+
+	bench_flush_caches();
+	bench_timer_start();
+	for (i = 0; i < BENCH_MEM_SIZE/4; i++)
+		p[i] = i;
+	cycles = bench_timer_cycles();
+	bench_report_throughput("mem_seq_write", BENCH_MEM_SIZE, cycles);
+
+	bench_flush_caches();
+	bench_timer_start();
+	for (i = 0; i < BENCH_MEM_SIZE/4; i++)
+		sum += p[i];
+	cycles = bench_timer_cycles();
+	bench_report_throughput("mem_seq_read", BENCH_MEM_SIZE, cycles);
+
+	if (sum != (uint32_t)((BENCH_MEM_SIZE/4)*(BENCH_MEM_SIZE/4 - 1)/2))
+		printf("mem: data mismatch\n");
+}
+
+int main(void)
+{
+#ifdef CONFIG_CPU_HAS_INTERRUPT
+	irq_setmask(0);
+	irq_setie(1);
+#endif
+	uart_init();
+
+	printf("\nPeripheral benchmarks\n");
+#if defined(CSR_SPI_BASE)
+	bench_spi();
+#endif
+#if defined(CSR_FEATHER_UART_BASE)
+	bench_uart();
+#endif
+#if defined(CSR_I2C_BURST_BASE) || defined(CSR_BETRUSTED_I2C_BASE)
+	bench_i2c();
+#endif
+#if defined(CSR_GPIO_BASE)
+	bench_gpio();
+#endif
+	bench_mem();
+	bench_done();
+
+	while (1);
+	return 0;
+}
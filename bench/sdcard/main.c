@@ -0,0 +1,422 @@
+/* Sequential SD card throughput benchmark.
+ *
+ * Works with whichever SD card core the SoC was built with
+ * (--sdcard-mode): LiteX's SPI core (spi), the DMA SPI engine (spi-dma) or
+ * the native 4-bit core (sd4). The write test overwrites BENCH_WRITE_SECTOR
+ * onwards, so it is only built with "make WRITE=1". */
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+
+#include <irq.h>
+#include <libbase/uart.h>
+#include <generated/csr.h>
+#include <generated/soc.h>
+
+#include "bench.h"
+
+#ifndef BENCH_BUF_SIZE
+#define BENCH_BUF_SIZE 4096
+#endif
+#ifndef BENCH_TOTAL_BYTES
+#define BENCH_TOTAL_BYTES (1024*1024)
+#endif
+#ifndef BENCH_READ_SECTOR
+#define BENCH_READ_SECTOR 0
+#endif
+#ifndef BENCH_WRITE_SECTOR
+#define BENCH_WRITE_SECTOR (1024*1024)
+#endif
+
+#define BLOCK_SIZE 512
+
+static uint8_t buffer[BENCH_BUF_SIZE] __attribute__((aligned(4)));
+
+#if defined(CSR_SDCORE_BASE) || defined(CSR_SDCARD_CORE_BASE)
+
+/* Native 4-bit mode: liblitesdcard does the work, including DMA. */
+
+#include <liblitesdcard/sdcard.h>
+
+#define SD_MODE "sd4"
+
+static int sd_init(void)
+{
+	return sdcard_init();
+}
+
+static int sd_read(uint32_t block, uint32_t count, uint8_t *buf)
+{
+	sdcard_read(block, count, buf);
+	return 1;
+}
+
+static int sd_write(uint32_t block, uint32_t count, uint8_t *buf)
+{
+	sdcard_write(block, count, buf);
+	return 1;
+}
+
+#else
+
+/* SPI mode: one protocol implementation on top of either SPI core. */
+
+#if defined(CSR_SPISDCARD_BASE)
+
+#define SD_MODE "spi"
+
+static void spi_set_clk_freq(uint32_t clk_freq)
+{
+	uint32_t divider;
+
+	divider = CONFIG_CLOCK_FREQUENCY/clk_freq + 1;
+	if (divider < 2)
+		divider = 2;
+	spisdcard_clk_divider_write(divider);
+}
+
+static void spi_cs(int sel)
+{
+	spisdcard_cs_write(sel ? 1 : 0);
+}
+
+static uint8_t spi_xfer(uint8_t byte)
+{
+	spisdcard_mosi_write(byte);
+	spisdcard_control_write(8*(1 << 8) | (1 << 0));
+	while ((spisdcard_status_read() & 0x1) == 0);
+	return spisdcard_miso_read();
+}
+
+static void spi_read_buf(uint8_t *buf, uint32_t n)
+{
+	while (n--)
+		*buf++ = spi_xfer(0xff);
+}
+
+static void spi_write_buf(const uint8_t *buf, uint32_t n)
+{
+	while (n--)
+		spi_xfer(*buf++);
+}
+
+#elif defined(CSR_SPISDCARD_DMA_BASE)
+
+#define SD_MODE "spi-dma"
+
+static void spi_set_clk_freq(uint32_t clk_freq)
+{
+	uint32_t divider;
+
+	divider = CONFIG_CLOCK_FREQUENCY/(2*clk_freq);
+	if (divider < 1)
+		divider = 1;
+	spisdcard_dma_clk_divider_write(divider);
+}
+
+static void spi_cs(int sel)
+{
+	spisdcard_dma_cs_write(sel ? 1 : 0);
+}
+
+static void spi_dma(const void *tx, void *rx, uint32_t n)
+{
+	uint32_t control = 1 << CSR_SPISDCARD_DMA_CONTROL_START_OFFSET;
+
+	if (tx) {
+		spisdcard_dma_tx_base_write((uint32_t)tx);
+		control |= 1 << CSR_SPISDCARD_DMA_CONTROL_TX_ENABLE_OFFSET;
+	}
+	if (rx) {
+		spisdcard_dma_rx_base_write((uint32_t)rx);
+		control |= 1 << CSR_SPISDCARD_DMA_CONTROL_RX_ENABLE_OFFSET;
+	}
+	spisdcard_dma_length_write(n);
+	bench_flush_caches();
+	spisdcard_dma_control_write(control);
+	while (spisdcard_dma_status_read() & (1 << CSR_SPISDCARD_DMA_STATUS_BUSY_OFFSET));
+	if (rx)
+		bench_flush_caches();
+}
+
+static uint8_t spi_xfer(uint8_t byte)
+{
+	static uint32_t tx, rx;
+
+	tx = byte;
+	spi_dma(&tx, &rx, 1);
+	return rx & 0xff;
+}
+
+static void spi_read_buf(uint8_t *buf, uint32_t n)
+{
+	spi_dma(NULL, buf, n);
+}
+
+static void spi_write_buf(const uint8_t *buf, uint32_t n)
+{
+	spi_dma(buf, NULL, n);
+}
+
+#else
+#error "No SD card core in this SoC"
+#endif
+
+#define CMD0    (0)
+#define CMD8    (8)
+#define CMD12   (12)
+#define CMD18   (18)
+#define CMD25   (25)
+#define CMD55   (55)
+#define CMD58   (58)
+#define ACMD41  (0x80 + 41)
+
+/* Set when the card uses byte instead of block addresses (SDSC). */
+static int sd_byte_addressing;
+
+static int sd_wait_ready(void)
+{
+	uint32_t timeout = 100000;
+
+	while (timeout--)
+		if (spi_xfer(0xff) == 0xff)
+			return 1;
+	return 0;
+}
+
+static void sd_deselect(void)
+{
+	spi_cs(0);
+	spi_xfer(0xff);
+}
+
+static int sd_select(void)
+{
+	spi_cs(1);
+	spi_xfer(0xff);
+	if (sd_wait_ready())
+		return 1;
+	sd_deselect();
+	return 0;
+}
+
+static uint8_t sd_cmd(uint8_t cmd, uint32_t arg)
+{
+	uint8_t buf[6];
+	uint8_t byte;
+	int timeout;
+
+	if (cmd & 0x80) {
+		cmd &= 0x7f;
+		byte = sd_cmd(CMD55, 0);
+		if (byte > 1)
+			return byte;
+	}
+
+	if (cmd != CMD12 && cmd != CMD0) {
+		sd_deselect();
+		if (!sd_select())
+			return 0xff;
+	}
+
+	buf[0] = 0x40 | cmd;
+	buf[1] = arg >> 24;
+	buf[2] = arg >> 16;
+	buf[3] = arg >> 8;
+	buf[4] = arg >> 0;
+	if (cmd == CMD0)
+		buf[5] = 0x95;
+	else if (cmd == CMD8)
+		buf[5] = 0x87;
+	else
+		buf[5] = 0x01;
+	spi_write_buf(buf, 6);
+
+	if (cmd == CMD12)
+		spi_xfer(0xff);
+	for (timeout = 10; timeout > 0; timeout--) {
+		byte = spi_xfer(0xff);
+		if ((byte & 0x80) == 0)
+			break;
+	}
+	return byte;
+}
+
+static int sd_init(void)
+{
+	uint8_t ocr[4];
+	int timeout;
+	int i;
+
+	spi_set_clk_freq(400000);
+
+	for (timeout = 1000; timeout > 0; timeout--) {
+		spi_cs(0);
+		for (i = 0; i < 10; i++)
+			spi_xfer(0xff);
+		spi_cs(1);
+		if (sd_cmd(CMD0, 0) == 0x1)
+			break;
+	}
+	if (timeout == 0)
+		return 0;
+
+	if (sd_cmd(CMD8, 0x1aa) != 0x1)
+		return 0;
+	spi_read_buf(ocr, 4);
+
+	for (timeout = 1000; timeout > 0; timeout--) {
+		if (sd_cmd(ACMD41, 1 << 30) == 0)
+			break;
+		busy_wait(1);
+	}
+	if (timeout == 0)
+		return 0;
+
+	if (sd_cmd(CMD58, 0) != 0)
+		return 0;
+	spi_read_buf(ocr, 4);
+	sd_byte_addressing = !(ocr[0] & 0x40);
+
+	sd_deselect();
+	spi_set_clk_freq(25000000);
+	return 1;
+}
+
+static uint32_t sd_addr(uint32_t block)
+{
+	return sd_byte_addressing ? block*BLOCK_SIZE : block;
+}
+
+static int sd_read(uint32_t block, uint32_t count, uint8_t *buf)
+{
+	uint8_t crc[2];
+	int ok = 0;
+	int timeout;
+
+	if (sd_cmd(CMD18, sd_addr(block)) != 0)
+		goto out;
+
+	while (count--) {
+		for (timeout = 100000; timeout > 0; timeout--)
+			if (spi_xfer(0xff) == 0xfe)
+				break;
+		if (timeout == 0)
+			goto stop;
+		spi_read_buf(buf, BLOCK_SIZE);
+		spi_read_buf(crc, 2);
+		buf += BLOCK_SIZE;
+	}
+	ok = 1;
+
+stop:
+	sd_cmd(CMD12, 0);
+	sd_wait_ready();
+out:
+	sd_deselect();
+	return ok;
+}
+
+static int sd_write(uint32_t block, uint32_t count, uint8_t *buf)
+{
+	static const uint8_t crc[2] __attribute__((aligned(4))) = {0xff, 0xff};
+	int ok = 0;
+
+	if (sd_cmd(CMD25, sd_addr(block)) != 0)
+		goto out;
+
+	while (count--) {
+		spi_xfer(0xfc);
+		spi_write_buf(buf, BLOCK_SIZE);
+		spi_write_buf(crc, 2);
+		if ((spi_xfer(0xff) & 0x1f) != 0x05)
+			goto stop;
+		if (!sd_wait_ready())
+			goto stop;
+		buf += BLOCK_SIZE;
+	}
+	ok = 1;
+
+stop:
+	spi_xfer(0xfd);
+	spi_xfer(0xff);
+	sd_wait_ready();
+out:
+	sd_deselect();
+	return ok;
+}
+
+#endif
+
+static void bench_read(void)
+{
+	uint32_t blocks = BENCH_BUF_SIZE/BLOCK_SIZE;
+	uint32_t block = BENCH_READ_SECTOR;
+	uint64_t bytes = 0;
+	uint32_t cycles;
+
+	bench_timer_start();
+	while (bytes < BENCH_TOTAL_BYTES) {
+		if (!sd_read(block, blocks, buffer)) {
+			printf("Read failed at block %lu\n", (unsigned long)block);
+			return;
+		}
+		block += blocks;
+		bytes += BENCH_BUF_SIZE;
+	}
+	cycles = bench_timer_cycles();
+	bench_report_throughput("sdcard_" SD_MODE "_seq_read", bytes, cycles);
+}
+
+#ifdef BENCH_SDCARD_WRITE
+static void bench_write(void)
+{
+	uint32_t blocks = BENCH_BUF_SIZE/BLOCK_SIZE;
+	uint32_t block = BENCH_WRITE_SECTOR;
+	uint64_t bytes = 0;
+	uint32_t cycles;
+	uint32_t i;
+
+	for (i = 0; i < BENCH_BUF_SIZE; i++)
+		buffer[i] = i;
+	bench_flush_caches();
+
+	bench_timer_start();
+	while (bytes < BENCH_TOTAL_BYTES) {
+		if (!sd_write(block, blocks, buffer)) {
+			printf("Write failed at block %lu\n", (unsigned long)block);
+			return;
+		}
+		block += blocks;
+		bytes += BENCH_BUF_SIZE;
+	}
+	cycles = bench_timer_cycles();
+	bench_report_throughput("sdcard_" SD_MODE "_seq_write", bytes, cycles);
+}
+#endif
+
+int main(void)
+{
+#ifdef CONFIG_CPU_HAS_INTERRUPT
+	irq_setmask(0);
+	irq_setie(1);
+#endif
+	uart_init();
+
+	printf("\nSD card benchmark (" SD_MODE " mode)\n");
+	if (!sd_init()) {
+		printf("SD card initialization failed\n");
+		bench_done();
+		while (1);
+	}
+
+	bench_read();
+#ifdef BENCH_SDCARD_WRITE
+	bench_write();
+#endif
+	bench_done();
+
+	while (1);
+	return 0;
+}
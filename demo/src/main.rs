@@ -6,13 +6,22 @@ extern crate riscv_rt;
 
 use riscv_rt::entry;
 use litex_pac::{write_reg};
-use litex_pac::{leds};
+use litex_pac::{leds, timer0};
+use litex_hal::executor::block_on;
+use litex_hal::timer0::Timer;
 
 #[entry]
 fn main() -> ! {
     let leds = leds::LEDS::take().unwrap();
+    let mut timer = Timer::new(timer0::TIMER0::take().unwrap());
+    litex_hal::interrupt::init();
 
-    write_reg!(leds, leds, OUT, 5);
-    // do something here
-    loop {}
+    block_on(async {
+        let mut pattern = 5;
+        loop {
+            write_reg!(leds, leds, OUT, pattern);
+            pattern ^= 7;
+            timer.delay_ms(500).await;
+        }
+    })
 }
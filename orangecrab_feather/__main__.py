@@ -7,27 +7,21 @@ from litex.build.lattice.trellis import trellis_args, trellis_argdict
 
 from .feather_soc import FeatherSoC
 from .builder import FeatherBuilder
+from .cache import BitstreamCache
+from .phases import BuildTimer
+from .matrix import run_matrix
+from .firmware import firmware_args
+from .profiler import profile_args
+from .load import load_args, load
 # Get argument parsing from here. Simplified compared to litex_boards.
 from .args import *
 
 # Build --------------------------------------------------------------------------------------------
 
-def main():
-    parser = argparse.ArgumentParser(description="LiteX SoC on OrangeCrab")
-    subparsers = parser.add_subparsers(help="sub-command help")
-
-    parser.add_argument("--build",           action="store_true",  help="Build bitstream")
-    parser.add_argument("--load",            action="store_true",  help="Load bitstream")
-    parser.add_argument("--toolchain",       default="trellis",    help="FPGA  use, trellis (default) or diamond")
-    parser.add_argument("--sys-clk-freq",    default=48e6,         help="System clock frequency (default: 48MHz)")
-    parser.add_argument("--revision",        default="0.2",        help="Board Revision: 0.1 or 0.2 (default)")
-    parser.add_argument("--device",          default="25F",        help="ECP5 device (default: 25F)")
-    parser.add_argument("--sdram-device",    default="MT41K64M16", help="SDRAM device (default: MT41K64M16)")
-    parser.add_argument("--no-pac",    action="store_true", help="Skip generating Rust PAC")
-    builder_args(parser)
-    soc_sdram_args(parser)
-    trellis_args(parser)
-    args = parser.parse_args()
+def build_soc(args):
+    peripherals = selected_peripherals(args)
+    check_peripherals(args, peripherals)
+    print("Peripherals: {}".format(", ".join(sorted(peripherals)) or "none"))
 
     soc = FeatherSoC(
         toolchain    = args.toolchain,
@@ -35,6 +29,28 @@ def main():
         device       = args.device,
         sdram_device = args.sdram_device,
         sys_clk_freq = int(float(args.sys_clk_freq)),
+        spi_dma      = args.spi_dma,
+        # Feather UART parameters
+        feather_uart_baudrate      = args.feather_uart_baudrate,
+        feather_uart_tx_fifo_depth = args.feather_uart_tx_fifo_depth,
+        feather_uart_rx_fifo_depth = args.feather_uart_rx_fifo_depth,
+        feather_uart_rx_dma        = args.feather_uart_rx_dma,
+        # I2C parameters
+        i2c_burst     = args.i2c_burst,
+        i2c_burst_dma = args.i2c_burst_dma,
+        adc           = "adc" in peripherals,
+        gpio          = "gpio" in peripherals,
+        # Peripheral selection
+        with_usb          = "usb" in peripherals,
+        with_leds         = "leds" in peripherals,
+        with_feather_uart = "feather_uart" in peripherals,
+        with_spi          = "spi" in peripherals,
+        with_i2c          = "i2c" in peripherals,
+        with_perf         = "perf" in peripherals,
+        with_build_hash   = "build_hash" in peripherals,
+        # DDR PHY parameters
+        ddr_cmd_delay = args.ddr_cmd_delay,
+        ddr_rtt_nom   = args.ddr_rtt_nom,
         # kwargs- SoC args
         # CPU parameters
         cpu_type                 = args.cpu_type,
@@ -51,23 +67,114 @@ def main():
         # Timer parameters
         timer_uptime             = args.timer_uptime,
         # SoC SDRAM args
-        max_sdram_size    = args.max_sdram_size)
+        max_sdram_size    = args.max_sdram_size,
+        l2_size           = args.l2_size,
+        min_l2_data_width = args.min_l2_data_width,
+        l2_reverse        = not args.no_l2_reverse)
 
-    soc.add_spi_sdcard()
+    if "sdcard" in peripherals:
+        if args.sdcard_mode == "sd4":
+            soc.add_sdcard()
+        elif args.sdcard_mode == "spi-dma":
+            soc.add_spi_sdcard_dma()
+        else:
+            soc.add_spi_sdcard()
+
+    if args.flash_boot:
+        soc.add_spi_flash_boot(args.flash_boot_offset)
+
+    return soc
+
+def build(args):
+    timer = BuildTimer()
+    with timer.phase("elaborate"):
+        soc = build_soc(args)
+
+    cache = None
+    if not args.no_cache:
+        cache = BitstreamCache(args.cache_dir, args.cache_size*1024*1024)
 
     builder = FeatherBuilder(soc,
         output_dir= args.output_dir,
         compile_software= not args.no_compile_software,
         compile_gateware= not args.no_compile_gateware,
         generate_doc= args.doc,
-        generate_pac= not args.no_pac)
+        generate_pac= not args.no_pac,
+        bitstream_cache= cache,
+        seed_sweep= args.seed_sweep,
+        seed_sweep_jobs= args.jobs,
+        seed_sweep_stop= args.seed_sweep_stop,
+        build_timer= timer,
+        peripherals= selected_peripherals(args),
+        baseline_report= args.baseline_report)
 
     builder_kargs = trellis_argdict(args) if args.toolchain == "trellis" else {}
     builder.build(**builder_kargs, run=args.build)
+    return builder
+
+def main():
+    parser = argparse.ArgumentParser(description="LiteX SoC on OrangeCrab")
+    subparsers = parser.add_subparsers(help="sub-command help")
+
+    parser.add_argument("--build",           action="store_true",  help="Build bitstream")
+    parser.add_argument("--load",            action="store_true",  help="Load bitstream")
+    parser.add_argument("--toolchain",       default="trellis",    help="FPGA  use, trellis (default) or diamond")
+    parser.add_argument("--sys-clk-freq",    default=48e6,         help="System clock frequency (default: 48MHz)")
+    parser.add_argument("--revision",        default="0.2",        help="Board Revision: 0.1 or 0.2 (default)")
+    parser.add_argument("--device",          default="25F",        help="ECP5 device (default: 25F)")
+    parser.add_argument("--sdram-device",    default="MT41K64M16", help="SDRAM device (default: MT41K64M16)")
+    parser.add_argument("--no-pac",    action="store_true", help="Skip generating Rust PAC")
+    parser.add_argument("--spi-dma",         action="store_true",  help="Use the DMA SPI engine for the Feather SPI pins")
+    parser.add_argument("--sdcard-mode",     default="spi",        help="SD card core: spi (default), spi-dma (no BIOS SD boot) or sd4",
+                                             choices=["spi", "spi-dma", "sd4"])
+    parser.add_argument("--feather-uart-baudrate",      default=115200, type=auto_int, help="Feather UART baudrate (default: 115200)")
+    parser.add_argument("--feather-uart-tx-fifo-depth", default=16,     type=auto_int, help="Feather UART TX FIFO depth (default: 16)")
+    parser.add_argument("--feather-uart-rx-fifo-depth", default=16,     type=auto_int, help="Feather UART RX FIFO depth (default: 16)")
+    parser.add_argument("--feather-uart-rx-dma",        action="store_true",           help="Receive Feather UART data into a ring buffer in memory via DMA")
+    parser.add_argument("--i2c-burst",         action="store_true",            help="Replace RTLI2C with the I2C burst engine (queued transactions, one IRQ)")
+    parser.add_argument("--i2c-burst-dma",     action="store_true",            help="I2C burst engine that also fetches commands and stores data via DMA")
+    parser.add_argument("--adc",               action="store_true",            help="Add the sigma-delta ADC, streaming samples to a ring buffer in memory")
+    parser.add_argument("--gpio",              action="store_true",            help="Add a GPIO core on the free Feather pins, with DMA capture (logic analyzer) and pattern playback")
+    parser.add_argument("--flash-boot",        action="store_true",            help="Map the SPI flash and boot firmware from it")
+    parser.add_argument("--flash-boot-offset", default=0x100000, type=auto_int, help="Firmware offset in SPI flash (default: 0x100000)")
+    parser.add_argument("--sim",               action="store_true",        help="Target the Verilator simulation instead of the OrangeCrab (--build runs it)")
+    parser.add_argument("--sim-bench",         action="store_true",        help="Run the benchmark firmware in simulation and write sim_bench.json")
+    parser.add_argument("--sim-timeout",       default=600, type=float,    help="Seconds to wait for a simulated benchmark (default: 600)")
+    parser.add_argument("--matrix",          default=None,         help="Build a matrix of variants from a JSON file or spec string")
+    parser.add_argument("--jobs",            default=None, type=int, help="Parallel matrix builds or seeds (default: CPU count)")
+    parser.add_argument("--seed-sweep",      default=None, type=int, help="Place and route with N seeds, keeping the best timing")
+    parser.add_argument("--seed-sweep-stop", action="store_true",  help="Stop the seed sweep once a seed meets timing")
+    builder_args(parser)
+    cache_args(parser)
+    peripheral_args(parser)
+    load_args(parser)
+    soc_sdram_args(parser)
+    trellis_args(parser)
+    firmware_args(subparsers)
+    profile_args(subparsers)
+    args = parser.parse_args()
+
+    if hasattr(args, "func"):
+        args.func(args)
+        return
+
+    if args.matrix:
+        run_matrix(parser, args, build, args.jobs)
+        return
+
+    if args.sim or args.sim_bench:
+        from .sim import build_sim, run_sim_benchmarks
+        if args.sim_bench:
+            run_sim_benchmarks(args)
+        else:
+            build_sim(args, run=args.build)
+        return
+
+    builder = build(args)
+    soc = builder.soc
 
-    if args.load:
-        prog = soc.platform.create_programmer()
-        prog.load_bitstream(os.path.join(builder.gateware_dir, soc.build_name + ".bit"))
+    if args.load or args.load_many:
+        load(args, soc, builder)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,191 @@
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.csr_eventmanager import *
+
+# Sigma-Delta ADC ----------------------------------------------------------------------------------
+
+class SigmaDeltaADC(Module, AutoCSR):
+    """Sigma-delta ADC with a CIC decimator, streaming samples to a ring buffer.
+
+    The input is compared against an RC network charged from ``pads.ctrl``
+    (all of its lines, if there are several; ``pads.sense`` is the
+    comparator output) and ``ctrl`` follows the comparator every
+    ``divider`` cycles, so the density of ones on ``ctrl`` is the input
+    voltage. A CIC filter of ``order`` stages decimates that bitstream by
+    ``2**decimation`` into unsigned 16-bit samples, i.e. one sample every
+    ``divider * 2**decimation`` cycles.
+
+    Samples are written to a ring buffer of ``size`` bytes at ``base``. The
+    ``half`` event fires when the first half has been filled and ``full``
+    when the second has and the core wraps around, so firmware can work on
+    one half while the other is written. ``overrun`` is set (until written
+    with ``1``) if a sample is dropped or an event fires while still
+    pending.
+    """
+    def __init__(self, pads, order=3, max_decimation=12, fifo_depth=16):
+        self.bus = bus = wishbone.Interface()
+
+        self._control = CSRStorage(fields=[
+            CSRField("enable",  size=1, offset=0, description="Run the modulator and write samples; clearing restarts at ``base``."),
+            CSRField("channel", size=4, offset=4, description="Analog input selected on the board's multiplexer."),
+        ])
+        self._divider    = CSRStorage(16, reset=4, description="Modulator sample period in ``sys_clk`` cycles.")
+        self._decimation = CSRStorage(4,  reset=8, description="Log2 of the decimation ratio, 1 to {}.".format(max_decimation))
+        self._base         = CSRStorage(32, description="Word-aligned address of the ring buffer.")
+        self._size         = CSRStorage(32, description="Ring buffer size in bytes, a multiple of 4.")
+        self._write_offset = CSRStatus(32,  description="Offset of the next sample the core will write.")
+        self._sample       = CSRStatus(16,  description="Latest sample.")
+        self._overrun      = CSR()
+
+        self.submodules.ev = EventManager()
+        self.ev.half = EventSourcePulse(description="The first half of the ring buffer has been written.")
+        self.ev.full = EventSourcePulse(description="The second half of the ring buffer has been written.")
+        self.ev.finalize()
+
+        # # #
+
+        enable     = self._control.fields.enable
+        divider    = self._divider.storage
+        decimation = self._decimation.storage
+
+        # Modulator.
+        ctrl     = Signal()
+        strobe   = Signal()
+        div      = Signal(16)
+        self.comb += strobe.eq(enable & (div == 0))
+        self.sync += [
+            If(~enable | (div == 0),
+                div.eq(divider - 1)
+            ).Else(
+                div.eq(div - 1)
+            ),
+            If(strobe, ctrl.eq(pads.sense))
+        ]
+        self.comb += pads.ctrl.eq(Replicate(ctrl, len(pads.ctrl)))
+        if hasattr(pads, "mux"):
+            self.comb += pads.mux.eq(self._control.fields.channel)
+        if hasattr(pads, "enable"):
+            self.comb += pads.enable.eq(enable)
+
+        # CIC decimator. Integrators run at the modulator rate, combs at the
+        # output rate; registering every stage only adds latency. The
+        # arithmetic wraps, which the combs undo.
+        width = order*max_decimation + 1
+        integrators = [Signal(width) for i in range(order)]
+        combs       = [Signal(width) for i in range(order)]
+        delays      = [Signal(width) for i in range(order)]
+        count       = Signal(max_decimation)
+        dec_strobe  = Signal()
+        last        = Signal()
+        self.comb += Case(decimation, {
+            k: last.eq(count == (2**k - 1)) for k in range(1, max_decimation + 1)})
+        self.comb += dec_strobe.eq(strobe & last)
+
+        inputs = [ctrl] + integrators[:-1]
+        self.sync += [
+            If(~enable,
+                count.eq(0),
+                *[i.eq(0) for i in integrators],
+                *[c.eq(0) for c in combs],
+                *[d.eq(0) for d in delays]
+            ).Elif(strobe,
+                count.eq(Mux(last, 0, count + 1)),
+                *[i.eq(i + x) for i, x in zip(integrators, inputs)],
+                If(last,
+                    *[[c.eq(x - d), d.eq(x)] for c, d, x in
+                        zip(combs, delays, [integrators[-1]] + combs[:-1])]
+                )
+            )
+        ]
+
+        # The CIC's output is 0 to 2**(order*decimation): scale it to 16 bits,
+        # saturating at full scale. The first outputs after enabling are
+        # partial sums and are dropped.
+        y       = combs[-1]
+        sample  = Signal(16)
+        valid   = Signal()
+        settle  = Signal(max=2*order + 1)
+        cases   = {}
+        for k in range(1, max_decimation + 1):
+            shift = order*k - 16
+            scaled = y >> shift if shift >= 0 else y << -shift
+            cases[k] = sample.eq(Mux(y[order*k], 0xffff, scaled))
+        self.comb += Case(decimation, cases)
+        self.sync += [
+            valid.eq(0),
+            If(~enable,
+                settle.eq(0)
+            ).Elif(dec_strobe,
+                If(settle == 2*order,
+                    valid.eq(1)
+                ).Else(
+                    settle.eq(settle + 1)
+                )
+            ),
+            If(valid, self._sample.status.eq(sample))
+        ]
+
+        # Ring buffer writer.
+        size         = self._size.storage
+        write_offset = Signal(32)
+        adr          = Signal(32)
+        overrun      = Signal()
+        set_overrun  = Signal()
+
+        self.submodules.fifo = fifo = stream.SyncFIFO([("data", 16)], fifo_depth)
+        self.comb += [
+            fifo.sink.valid.eq(valid),
+            fifo.sink.data.eq(sample),
+            adr.eq(self._base.storage + write_offset),
+            self._write_offset.status.eq(write_offset),
+            self._overrun.w.eq(overrun),
+        ]
+        self.sync += [
+            If(set_overrun,
+                overrun.eq(1)
+            ).Elif(self._overrun.re & self._overrun.r,
+                overrun.eq(0)
+            )
+        ]
+
+        half = Signal()
+        wrap = Signal()
+        self.comb += [
+            half.eq(write_offset == ((size >> 1) - 2)),
+            wrap.eq(write_offset == (size - 2)),
+            set_overrun.eq((valid & ~fifo.sink.ready) |
+                (self.ev.half.trigger & self.ev.half.pending) |
+                (self.ev.full.trigger & self.ev.full.pending)),
+        ]
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(~enable,
+                fifo.source.ready.eq(1),
+                NextValue(write_offset, 0)
+            ).Elif(fifo.source.valid,
+                NextState("WRITE")
+            )
+        )
+        fsm.act("WRITE",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.adr.eq(adr[2:]),
+            bus.sel.eq(Mux(adr[1], 0b1100, 0b0011)),
+            bus.dat_w.eq(Replicate(fifo.source.data, 2)),
+            If(bus.ack,
+                fifo.source.ready.eq(1),
+                self.ev.half.trigger.eq(half),
+                self.ev.full.trigger.eq(wrap),
+                If(wrap,
+                    NextValue(write_offset, 0)
+                ).Else(
+                    NextValue(write_offset, write_offset + 2)
+                ),
+                NextState("IDLE")
+            )
+        )
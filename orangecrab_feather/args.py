@@ -43,3 +43,97 @@ def soc_sdram_args(parser):
     # SDRAM
     parser.add_argument("--max-sdram-size", default=0x40000000, type=auto_int,
                         help="Maximum SDRAM size mapped to the SoC (default=1GB))")
+    # L2 cache
+    parser.add_argument("--l2-size", default=8192, type=auto_int,
+                        help="L2 cache size in bytes, 0 to disable (default=8192)")
+    parser.add_argument("--min-l2-data-width", default=128, type=auto_int,
+                        help="Minimum L2 cache data width in bits (default=128)")
+    parser.add_argument("--no-l2-reverse", action="store_true",
+                        help="Don't reverse the L2 cache's address bits")
+    # DDR PHY
+    parser.add_argument("--ddr-cmd-delay", default=None, type=auto_int,
+                        help="DDR PHY command delay in taps (default=0 above "
+                             "64MHz, 100 otherwise)")
+    parser.add_argument("--ddr-rtt-nom", default="disabled",
+                        choices=["disabled", "20ohm", "30ohm", "40ohm", "60ohm", "120ohm"],
+                        help="DDR3 nominal on-die termination (default=disabled)")
+
+
+def cache_args(parser):
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always run the gateware toolchain, even if an "
+                             "identical bitstream is cached")
+    parser.add_argument("--cache-dir", default=None,
+                        help="bitstream cache directory "
+                             "(default=~/.cache/orangecrab_feather/bitstreams)")
+    parser.add_argument("--cache-size", default=1024, type=auto_int,
+                        help="bitstream cache size limit in MB (default=1024)")
+
+
+# Optional parts of FeatherSoC. A profile is the set --with and --without
+# start from.
+PERIPHERALS = {
+    "usb":          "USB ACM console and USB PLL; without it the console "
+                    "is on the Feather serial pins",
+    "leds":         "LED chaser",
+    "feather_uart": "Feather UART",
+    "spi":          "Feather SPI",
+    "i2c":          "Feather I2C",
+    "sdcard":       "SD card (see --sdcard-mode)",
+    "adc":          "sigma-delta ADC (same as --adc)",
+    "gpio":         "GPIO core on the free Feather pins (same as --gpio)",
+    "perf":         "performance counters on the buses and the L2 cache",
+    "build_hash":   "design hash CSR, so --load-port can skip boards that "
+                    "already run the bitstream",
+}
+
+PROFILES = {
+    "full":    ["usb", "leds", "feather_uart", "spi", "i2c", "sdcard", "build_hash"],
+    "minimal": [],
+}
+
+
+def peripheral_args(parser):
+    parser.add_argument("--profile", default="full", choices=sorted(PROFILES),
+                        help="starting set of peripherals: full (default) or "
+                             "minimal (none; the console is on the Feather "
+                             "serial pins)")
+    parser.add_argument("--with", dest="with_peripherals", action="append", default=[],
+                        help="add peripherals (comma-separated, repeatable): "
+                             "{}".format(", ".join(PERIPHERALS)))
+    parser.add_argument("--without", dest="without_peripherals", action="append", default=[],
+                        help="remove peripherals (comma-separated, repeatable)")
+    parser.add_argument("--baseline-report", default=None,
+                        help="build_report.json of another build (e.g. the full "
+                             "profile) to report the resources saved against")
+
+
+# Matrix variants set these options to a plain string.
+def _peripheral_names(values):
+    if isinstance(values, str):
+        values = [values]
+    names = [n.strip() for v in values for n in v.split(",") if n.strip()]
+    for name in names:
+        if name not in PERIPHERALS:
+            raise ValueError("Unknown peripheral {} (one of: {})".format(
+                name, ", ".join(PERIPHERALS)))
+    return names
+
+
+def selected_peripherals(args):
+    selected = set(PROFILES[args.profile])
+    selected.update(_peripheral_names(args.with_peripherals))
+    if args.adc:
+        selected.add("adc")
+    if args.gpio:
+        selected.add("gpio")
+    selected.difference_update(_peripheral_names(args.without_peripherals))
+    return selected
+
+
+# Revision 0.1's platform only has the SD card's SPI-mode pins (spisdcard); the
+# 4-bit core needs the sdcard resource of revision 0.2.
+def check_peripherals(args, peripherals):
+    if "sdcard" in peripherals and args.sdcard_mode == "sd4" and args.revision != "0.2":
+        raise ValueError("--sdcard-mode sd4 needs the 4-bit SD card bus of revision "
+            "0.2; use --sdcard-mode spi or spi-dma on revision {}.".format(args.revision))
@@ -0,0 +1,96 @@
+import os
+import hashlib
+
+from migen import *
+
+from litex.soc.interconnect.csr import *
+
+from .cache import hash_design
+
+# Build Hash ---------------------------------------------------------------------------------------
+
+class BuildHash(Module, AutoCSR):
+    """64-bit hash of the design, readable by firmware and by the host.
+
+    A bitstream can't contain a hash of itself, so this is the hash of
+    everything that goes into it (see ``hash_design()``) except the ROM
+    holding the value. The ROM is elaborated with a placeholder that
+    ``write_build_hash()`` replaces once the design has been written out.
+    """
+    # "buildhsh", so the .init file can't be mistaken for another memory.
+    PLACEHOLDER = [0x6275696c, 0x64687368]
+
+    # The ROM is only read through the CSR; keep it out of the CSR map.
+    autocsr_exclude = {"mem"}
+
+    def __init__(self):
+        self._value = CSRStatus(64, description="Hash of the design this bitstream was built from.")
+
+        # # #
+
+        # Most significant word first.
+        self.mem = Memory(32, 2, init=self.PLACEHOLDER)
+        ports = [self.mem.get_port(async_read=True) for i in range(2)]
+        self.specials += self.mem, *ports
+        self.comb += [
+            ports[1].adr.eq(1),
+            self._value.status.eq(Cat(ports[1].dat_r, ports[0].dat_r)),
+        ]
+
+# Hash the design LiteX wrote to gateware_dir and store it in the build hash
+# ROM's .init file. Returns the hash, or None if the SoC has no build hash.
+# The bitstream only has it once it is rebuilt; see record_build_hash().
+def write_build_hash(soc, gateware_dir, build_name):
+    if not hasattr(soc, "build_hash"):
+        return None
+
+    h = hashlib.sha256()
+    hash_design(h, soc, gateware_dir, build_name)
+    value = int.from_bytes(h.digest()[:8], "big")
+
+    old = list(soc.build_hash.mem.init)
+    for name in sorted(os.listdir(gateware_dir)):
+        if not name.endswith(".init"):
+            continue
+        path = os.path.join(gateware_dir, name)
+        with open(path) as f:
+            contents = f.read()
+        try:
+            words = [int(w, 16) for w in contents.split()]
+        except ValueError:
+            continue
+        if words == old:
+            with open(path, "w") as f:
+                f.write("{:08x}\n{:08x}\n".format(value >> 32, value & 0xffffffff))
+            break
+    else:
+        raise OSError("Build hash ROM not found in {}.".format(gateware_dir))
+
+    soc.build_hash.mem.init = [value >> 32, value & 0xffffffff]
+    return value
+
+# <build_name>.hash holds the hash of the bitstream next to it. It is
+# removed before the toolchain runs and written once the bitstream has been
+# built (or restored from the cache), so it never describes a stale one.
+def clear_build_hash(gateware_dir, build_name):
+    path = os.path.join(gateware_dir, build_name + ".hash")
+    if os.path.exists(path):
+        os.remove(path)
+
+def record_build_hash(soc, gateware_dir, build_name):
+    if not hasattr(soc, "build_hash"):
+        return
+    init = list(soc.build_hash.mem.init)
+    if init == BuildHash.PLACEHOLDER:
+        return
+    with open(os.path.join(gateware_dir, build_name + ".hash"), "w") as f:
+        f.write("{:016x}\n".format((init[0] << 32) | init[1]))
+
+# The hash of the bitstream in gateware_dir, or None if it has none (e.g. it
+# was built by the Diamond flow, or not at all).
+def read_build_hash(gateware_dir, build_name):
+    try:
+        with open(os.path.join(gateware_dir, build_name + ".hash")) as f:
+            return int(f.read().strip(), 16)
+    except (OSError, ValueError):
+        return None
@@ -1,15 +1,78 @@
 import os
+import sys
+import json
+import shlex
+import subprocess
 
 from litex.soc.integration.builder import Builder
+from litex.soc.integration import export
+from litex.build.lattice.trellis import LatticeTrellisToolchain
 from .pac import *
+from .seeds import SeedSweep
+from .phases import BuildTimer, wait_process
+from .report import build_report, compare_reports, format_savings
+from .build_hash import write_build_hash, clear_build_hash, record_build_hash
+from .cache import soc_ident, write_ident, read_ident
+
+# Build phase names for the tools in the Trellis script.
+TOOL_PHASES = {
+    "yosys":        "synth",
+    "nextpnr-ecp5": "pnr",
+    "ecppack":      "pack",
+}
+
+# Run the toolchain script LiteX generated, keeping a copy of its output
+# (which includes the nextpnr timing summary) next to the bitstream.
+#
+# With a timer, the commands of a bash script are run one at a time so each
+# tool gets its own build phase.
+def run_toolchain_script(gateware_dir, build_name, timer=None):
+    if sys.platform in ("win32", "cygwin"):
+        cmds = [("toolchain", ["cmd", "/c", "build_" + build_name + ".bat"])]
+    elif timer is None:
+        cmds = [("toolchain", ["bash", "build_" + build_name + ".sh"])]
+    else:
+        cmds = []
+        with open(os.path.join(gateware_dir, "build_" + build_name + ".sh")) as f:
+            for line in f.read().splitlines():
+                if not line.strip() or line.startswith("#") or line.strip() == "set -e":
+                    continue
+                tool = shlex.split(line)[0]
+                cmds.append((TOOL_PHASES.get(tool, tool), ["bash", "-c", line]))
+
+    timer = timer or BuildTimer()
+    with open(os.path.join(gateware_dir, build_name + ".log"), "w") as log:
+        for phase, cmd in cmds:
+            with timer.phase(phase):
+                proc = subprocess.Popen(cmd, cwd=gateware_dir, stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT, universal_newlines=True)
+                for line in proc.stdout:
+                    sys.stdout.write(line)
+                    log.write(line)
+                if wait_process(proc, timer) != 0:
+                    raise OSError("Error occured during Trellis's script execution.")
 
 # Wrapper class to ensure that the Rust PAC is generated without erroring
 # because of missing directories and the like.
 class FeatherBuilder(Builder):
     def __init__(self, soc,
         generate_pac= True,
+        bitstream_cache= None,
+        seed_sweep= None,
+        seed_sweep_jobs= None,
+        seed_sweep_stop= False,
+        build_timer= None,
+        peripherals= None,
+        baseline_report= None,
         **kwargs):
         self.generate_pac = generate_pac
+        self.bitstream_cache = bitstream_cache
+        self.seed_sweep = seed_sweep
+        self.seed_sweep_jobs = seed_sweep_jobs
+        self.seed_sweep_stop = seed_sweep_stop
+        self.build_timer = build_timer or BuildTimer()
+        self.peripherals = peripherals
+        self.baseline_report = baseline_report
 
         Builder.__init__(self, soc, **kwargs)
 
@@ -21,17 +84,103 @@ class FeatherBuilder(Builder):
     # If a full software rebuild was requested, the rust_dir will be gone,
     # so recreate it. Right now, I don't expose most paths, so no csr_json
     # or csr_csv.
+    #
+    # The SVD is written by us rather than LiteX so an unchanged CSR map
+    # keeps its old mtime and doesn't force a PAC rebuild. LiteX's default
+    # SVD description contains the build time, so supply a fixed one.
     def _generate_csr_map(self):
         if self.generate_pac:
             os.makedirs(self.rust_dir, exist_ok=True)
 
+        csr_svd = self.csr_svd
+        self.csr_svd = None
         Builder._generate_csr_map(self)
+        self.csr_svd = csr_svd
+
+        if self.csr_svd is not None:
+            write_if_changed(os.path.realpath(self.csr_svd),
+                export.get_csr_svd(self.soc, description="FeatherSoC on OrangeCrab"))
+
+    # Only the trellis flow is cached; LiteX writes its files and we run the
+    # script ourselves unless the cache already has the outputs.
+    def _run_gateware_toolchain(self, **kwargs):
+        build_name = self.soc.build_name
+        cache = self.bitstream_cache
+
+        if cache is not None:
+            key = cache.key(self.soc, self.gateware_dir, build_name,
+                dict(kwargs, seed_sweep=self.seed_sweep))
+            with self.build_timer.phase("cache"):
+                hit = cache.restore(key, self.gateware_dir, build_name)
+            if hit:
+                print("Bitstream cache hit ({}), skipping gateware toolchain.".format(key[:16]))
+                # The identifier isn't part of the key, so the bitstream
+                # keeps the one (and the build date) it was built with.
+                ident = read_ident(self.gateware_dir, build_name)
+                if ident != soc_ident(self.soc):
+                    print("Warning: the cached bitstream identifies as \"{}\".".format(
+                        ident or "unknown (built before identifiers were cached)"))
+                return
+            print("Bitstream cache miss ({}).".format(key[:16]))
+
+        if self.seed_sweep:
+            first = kwargs.get("seed", 1)
+            with self.build_timer.phase("seed_sweep"):
+                SeedSweep(self.gateware_dir, build_name,
+                    seeds= range(first, first + self.seed_sweep),
+                    jobs= self.seed_sweep_jobs,
+                    stop_on_pass= self.seed_sweep_stop).run()
+        else:
+            run_toolchain_script(self.gateware_dir, build_name, self.build_timer)
+        write_ident(self.soc, self.gateware_dir, build_name)
+
+        if cache is not None:
+            with self.build_timer.phase("cache"):
+                cache.store(key, self.gateware_dir, build_name)
+
+    def _generate_rom_software(self, *args, **kwargs):
+        with self.build_timer.phase("software"):
+            Builder._generate_rom_software(self, *args, **kwargs)
+
+    def _write_build_report(self):
+        report = build_report(self.gateware_dir, self.soc.build_name, self.build_timer,
+            self.peripherals)
+        if self.baseline_report is not None:
+            with open(self.baseline_report) as f:
+                baseline = json.load(f)
+            report["baseline"] = {
+                "peripherals": baseline.get("peripherals"),
+                "saved":       compare_reports(report, baseline),
+            }
+            print("Saved over {}: {}".format(self.baseline_report,
+                format_savings(report["baseline"]["saved"])))
+        with open(os.path.join(self.output_dir, "build_report.json"), "w") as f:
+            json.dump(report, f, indent=4, sort_keys=True)
 
     # Once the main builder is done, add our Rust PAC if requested.
     def build(self, **kwargs):
         assert self.generate_pac
-        Builder.build(self, **kwargs)
+        run = kwargs.pop("run", self.compile_gateware)
+        # "generate" covers finalizing the SoC and writing Verilog and
+        # scripts; software compilation is its own phase.
+        if not isinstance(self.soc.platform.toolchain, LatticeTrellisToolchain):
+            with self.build_timer.phase("generate"):
+                vns = Builder.build(self, run=run, **kwargs)
+        else:
+            # The build hash is written before the cache key is computed,
+            # but depends only on the design, so the two stay consistent.
+            with self.build_timer.phase("generate"):
+                vns = Builder.build(self, run=False, **kwargs)
+                write_build_hash(self.soc, self.gateware_dir, self.soc.build_name)
+            if run:
+                clear_build_hash(self.gateware_dir, self.soc.build_name)
+                self._run_gateware_toolchain(**kwargs)
+                record_build_hash(self.soc, self.gateware_dir, self.soc.build_name)
 
         if self.generate_pac:
-            pac_builder = PacBuilder(self.soc, self)
-            pac_builder.generate()
+            with self.build_timer.phase("pac"):
+                pac_builder = PacBuilder(self.soc, self)
+                pac_builder.generate()
+
+        self._write_build_report()
+        return vns
@@ -0,0 +1,200 @@
+import os
+import re
+import shutil
+import hashlib
+import subprocess
+
+def _add(h, tag, data):
+    h.update(tag.encode())
+    h.update(len(data).to_bytes(8, "little"))
+    h.update(data)
+
+# Memory contents are written to .init files; recognize one by its words.
+def _is_init(contents, init):
+    if init is None:
+        return False
+    try:
+        words = [int(w, 16) for w in contents.split()]
+    except ValueError:
+        return False
+    return words == init
+
+# LiteX stamps the files it generates with the time they were written (the
+# Verilog's "Date" banner line and its trailer). Drop the times from
+# comment lines so regenerating an unchanged design hashes the same.
+_TIMESTAMP_RE = re.compile(rb"^(\s*(?://|#).*?)\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}",
+    re.MULTILINE)
+
+def _strip_timestamps(data):
+    return _TIMESTAMP_RE.sub(rb"\1", data)
+
+# Feed the elaborated design into hash object h: the generated Verilog plus
+# any extra sources such as the CPU core, the constraints and the toolchain
+# script. The Yosys script is left out on purpose: it contains absolute
+# source paths, which would defeat sharing a cache between checkouts; the
+# sources themselves are hashed by content.
+def hash_design(h, soc, gateware_dir, build_name):
+    skip = []
+    if hasattr(soc, "identifier"):
+        skip.append(list(soc.identifier.mem.init))
+    if hasattr(soc, "build_hash"):
+        skip.append(list(soc.build_hash.mem.init))
+
+    generated = [build_name + ext for ext in (".v", ".lpf")]
+    generated.append("build_" + build_name + ".sh")
+    for name in generated:
+        path = os.path.join(gateware_dir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                _add(h, name, _strip_timestamps(f.read()))
+
+    # Memory contents (BIOS ROM, etc.) live in separate .init files.
+    # The identifier ROM is skipped: with ident_version it contains the
+    # elaboration time, which would otherwise make every hash unique. A
+    # cached bitstream keeps the identifier of the build that made it (see
+    # write_ident()). The build hash ROM holds this very hash, so it is skipped too.
+    for name in sorted(os.listdir(gateware_dir)):
+        if not name.endswith(".init"):
+            continue
+        with open(os.path.join(gateware_dir, name), "rb") as f:
+            contents = f.read()
+        if any(_is_init(contents, init) for init in skip):
+            continue
+        _add(h, name, contents)
+
+    # Newer LiteX lists the generated Verilog among the sources too.
+    for filename, language, library in sorted(soc.platform.sources):
+        with open(filename, "rb") as f:
+            _add(h, os.path.basename(filename), _strip_timestamps(f.read()))
+
+# The identifier string the SoC's ROM holds, or None without one.
+def soc_ident(soc):
+    if not hasattr(soc, "identifier"):
+        return None
+    contents = list(soc.identifier.mem.init)
+    if 0 in contents:
+        contents = contents[:contents.index(0)]
+    return bytes(contents).decode(errors="replace")
+
+# <build_name>.ident holds the identifier in the bitstream next to it. It is
+# cached with the bitstream, so on a hit it names the build that made it,
+# which can differ from the identifier of the design just elaborated.
+def write_ident(soc, gateware_dir, build_name):
+    ident = soc_ident(soc)
+    if ident is None:
+        return
+    with open(os.path.join(gateware_dir, build_name + ".ident"), "w") as f:
+        f.write(ident + "\n")
+
+def read_ident(gateware_dir, build_name):
+    try:
+        with open(os.path.join(gateware_dir, build_name + ".ident")) as f:
+            return f.read().rstrip("\n")
+    except OSError:
+        return None
+
+# Content-addressed cache of gateware toolchain outputs. Entries are keyed on
+# everything that goes into Yosys/nextpnr/ecppack, so a hit means the
+# toolchain would produce the same bitstream and can be skipped entirely.
+class BitstreamCache:
+    # Extensions (relative to the build name) restored on a hit.
+    OUTPUTS = [".bit", ".svf", ".rpt", ".log", ".ident"]
+
+    TOOLS = {
+        "yosys":        ["yosys", "-V"],
+        "nextpnr-ecp5": ["nextpnr-ecp5", "--version"],
+        "ecppack":      ["ecppack", "--version"],
+    }
+
+    def __init__(self, cache_dir=None, max_size=1024*1024*1024):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.expanduser("~"), ".cache",
+                "orangecrab_feather", "bitstreams")
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+    @staticmethod
+    def tool_versions():
+        versions = {}
+        for name, cmd in BitstreamCache.TOOLS.items():
+            try:
+                out = subprocess.run(cmd, stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT, check=False).stdout
+                versions[name] = out.decode(errors="replace").strip()
+            except OSError:
+                versions[name] = "missing"
+        return versions
+
+    # Hash the elaborated design (see hash_design()), the toolchain args and
+    # the tool versions.
+    def key(self, soc, gateware_dir, build_name, toolchain_kwargs):
+        h = hashlib.sha256()
+        hash_design(h, soc, gateware_dir, build_name)
+        _add(h, "kwargs", repr(sorted(toolchain_kwargs.items())).encode())
+        _add(h, "tools", repr(sorted(self.tool_versions().items())).encode())
+        return h.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def restore(self, key, gateware_dir, build_name):
+        entry = self._entry(key)
+        if not os.path.isfile(os.path.join(entry, build_name + ".bit")):
+            return False
+
+        # Outputs an older entry lacks mustn't be left over from another
+        # build.
+        for ext in BitstreamCache.OUTPUTS:
+            src = os.path.join(entry, build_name + ext)
+            dst = os.path.join(gateware_dir, build_name + ext)
+            if os.path.exists(src):
+                shutil.copy2(src, dst)
+            elif os.path.exists(dst):
+                os.remove(dst)
+
+        # Mark as most recently used.
+        os.utime(entry)
+        return True
+
+    def store(self, key, gateware_dir, build_name):
+        entry = self._entry(key)
+        tmp = entry + ".tmp{}".format(os.getpid())
+        os.makedirs(tmp, exist_ok=True)
+
+        for ext in BitstreamCache.OUTPUTS:
+            src = os.path.join(gateware_dir, build_name + ext)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(tmp, build_name + ext))
+
+        # Another process may have stored the same key in the meantime;
+        # either copy is equally good.
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if not os.path.isdir(path) or ".tmp" in name:
+                continue
+            # Matrix builds share the cache, so entries can disappear
+            # under us.
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+            total += size
+
+        # Least recently used first.
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
@@ -15,6 +15,7 @@ from migen.genlib.misc import WaitTimer
 from migen.genlib.resetsync import AsyncResetSynchronizer
 
 from litex_boards.platforms import orangecrab
+from litex.build.generic_platform import *
 from litex.soc.integration.soc_core import *
 
 from litex.soc.cores.clock import *
@@ -27,6 +28,49 @@ from litex.soc.interconnect.csr_eventmanager import *
 from litedram.modules import MT41K64M16, MT41K128M16, MT41K256M16, MT41K512M16
 from litedram.phy import ECP5DDRPHY
 
+from .spi_dma import SPIDMA
+from .uart_dma import UARTRXDMA
+from .i2c_burst import I2CBurst
+from .adc import SigmaDeltaADC
+from .gpio import FeatherGPIO
+from .build_hash import BuildHash
+from .perf import PerfCounters, perf_counter_buses
+
+# Feather GPIOs -----------------------------------------------------------------------------------
+
+# The Feather header pins not taken by the serial, SPI and I2C extensions.
+# Revision 0.1 doesn't connect A0-A5 (GPIO:18 to GPIO:23).
+feather_gpio = {
+    "0.1": [
+        ("feather_gpio", 0,
+            Pins("GPIO:5 GPIO:6 GPIO:9 GPIO:10 GPIO:11 GPIO:12 GPIO:13"),
+            IOStandard("LVCMOS33")
+        ),
+    ],
+    "0.2": [
+        ("feather_gpio", 0,
+            Pins("GPIO:5 GPIO:6 GPIO:9 GPIO:10 GPIO:11 GPIO:12 GPIO:13 GPIO:18 GPIO:19 GPIO:20 GPIO:21 GPIO:22 GPIO:23"),
+            IOStandard("LVCMOS33")
+        ),
+    ],
+}
+
+# ADC ---------------------------------------------------------------------------------------------
+
+# Revision 0.2's analog front end: a multiplexer selects one of the analog
+# inputs, which is compared (by an LVDS input) against an RC network charged
+# from ctrl. Revision 0.1 has none.
+orangecrab_adc = {
+    "0.2": [
+        ("adc", 0,
+            Subsignal("mux",    Pins("F4 F3 F2 H1"), IOStandard("LVCMOS33")),
+            Subsignal("enable", Pins("F1"), IOStandard("LVCMOS33")),
+            Subsignal("ctrl",   Pins("G1"), IOStandard("LVCMOS33")),
+            Subsignal("sense",  Pins("H3"), IOStandard("LVDS")),
+        ),
+    ],
+}
+
 # CRG ---------------------------------------------------------------------------------------------
 
 class _CRG(Module):
@@ -146,28 +190,47 @@ class _CRGSDRAM(Module):
 
 # FeatherSoC ------------------------------------------------------------------------------------------
 
+# With ident_version, LiteX appends the build time.
+IDENT = "FeatherSoC on OrangeCrab (using LiteX)"
+
 class FeatherSoC(SoCCore):
     def __init__(self, revision="0.2", device="25F", sdram_device="MT41K64M16",
-                 sys_clk_freq=int(48e6), toolchain="trellis", **kwargs):
+                 sys_clk_freq=int(48e6), toolchain="trellis", spi_dma=False,
+                 feather_uart_baudrate=115200, feather_uart_tx_fifo_depth=16,
+                 feather_uart_rx_fifo_depth=16, feather_uart_rx_dma=False,
+                 i2c_burst=False, i2c_burst_dma=False, adc=False, gpio=False, ddr_cmd_delay=None, ddr_rtt_nom="disabled",
+                 with_usb=True, with_leds=True, with_feather_uart=True, with_spi=True, with_i2c=True,
+                 with_perf=False, with_build_hash=True, **kwargs):
         platform = orangecrab.Platform(revision=revision, device=device, toolchain=toolchain)
         platform.add_extension(orangecrab.feather_serial)
         platform.add_extension(orangecrab.feather_spi)
         platform.add_extension(orangecrab.feather_i2c)
+        platform.add_extension(feather_gpio[revision])
+        if adc:
+            if revision not in orangecrab_adc:
+                raise ValueError("The ADC needs the analog front end of revision {}; "
+                    "revision {} has none.".format(", ".join(orangecrab_adc), revision))
+            platform.add_extension(orangecrab_adc[revision])
 
         # Serial -----------------------------------------------------------------------------------
-        # Defaults to USB ACM through ValentyUSB.
-        sys.path.append("deps/valentyusb")
+        # Defaults to USB ACM through ValentyUSB. Without USB, the console
+        # takes over the Feather serial pins.
+        if with_usb:
+            sys.path.append("deps/valentyusb")
+        elif with_feather_uart:
+            raise ValueError("Without USB, the console uses the Feather serial pins; "
+                "the Feather UART can't be used too.")
 
         # SoCCore ----------------------------------------------------------------------------------
         SoCCore.__init__(self, platform, sys_clk_freq,
-            uart_name      = "usb_acm",
-            ident          = "FeatherSoC on OrangeCrab (using LiteX)",
+            uart_name      = "usb_acm" if with_usb else "serial",
+            ident          = IDENT,
             ident_version  = True,
             **kwargs)
 
         # CRG --------------------------------------------------------------------------------------
         crg_cls = _CRGSDRAM if not self.integrated_main_ram_size else _CRG
-        self.submodules.crg = crg_cls(platform, sys_clk_freq, True)
+        self.submodules.crg = crg_cls(platform, sys_clk_freq, with_usb_pll=with_usb)
 
         # DDR3 SDRAM -------------------------------------------------------------------------------
         if not self.integrated_main_ram_size:
@@ -183,9 +246,10 @@ class FeatherSoC(SoCCore):
             self.submodules.ddrphy = ECP5DDRPHY(
                 pads         = ddram_pads,
                 sys_clk_freq = sys_clk_freq,
-                cmd_delay    = 0 if sys_clk_freq > 64e6 else 100,
+                cmd_delay    = ddr_cmd_delay if ddr_cmd_delay is not None else
+                               (0 if sys_clk_freq > 64e6 else 100),
                 dm_remapping = {0:1, 1:0})
-            self.ddrphy.settings.rtt_nom = "disabled"
+            self.ddrphy.settings.rtt_nom = ddr_rtt_nom
             self.add_csr("ddrphy")
             if hasattr(ddram_pads, "vccio"):
                 self.comb += ddram_pads.vccio.eq(0b111111)
@@ -200,55 +264,175 @@ class FeatherSoC(SoCCore):
                 size                    = kwargs.get("max_sdram_size", 0x40000000),
                 l2_cache_size           = kwargs.get("l2_size", 8192),
                 l2_cache_min_data_width = kwargs.get("min_l2_data_width", 128),
-                l2_cache_reverse        = True
+                l2_cache_reverse        = kwargs.get("l2_reverse", True)
             )
 
-        # Leds -------------------------------------------------------------------------------------
-        self.submodules.leds = LedChaser(
-            pads         = platform.request_all("user_led"),
-            sys_clk_freq = sys_clk_freq)
-        self.add_csr("leds")
+        # Perf counters are added by finalize().
+        self.with_perf = with_perf
+
+        # Build hash -------------------------------------------------------------------------------
+        # Lets "--load" tell whether the board already runs this design.
+        if with_build_hash:
+            self.submodules.build_hash = BuildHash()
+            self.add_csr("build_hash")
 
-        # Feather Serial core
+        # Leds -------------------------------------------------------------------------------------
+        if with_leds:
+            self.submodules.leds = LedChaser(
+                pads         = platform.request_all("user_led"),
+                sys_clk_freq = sys_clk_freq)
+            self.add_csr("leds")
+
+        # Feather peripherals
+        if with_feather_uart:
+            self.add_feather_uart(platform.request("serial"),
+                baudrate      = feather_uart_baudrate,
+                tx_fifo_depth = feather_uart_tx_fifo_depth,
+                rx_fifo_depth = feather_uart_rx_fifo_depth,
+                rx_dma        = feather_uart_rx_dma)
+        if with_spi:
+            self.add_feather_spi(platform.request("spi"), dma=spi_dma)
+        if with_i2c:
+            self.add_feather_i2c(platform.request("i2c"), burst=i2c_burst, burst_dma=i2c_burst_dma)
+
+        # ADC --------------------------------------------------------------------------------------
+        if adc:
+            self.add_adc(platform.request("adc"))
+
+        # GPIO -------------------------------------------------------------------------------------
+        if gpio:
+            self.add_feather_gpio(platform.request("feather_gpio"))
+
+    # The perf counters watch every bus master and slave, so they are only
+    # added once everything else has been, but before SoC.finalize() builds
+    # the CSR map.
+    def finalize(self):
+        if not self.finalized and getattr(self, "with_perf", False) and not hasattr(self, "perf"):
+            self.add_perf_counters()
+        SoCCore.finalize(self)
+
+    # Performance counters on the Wishbone buses and the L2 cache
+    def add_perf_counters(self):
+        masters, slaves, l2_cache = perf_counter_buses(self)
+        self.submodules.perf = PerfCounters(masters, slaves, l2_cache)
+        self.csr.add("perf", use_loc_if_exists=True)
+
+    # The Feather peripherals take their pads as arguments so the simulation
+    # (see sim.py) can substitute its own.
+
+    # Feather Serial core
+    def add_feather_uart(self, pads, baudrate=115200, tx_fifo_depth=16, rx_fifo_depth=16, rx_dma=False):
         self.submodules.feather_uart_phy = UARTPHY(
-            pads     = self.platform.request("serial"),
+            pads     = pads,
             clk_freq = self.sys_clk_freq,
-            baudrate = 115200)
-        self.submodules.feather_uart = ResetInserter()(UART(self.feather_uart_phy,
-            tx_fifo_depth = 16,
-            rx_fifo_depth = 16))
+            baudrate = baudrate)
+        self.submodules.feather_uart = ResetInserter()(UART(
+            tx_fifo_depth = tx_fifo_depth,
+            rx_fifo_depth = rx_fifo_depth))
+        self.comb += self.feather_uart.source.connect(self.feather_uart_phy.sink)
 
         self.csr.add("feather_uart_phy", use_loc_if_exists=True)
         self.csr.add("feather_uart", use_loc_if_exists=True)
         self.irq.add("feather_uart", use_loc_if_exists=True)
 
-        # SPI core
-        self.submodules.spi = SPIMaster(
-            pads = None,
-            data_width = 8,
-            sys_clk_freq = self.sys_clk_freq,
-            spi_clk_freq = 12e6)
+        # With RX DMA, received bytes bypass the UART's RX FIFO and go straight to a ring buffer
+        # in memory.
+        if rx_dma:
+            self.submodules.feather_uart_rx_dma = UARTRXDMA(
+                fifo_depth = rx_fifo_depth)
+            self.comb += self.feather_uart_phy.source.connect(self.feather_uart_rx_dma.sink)
+            self.bus.add_master(name="feather_uart_rx_dma", master=self.feather_uart_rx_dma.bus)
+            self.csr.add("feather_uart_rx_dma", use_loc_if_exists=True)
+            self.irq.add("feather_uart_rx_dma", use_loc_if_exists=True)
+        else:
+            self.comb += self.feather_uart_phy.source.connect(self.feather_uart.sink)
+
+    # SPI core
+    def add_feather_spi(self, pads, dma=False):
+        if dma:
+            self.submodules.spi = SPIDMA(
+                pads = None,
+                sys_clk_freq = self.sys_clk_freq,
+                spi_clk_freq = 12e6)
+            self.bus.add_master(name="spi_dma", master=self.spi.bus)
+        else:
+            self.submodules.spi = SPIMaster(
+                pads = None,
+                data_width = 8,
+                sys_clk_freq = self.sys_clk_freq,
+                spi_clk_freq = 12e6)
 
-        spi_pads = platform.request("spi")
         self.comb += [
-            spi_pads.clk.eq(self.spi.pads.clk),
-            spi_pads.mosi.eq(self.spi.pads.mosi),
-            self.spi.pads.miso.eq(spi_pads.miso)
+            pads.clk.eq(self.spi.pads.clk),
+            pads.mosi.eq(self.spi.pads.mosi),
+            self.spi.pads.miso.eq(pads.miso)
         ]
 
         self.csr.add("spi", use_loc_if_exists=True)
 
-        self.spi.submodules.ev = EventManager()
-        self.spi.ev.eot = EventSourceProcess()
-        self.spi.ev.finalize()
-        self.comb += self.spi.ev.eot.trigger.eq(~self.spi.irq)
+        # SPIDMA has its own EventManager.
+        if not dma:
+            self.spi.submodules.ev = EventManager()
+            self.spi.ev.eot = EventSourceProcess()
+            self.spi.ev.finalize()
+            self.comb += self.spi.ev.eot.trigger.eq(~self.spi.irq)
 
         self.irq.add("spi", use_loc_if_exists=True)
 
-        # I2C core
+    # I2C core
+    def add_feather_i2c(self, pads, burst=False, burst_dma=False):
+        # The burst engine queues whole transactions; it replaces RTLI2C on
+        # the pins rather than sitting in front of it.
+        if burst or burst_dma:
+            self.submodules.i2c_burst = I2CBurst(pads, self.sys_clk_freq, with_dma=burst_dma)
+            if burst_dma:
+                self.bus.add_master(name="i2c_burst", master=self.i2c_burst.bus)
+            self.csr.add("i2c_burst", use_loc_if_exists=True)
+            self.irq.add("i2c_burst", use_loc_if_exists=True)
+            return
+
         sys.path.append("deps/gateware")
         from gateware.i2c.core import RTLI2C
 
-        self.submodules.betrusted_i2c = RTLI2C(platform, platform.request("i2c"))
+        self.submodules.betrusted_i2c = RTLI2C(self.platform, pads)
         self.csr.add("betrusted_i2c", use_loc_if_exists=True)
         self.irq.add("betrusted_i2c", use_loc_if_exists=True)
+
+    # GPIO core on the remaining Feather pins, with DMA capture and playback
+    def add_feather_gpio(self, pads):
+        self.submodules.gpio = FeatherGPIO(pads)
+        self.bus.add_master(name="gpio_capture",  master=self.gpio.capture_bus)
+        self.bus.add_master(name="gpio_playback", master=self.gpio.playback_bus)
+        self.csr.add("gpio", use_loc_if_exists=True)
+        self.irq.add("gpio", use_loc_if_exists=True)
+
+    # Sigma-delta ADC on the OrangeCrab's analog inputs, streaming to memory
+    def add_adc(self, pads):
+        self.submodules.adc = SigmaDeltaADC(pads)
+        self.bus.add_master(name="adc", master=self.adc.bus)
+        self.csr.add("adc", use_loc_if_exists=True)
+        self.irq.add("adc", use_loc_if_exists=True)
+
+    # Like SoC.add_spi_sdcard(), but with the DMA SPI engine. The BIOS only
+    # knows about LiteX's SPI SD card core, so use a different name to keep
+    # it from trying to drive this one.
+    def add_spi_sdcard_dma(self, name="spisdcard_dma", spi_clk_freq=400e3):
+        pads = self.platform.request("spisdcard")
+        if hasattr(pads, "rst"):
+            self.comb += pads.rst.eq(0)
+
+        spisdcard = SPIDMA(pads, self.sys_clk_freq, spi_clk_freq)
+        setattr(self.submodules, name, spisdcard)
+        self.csr.add(name, use_loc_if_exists=True)
+        self.irq.add(name, use_loc_if_exists=True)
+        self.bus.add_master(name=name, master=spisdcard.bus)
+
+    # Maps the OrangeCrab's SPI flash and points the BIOS' flashboot at the
+    # firmware partition the bootloader's DFU interface writes to (see
+    # "python -m orangecrab_feather firmware"). The flash is read in quad mode.
+    def add_spi_flash_boot(self, offset=0x100000):
+        from litespi.modules import W25Q128JV
+        from litespi.opcodes import SpiNorFlashOpCodes as Codes
+
+        self.add_spi_flash(mode="4x", module=W25Q128JV(Codes.READ_1_1_4), with_master=False)
+        self.add_constant("FLASH_BOOT_ADDRESS", self.bus.regions["spiflash"].origin + offset)
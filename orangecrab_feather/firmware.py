@@ -0,0 +1,129 @@
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+# Firmware Images ----------------------------------------------------------------------------------
+
+# The BIOS' flashboot expects the payload to be preceded by its length and
+# CRC32, both little-endian; it checks the CRC before copying the payload to
+# main RAM.
+def flash_image(data):
+    return struct.pack("<II", len(data), zlib.crc32(data)) + data
+
+def format_rate(size, seconds):
+    rate = size/seconds if seconds > 0 else float("inf")
+    for unit in ("B/s", "KiB/s", "MiB/s"):
+        if rate < 1024 or unit == "MiB/s":
+            return "{:.1f} {}".format(rate, unit)
+        rate /= 1024
+
+def report(what, size, seconds, crc, verified):
+    print("{}: {} bytes in {:.2f}s ({}), CRC32 {:08x}{}".format(
+        what, size, seconds, format_rate(size, seconds), crc,
+        {None: "", True: ", verified", False: ", VERIFY FAILED"}[verified]))
+
+# DFU ----------------------------------------------------------------------------------------------
+
+# Download data to a DFU alt setting and, with verify, upload it again to
+# compare. Returns the download time and whether the readback matched (None
+# without verify). device_args pick the device, e.g. ["-p", path] when
+# several are attached. With reset, the device is reset once done, which
+# starts a freshly loaded bitstream. With quiet, dfu-util's output is only
+# shown if it fails.
+def dfu_load(data, alt, dfu_util="dfu-util", verify=True, device_args=[], reset=False,
+    quiet=False):
+    def run(args):
+        cmd = [dfu_util] + device_args + ["-a", str(alt)] + args
+        if not quiet:
+            subprocess.run(cmd, check=True)
+            return
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            universal_newlines=True)
+        if proc.returncode != 0:
+            raise OSError("{} failed:\n{}".format(" ".join(cmd), proc.stdout))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_file = os.path.join(tmp, "data.bin")
+        with open(data_file, "wb") as f:
+            f.write(data)
+
+        start = time.monotonic()
+        run(["-D", data_file] + (["-R"] if reset and not verify else []))
+        elapsed = time.monotonic() - start
+
+        verified = None
+        if verify:
+            readback_file = os.path.join(tmp, "readback.bin")
+            run(["-U", readback_file, "-Z", str(len(data))] + (["-R"] if reset else []))
+            with open(readback_file, "rb") as f:
+                verified = f.read(len(data)) == data
+
+    return elapsed, verified
+
+# SPI Flash ----------------------------------------------------------------------------------------
+
+# Writes through the OrangeCrab bootloader's DFU interface. Alt setting 1 is
+# the firmware partition at 0x100000 of the SPI flash, which the SoC maps at
+# FLASH_BOOT_ADDRESS when built with --flash-boot.
+def load_flash(filename, alt=1, dfu_util="dfu-util", verify=True):
+    with open(filename, "rb") as f:
+        data = f.read()
+    image = flash_image(data)
+
+    elapsed, verified = dfu_load(image, alt, dfu_util, verify)
+    report("SPI flash", len(image), elapsed, zlib.crc32(data), verified)
+    return verified is not False
+
+# SD Card ------------------------------------------------------------------------------------------
+
+# The BIOS' sdcardboot loads boot.bin from the first FAT partition into main
+# RAM. It doesn't check a CRC, so compare what actually landed on the card.
+def load_sdcard(filename, mountpoint, verify=True):
+    dest = os.path.join(mountpoint, "boot.bin")
+    with open(filename, "rb") as f:
+        data = f.read()
+    crc = zlib.crc32(data)
+
+    start = time.monotonic()
+    with open(dest, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    elapsed = time.monotonic() - start
+
+    verified = None
+    if verify:
+        with open(dest, "rb") as f:
+            # Drop the cached copy so the data is read back from the card.
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            verified = zlib.crc32(f.read()) == crc
+
+    report("SD card", len(data), elapsed, crc, verified)
+    return verified is not False
+
+# Command Line -------------------------------------------------------------------------------------
+
+def firmware_args(subparsers):
+    parser = subparsers.add_parser("firmware", help="Load firmware into SPI flash or onto the SD card")
+    parser.add_argument("filename",                                help="Firmware binary")
+    parser.add_argument("--sdcard",    default=None,               help="Copy to boot.bin on the SD card mounted here instead of SPI flash")
+    parser.add_argument("--alt",       default=1, type=int,        help="DFU alt setting of the firmware partition (default: 1)")
+    parser.add_argument("--dfu-util",  default="dfu-util",         help="dfu-util executable")
+    parser.add_argument("--no-verify", action="store_true",        help="Skip reading the firmware back")
+    parser.set_defaults(func=load_firmware)
+
+def load_firmware(args):
+    if args.sdcard:
+        ok = load_sdcard(args.filename, args.sdcard, verify=not args.no_verify)
+    else:
+        if not shutil.which(args.dfu_util):
+            raise OSError("{} not found.".format(args.dfu_util))
+        ok = load_flash(args.filename, args.alt, args.dfu_util, verify=not args.no_verify)
+    if not ok:
+        sys.exit(1)
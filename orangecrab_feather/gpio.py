@@ -0,0 +1,375 @@
+from migen import *
+from migen.genlib.cdc import MultiReg
+from migen.fhdl.specials import Tristate
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.csr_eventmanager import *
+
+# Feather GPIO -------------------------------------------------------------------------------------
+
+class FeatherGPIO(Module, AutoCSR):
+    """Tristate GPIOs with edge interrupts, streaming capture and pattern playback.
+
+    ``oe``, ``out``, ``in``, ``mode`` and ``edge`` work like LiteX's
+    ``GPIOTristate``: each pin raises its ``i<n>`` event on the selected edge,
+    or on any change.
+
+    Capture (a logic analyzer) samples all pins every ``capture_divider``
+    cycles once the trigger matches: ``(in ^ capture_trigger_value) &
+    capture_trigger_mask == 0``, or, with ``trigger_edge``, when that becomes
+    true. ``capture_length`` 16-bit samples are then written to
+    ``capture_base``, two per word. At high sample rates memory may not keep
+    up: once the FIFO overflows, the capture ends early with ``overflow`` set
+    and ``capture_count`` samples written.
+
+    Playback reads ``playback_length`` samples from ``playback_base`` (same
+    layout) and drives them on the pins every ``playback_divider`` cycles,
+    once or in a ``loop``; only pins with ``oe`` set are driven. Output
+    starts once the FIFO is full, so patterns that fit in it play at any
+    rate; longer ones need memory to keep up, or ``underrun`` is set and the
+    previous sample held.
+
+    The ``capture`` and ``playback`` events fire when those end.
+    """
+    def __init__(self, pads, capture_depth=512, playback_depth=256):
+        nbits = len(pads)
+        assert nbits <= 16
+        self.capture_bus  = wishbone.Interface()
+        self.playback_bus = wishbone.Interface()
+
+        self._oe   = CSRStorage(nbits, description="Output enables.")
+        self._out  = CSRStorage(nbits, description="Outputs; replaced by the pattern while one plays.")
+        self._in   = CSRStatus(nbits,  description="Inputs.")
+        self._mode = CSRStorage(nbits, description="IRQ mode: ``0``: edge, ``1``: change.")
+        self._edge = CSRStorage(nbits, description="IRQ edge in edge mode: ``0``: rising, ``1``: falling.")
+
+        self._capture_control = CSRStorage(fields=[
+            CSRField("start",        size=1, offset=0, pulse=True, description="Write ``1`` to arm the trigger."),
+            CSRField("stop",         size=1, offset=1, pulse=True, description="Write ``1`` to end the capture."),
+            CSRField("trigger_edge", size=1, offset=2, description="Trigger when the condition becomes true rather than while it is."),
+        ])
+        self._capture_divider       = CSRStorage(16, reset=1, description="Sample period in ``sys_clk`` cycles.")
+        self._capture_trigger_mask  = CSRStorage(nbits, description="Pins the trigger looks at; ``0`` triggers at once.")
+        self._capture_trigger_value = CSRStorage(nbits, description="Values the trigger waits for.")
+        self._capture_base          = CSRStorage(32, description="Word-aligned address of the capture buffer.")
+        self._capture_length        = CSRStorage(32, description="Number of samples to capture.")
+        self._capture_count         = CSRStatus(32,  description="Number of samples captured.")
+        self._capture_status        = CSRStatus(fields=[
+            CSRField("armed",    size=1, offset=0, description="Waiting for the trigger."),
+            CSRField("running",  size=1, offset=1, description="Triggered and sampling."),
+            CSRField("overflow", size=1, offset=2, description="The capture ended early because memory didn't keep up."),
+        ])
+
+        self._playback_control = CSRStorage(fields=[
+            CSRField("start", size=1, offset=0, pulse=True, description="Write ``1`` to play the pattern."),
+            CSRField("stop",  size=1, offset=1, pulse=True, description="Write ``1`` to stop playing."),
+            CSRField("loop",  size=1, offset=2, description="Repeat the pattern until stopped."),
+        ])
+        self._playback_divider = CSRStorage(16, reset=1, description="Sample period in ``sys_clk`` cycles.")
+        self._playback_base    = CSRStorage(32, description="Word-aligned address of the pattern.")
+        self._playback_length  = CSRStorage(32, description="Number of samples in the pattern.")
+        self._playback_status  = CSRStatus(fields=[
+            CSRField("busy",     size=1, offset=0, description="The pattern is being loaded or played."),
+            CSRField("underrun", size=1, offset=1, description="A sample was late and the previous one was held."),
+        ])
+
+        self.submodules.ev = EventManager()
+        for n in range(nbits):
+            setattr(self.ev, "i{}".format(n), EventSourcePulse())
+        self.ev.capture  = EventSourcePulse(description="A capture ended.")
+        self.ev.playback = EventSourcePulse(description="A pattern ended or was stopped.")
+        self.ev.finalize()
+
+        # # #
+
+        # Pins.
+        self.o  = o  = Signal(nbits)
+        self.i  = i  = Signal(nbits)
+        inputs = Signal(nbits)
+        for n in range(nbits):
+            self.specials += Tristate(pads[n], o[n], self._oe.storage[n], i[n])
+        self.specials += MultiReg(i, inputs)
+        self.comb += self._in.status.eq(inputs)
+
+        # Edge interrupts.
+        inputs_d = Signal(nbits)
+        self.sync += inputs_d.eq(inputs)
+        for n in range(nbits):
+            rising  = inputs[n] & ~inputs_d[n]
+            falling = ~inputs[n] & inputs_d[n]
+            self.comb += getattr(self.ev, "i{}".format(n)).trigger.eq(
+                Mux(self._mode.storage[n], rising | falling,
+                    Mux(self._edge.storage[n], falling, rising)))
+
+        self.add_capture(inputs, capture_depth)
+        self.add_playback(o, playback_depth)
+
+    def add_capture(self, inputs, depth):
+        bus     = self.capture_bus
+        control = self._capture_control.fields
+        length  = self._capture_length.storage
+
+        armed    = Signal()
+        running  = Signal()
+        overflow = Signal()
+        active   = Signal()
+        count    = Signal(32)
+        tick     = Signal()
+        div      = Signal(16)
+        match    = Signal()
+        match_d  = Signal()
+        fire     = Signal()
+        sample   = Signal()
+
+        self.comb += [
+            self._capture_count.status.eq(count),
+            self._capture_status.fields.armed.eq(armed),
+            self._capture_status.fields.running.eq(running),
+            self._capture_status.fields.overflow.eq(overflow),
+        ]
+
+        # Sample clock; restarts with each capture so the trigger sample is
+        # the first one.
+        self.comb += tick.eq(div == 0)
+        self.sync += [
+            If(control.start | tick,
+                div.eq(self._capture_divider.storage - 1)
+            ).Else(
+                div.eq(div - 1)
+            )
+        ]
+
+        self.comb += [
+            match.eq(((inputs ^ self._capture_trigger_value.storage) &
+                self._capture_trigger_mask.storage) == 0),
+            fire.eq(armed & tick & match & (~control.trigger_edge | ~match_d)),
+            sample.eq((fire | running) & tick),
+        ]
+
+        # Pack two samples per word, first one in the low half.
+        self.submodules.capture_fifo = fifo = ResetInserter()(
+            stream.SyncFIFO([("data", 32)], depth, buffered=True))
+        low      = Signal(16)
+        have_low = Signal()
+        last     = Signal()
+        self.comb += [
+            fifo.reset.eq(control.start),
+            last.eq(count == (length - 1)),
+            If(sample & (have_low | last),
+                fifo.sink.valid.eq(1),
+                fifo.sink.data.eq(Mux(have_low, Cat(low, inputs), inputs))
+            )
+        ]
+        self.sync += [
+            If(armed & tick, match_d.eq(match)),
+            If(control.start,
+                armed.eq(length != 0),
+                running.eq(0),
+                overflow.eq(0),
+                active.eq(length != 0),
+                count.eq(0),
+                have_low.eq(0),
+                match_d.eq(1)
+            ).Elif(control.stop,
+                armed.eq(0),
+                running.eq(0)
+            ).Elif(sample,
+                armed.eq(0),
+                running.eq(~last),
+                If(fifo.sink.valid & ~fifo.sink.ready,
+                    # The held low half is lost too.
+                    running.eq(0),
+                    overflow.eq(1),
+                    count.eq(count - have_low)
+                ).Else(
+                    count.eq(count + 1),
+                    have_low.eq(~have_low & ~last),
+                    low.eq(inputs)
+                )
+            )
+        ]
+
+        # Writer.
+        word = Signal(30)
+        adr  = Signal(32)
+        self.comb += adr.eq(self._capture_base.storage + (word << 2))
+        self.submodules.capture_fsm = fsm = FSM(reset_state="IDLE")
+        self.sync += [
+            If(control.start,
+                word.eq(0)
+            ).Elif(fsm.ongoing("WRITE") & bus.ack,
+                word.eq(word + 1)
+            )
+        ]
+        fsm.act("IDLE",
+            If(fifo.source.valid & ~control.start,
+                NextState("WRITE")
+            )
+        )
+        fsm.act("WRITE",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.adr.eq(adr[2:]),
+            bus.sel.eq(0xf),
+            bus.dat_w.eq(fifo.source.data),
+            If(bus.ack,
+                fifo.source.ready.eq(1),
+                NextState("IDLE")
+            )
+        )
+
+        # Done once sampling has stopped and everything is in memory.
+        done = Signal()
+        self.comb += [
+            done.eq(active & ~armed & ~running & ~fifo.source.valid & fsm.ongoing("IDLE")),
+            self.ev.capture.trigger.eq(done),
+        ]
+        self.sync += If(done, active.eq(0))
+
+    def add_playback(self, o, depth):
+        bus     = self.playback_bus
+        control = self._playback_control.fields
+        length  = self._playback_length.storage
+        words   = Signal(32)
+        self.comb += words.eq((length + 1) >> 1)
+
+        fetching = Signal()
+        primed   = Signal()
+        playing  = Signal()
+        underrun = Signal()
+        stopped  = Signal()
+
+        self.comb += [
+            self._playback_status.fields.busy.eq(fetching | playing),
+            self._playback_status.fields.underrun.eq(underrun),
+        ]
+
+        # Reader.
+        self.submodules.playback_fifo = fifo = ResetInserter()(
+            stream.SyncFIFO([("data", 32)], depth, buffered=True))
+        index   = Signal(32)
+        adr     = Signal(32)
+        fetched = Signal()
+        stale   = Signal()
+        self.comb += [
+            fifo.reset.eq(control.start | control.stop | stopped),
+            fifo.sink.valid.eq(fetched),
+            fifo.sink.data.eq(bus.dat_r),
+            adr.eq(self._playback_base.storage + (index << 2)),
+        ]
+        self.sync += [
+            If(control.start,
+                fetching.eq(length != 0),
+                index.eq(0)
+            ).Elif(control.stop | stopped,
+                fetching.eq(0)
+            ).Elif(fetched,
+                If(index == (words - 1),
+                    index.eq(0),
+                    fetching.eq(control.loop)
+                ).Else(
+                    index.eq(index + 1)
+                )
+            )
+        ]
+
+        # A read in flight when playback is started or stopped belongs to
+        # the previous pattern.
+        self.submodules.playback_fsm = fsm = FSM(reset_state="IDLE")
+        self.sync += [
+            If(~fsm.ongoing("READ"),
+                stale.eq(0)
+            ).Elif(control.start | control.stop,
+                stale.eq(1)
+            )
+        ]
+        fsm.act("IDLE",
+            If(fetching & ~control.start & ~control.stop & fifo.sink.ready,
+                NextState("READ")
+            )
+        )
+        fsm.act("READ",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.adr.eq(adr[2:]),
+            bus.sel.eq(0xf),
+            If(bus.ack,
+                fetched.eq(fetching & ~stale & ~control.start & ~control.stop),
+                # Keep reading while there is room for the next word too.
+                If(~fetched | (fifo.level >= (depth - 1)) |
+                   ((index == (words - 1)) & ~control.loop),
+                    NextState("IDLE")
+                )
+            )
+        )
+
+        # Output. Starts once the FIFO is full or the whole pattern is in it;
+        # the pins follow the pattern from its first sample until one sample
+        # period after its last.
+        tick    = Signal()
+        div     = Signal(16)
+        count   = Signal(32)
+        cur     = Signal(32)
+        high    = Signal()
+        value   = Signal(len(o))
+        driving = Signal()
+        ending  = Signal()
+        self.comb += [
+            primed.eq(~fifo.sink.ready | (~fetching & fifo.source.valid)),
+            tick.eq(playing & (div == 0)),
+            o.eq(Mux(driving, value, self._out.storage)),
+            self.ev.playback.trigger.eq(stopped),
+        ]
+        self.sync += [
+            If(~playing | (div == 0),
+                div.eq(self._playback_divider.storage - 1)
+            ).Else(
+                div.eq(div - 1)
+            ),
+            stopped.eq(0),
+            If(control.start,
+                playing.eq(0),
+                driving.eq(0),
+                ending.eq(0),
+                underrun.eq(0),
+                count.eq(0),
+                high.eq(0)
+            ).Elif(control.stop,
+                playing.eq(0),
+                driving.eq(0),
+                stopped.eq(playing | fetching)
+            ).Elif(~playing,
+                If(primed & (length != 0), playing.eq(1))
+            ).Elif(tick,
+                If(ending,
+                    playing.eq(0),
+                    driving.eq(0),
+                    ending.eq(0),
+                    stopped.eq(1)
+                ).Elif(high,
+                    value.eq(cur[16:]),
+                    high.eq(0)
+                ).Elif(fifo.source.valid,
+                    value.eq(fifo.source.data[:16]),
+                    cur.eq(fifo.source.data),
+                    high.eq(1),
+                    driving.eq(1)
+                ).Else(
+                    underrun.eq(1)
+                ),
+                If(~ending & (high | fifo.source.valid),
+                    If(count == (length - 1),
+                        count.eq(0),
+                        # An odd pattern leaves half a word behind.
+                        high.eq(0),
+                        ending.eq(~control.loop)
+                    ).Else(
+                        count.eq(count + 1)
+                    )
+                )
+            )
+        ]
+        self.comb += fifo.source.ready.eq(tick & ~high & ~ending)
@@ -0,0 +1,1408 @@
+from string import Template
+
+from .ral import collect_peripherals
+
+# Generate litex-hal, a crate of async, interrupt-driven drivers on top of
+# litex-pac, plus the little runtime they need: a block_on() executor and
+# the machine external interrupt handler that dispatches to the drivers.
+#
+# A driver is generated for each peripheral that has an IRQ and whose
+# registers match a core we know (LiteX's Timer, UART and SPIMaster, our
+# SPIDMA and UARTRXDMA, and the OpenCores-style RTLI2C). Bit positions are
+# taken from the CSR map, so the drivers follow the gateware. Each driver
+# module is named after its peripheral, like the PAC's modules.
+
+CARGO_TOML = """[package]
+name = "litex-hal"
+version = "0.1.0"
+edition = "2018"
+
+[dependencies]
+litex-pac = { path = "../litex-pac" }
+$cpu_crate = "$cpu_crate_version"
+"""
+
+LIB_RS = """#![no_std]
+//! Async drivers for the peripherals of the SoC
+//!
+//! Take a peripheral from `pac`, hand it to its driver's `new()`, call
+//! `interrupt::init()` and run the driver futures with
+//! `executor::block_on()`.
+
+pub use litex_pac as pac;
+
+pub mod cache;
+pub mod executor;
+pub mod interrupt;
+
+$driver_mods
+/// System clock frequency in Hz
+pub const SYS_CLK_FREQ: u32 = $sys_clk_freq;
+
+// EV_ENABLE is also written from interrupt handlers, so read-modify-write
+// it with interrupts off.
+pub(crate) fn set_bits(reg: &pac::RWRegister<u32>, mask: u32) {
+    riscv::interrupt::free(|_| reg.write(reg.read() | mask));
+}
+
+pub(crate) fn clear_bits(reg: &pac::RWRegister<u32>, mask: u32) {
+    riscv::interrupt::free(|_| reg.write(reg.read() & !mask));
+}
+"""
+
+EXECUTOR_RS = """//! Minimal executor
+//!
+//! `block_on()` polls a single future until it completes, sleeping in `wfi`
+//! while nothing has woken it. All wakers set the same flag, so run several
+//! drivers at once by combining their futures with `join()`.
+
+use core::cell::UnsafeCell;
+use core::future::Future;
+use core::pin::Pin;
+use core::ptr;
+use core::sync::atomic::{AtomicBool, Ordering};
+use core::task::{Context, Poll, RawWaker, RawWakerVTable, Waker};
+
+// Only loads and stores: RV32 CPUs without the A extension have no
+// atomic read-modify-write.
+static WOKEN: AtomicBool = AtomicBool::new(true);
+
+static VTABLE: RawWakerVTable = RawWakerVTable::new(waker_clone, waker_wake, waker_wake, waker_drop);
+
+unsafe fn waker_clone(_: *const ()) -> RawWaker {
+    RawWaker::new(ptr::null(), &VTABLE)
+}
+
+unsafe fn waker_wake(_: *const ()) {
+    WOKEN.store(true, Ordering::Release);
+}
+
+unsafe fn waker_drop(_: *const ()) {}
+
+/// Run `future` to completion
+pub fn block_on<F: Future>(future: F) -> F::Output {
+    let waker = unsafe { Waker::from_raw(RawWaker::new(ptr::null(), &VTABLE)) };
+    let mut cx = Context::from_waker(&waker);
+    let mut future = future;
+    let mut future = unsafe { Pin::new_unchecked(&mut future) };
+
+    WOKEN.store(true, Ordering::Release);
+    loop {
+        if WOKEN.load(Ordering::Acquire) {
+            // A wake-up between the load and the store is not lost: the
+            // poll below sees whatever caused it.
+            WOKEN.store(false, Ordering::Release);
+            if let Poll::Ready(output) = future.as_mut().poll(&mut cx) {
+                return output;
+            }
+        } else {
+            crate::interrupt::wait(&WOKEN);
+        }
+    }
+}
+
+/// Holds the waker of the task waiting on a peripheral
+pub struct WakerCell(UnsafeCell<Option<Waker>>);
+
+unsafe impl Sync for WakerCell {}
+
+impl WakerCell {
+    pub const fn new() -> Self {
+        WakerCell(UnsafeCell::new(None))
+    }
+
+    pub fn register(&self, waker: &Waker) {
+        riscv::interrupt::free(|_| {
+            let slot = unsafe { &mut *self.0.get() };
+            match slot {
+                Some(w) if w.will_wake(waker) => {}
+                _ => *slot = Some(waker.clone()),
+            }
+        });
+    }
+
+    pub fn wake(&self) {
+        let waker = riscv::interrupt::free(|_| unsafe { (*self.0.get()).take() });
+        if let Some(waker) = waker {
+            waker.wake();
+        }
+    }
+}
+
+/// Future that calls `f` each time it is polled
+pub fn poll_fn<T, F: FnMut(&mut Context<'_>) -> Poll<T>>(f: F) -> PollFn<F> {
+    PollFn { f }
+}
+
+pub struct PollFn<F> {
+    f: F,
+}
+
+impl<F> Unpin for PollFn<F> {}
+
+impl<T, F: FnMut(&mut Context<'_>) -> Poll<T>> Future for PollFn<F> {
+    type Output = T;
+
+    fn poll(mut self: Pin<&mut Self>, cx: &mut Context<'_>) -> Poll<T> {
+        (self.f)(cx)
+    }
+}
+
+/// Let the other futures of a `join()` run
+pub async fn yield_now() {
+    let mut yielded = false;
+    poll_fn(|cx| {
+        if yielded {
+            return Poll::Ready(());
+        }
+        yielded = true;
+        cx.waker().wake_by_ref();
+        Poll::Pending
+    })
+    .await
+}
+
+enum MaybeDone<F: Future> {
+    Pending(F),
+    Done(F::Output),
+    Taken,
+}
+
+impl<F: Future> MaybeDone<F> {
+    // Returns true once the future has completed.
+    fn poll(self: Pin<&mut Self>, cx: &mut Context<'_>) -> bool {
+        let this = unsafe { self.get_unchecked_mut() };
+        if let MaybeDone::Pending(future) = this {
+            match unsafe { Pin::new_unchecked(future) }.poll(cx) {
+                Poll::Ready(output) => *this = MaybeDone::Done(output),
+                Poll::Pending => return false,
+            }
+        }
+        true
+    }
+
+    fn take(self: Pin<&mut Self>) -> F::Output {
+        let this = unsafe { self.get_unchecked_mut() };
+        match core::mem::replace(this, MaybeDone::Taken) {
+            MaybeDone::Done(output) => output,
+            _ => panic!("MaybeDone polled after completion"),
+        }
+    }
+}
+
+/// Run two futures concurrently
+pub fn join<A: Future, B: Future>(a: A, b: B) -> Join<A, B> {
+    Join {
+        a: MaybeDone::Pending(a),
+        b: MaybeDone::Pending(b),
+    }
+}
+
+pub struct Join<A: Future, B: Future> {
+    a: MaybeDone<A>,
+    b: MaybeDone<B>,
+}
+
+impl<A: Future, B: Future> Future for Join<A, B> {
+    type Output = (A::Output, B::Output);
+
+    fn poll(self: Pin<&mut Self>, cx: &mut Context<'_>) -> Poll<Self::Output> {
+        let this = unsafe { self.get_unchecked_mut() };
+        let mut a = unsafe { Pin::new_unchecked(&mut this.a) };
+        let mut b = unsafe { Pin::new_unchecked(&mut this.b) };
+        let a_done = a.as_mut().poll(cx);
+        let b_done = b.as_mut().poll(cx);
+        if a_done && b_done {
+            Poll::Ready((a.take(), b.take()))
+        } else {
+            Poll::Pending
+        }
+    }
+}
+"""
+
+# Interrupt controllers ----------------------------------------------------------------------------
+
+# VexRiscv and Minerva mask and report their external IRQ lines in custom
+# CSRs.
+INTERRUPT_CSR_RS = """//! External interrupts ($cpu_type: IRQ mask and pending CSRs)
+
+use core::arch::asm;
+use core::sync::atomic::{AtomicBool, Ordering};
+
+use riscv::register::{mie, mstatus};
+
+/// Whether drivers are interrupt-driven; if not, the executor polls them.
+pub const HAS_INTERRUPTS: bool = true;
+
+#[inline(always)]
+fn mask() -> u32 {
+    let mask: u32;
+    unsafe { asm!("csrr {0}, $mask_csr", out(reg) mask) };
+    mask
+}
+
+#[inline(always)]
+fn set_mask(mask: u32) {
+    unsafe { asm!("csrw $mask_csr, {0}", in(reg) mask) };
+}
+
+#[inline(always)]
+fn pending() -> u32 {
+    let pending: u32;
+    unsafe { asm!("csrr {0}, $pending_csr", out(reg) pending) };
+    pending
+}
+
+/// Unmask IRQ line `irq`
+pub fn enable(irq: u32) {
+    riscv::interrupt::free(|_| set_mask(mask() | (1 << irq)));
+}
+
+/// Mask IRQ line `irq`
+pub fn disable(irq: u32) {
+    riscv::interrupt::free(|_| set_mask(mask() & !(1 << irq)));
+}
+
+/// Turn on external interrupts
+pub fn init() {
+    unsafe {
+        mie::set_mext();
+        mstatus::set_mie();
+    }
+}
+
+// Sleep until an interrupt unless `woken` is already set. Checking with
+// interrupts off closes the window between the check and the wfi; a
+// pending interrupt still ends the wfi.
+pub(crate) fn wait(woken: &AtomicBool) {
+    unsafe {
+        mstatus::clear_mie();
+        if !woken.load(Ordering::Acquire) {
+            riscv::asm::wfi();
+        }
+        mstatus::set_mie();
+    }
+}
+
+#[no_mangle]
+pub extern "C" fn MachineExternal() {
+    let pending = pending() & mask();
+$dispatch}
+"""
+
+# VexRiscv-SMP has a PLIC; LiteX wires IRQ n to PLIC source n.
+INTERRUPT_PLIC_RS = """//! External interrupts ($cpu_type: PLIC)
+
+use core::ptr::{read_volatile, write_volatile};
+use core::sync::atomic::{AtomicBool, Ordering};
+
+use riscv::register::{mie, mstatus};
+
+/// Whether drivers are interrupt-driven; if not, the executor polls them.
+pub const HAS_INTERRUPTS: bool = true;
+
+const PLIC_PRIORITY: *mut u32 = 0x$priority as *mut u32;
+const PLIC_ENABLED: *mut u32 = 0x$enabled as *mut u32;
+const PLIC_THRESHOLD: *mut u32 = 0x$threshold as *mut u32;
+const PLIC_CLAIM: *mut u32 = 0x$claim as *mut u32;
+
+/// Unmask IRQ line `irq`
+pub fn enable(irq: u32) {
+    riscv::interrupt::free(|_| unsafe {
+        write_volatile(PLIC_PRIORITY.add(irq as usize), 1);
+        write_volatile(PLIC_ENABLED, read_volatile(PLIC_ENABLED) | (1 << irq));
+    });
+}
+
+/// Mask IRQ line `irq`
+pub fn disable(irq: u32) {
+    riscv::interrupt::free(|_| unsafe {
+        write_volatile(PLIC_ENABLED, read_volatile(PLIC_ENABLED) & !(1 << irq));
+    });
+}
+
+/// Turn on external interrupts
+pub fn init() {
+    unsafe {
+        write_volatile(PLIC_THRESHOLD, 0);
+        mie::set_mext();
+        mstatus::set_mie();
+    }
+}
+
+// Sleep until an interrupt unless `woken` is already set. Checking with
+// interrupts off closes the window between the check and the wfi; a
+// pending interrupt still ends the wfi.
+pub(crate) fn wait(woken: &AtomicBool) {
+    unsafe {
+        mstatus::clear_mie();
+        if !woken.load(Ordering::Acquire) {
+            riscv::asm::wfi();
+        }
+        mstatus::set_mie();
+    }
+}
+
+#[no_mangle]
+pub extern "C" fn MachineExternal() {
+    loop {
+        let claim = unsafe { read_volatile(PLIC_CLAIM) };
+        if claim == 0 {
+            break;
+        }
+        match claim {
+$dispatch            _ => {}
+        }
+        unsafe { write_volatile(PLIC_CLAIM, claim) };
+    }
+}
+"""
+
+# SERV has no external interrupts: the executor polls instead.
+INTERRUPT_NONE_RS = """//! External interrupts ($cpu_type: not supported, drivers are polled)
+
+use core::sync::atomic::{AtomicBool, Ordering};
+
+/// Whether drivers are interrupt-driven; if not, the executor polls them.
+pub const HAS_INTERRUPTS: bool = false;
+
+/// Unmask IRQ line `irq` (no-op)
+pub fn enable(_irq: u32) {}
+
+/// Mask IRQ line `irq` (no-op)
+pub fn disable(_irq: u32) {}
+
+/// Turn on external interrupts (no-op)
+pub fn init() {}
+
+// Nothing will wake the executor, so have it poll again right away.
+pub(crate) fn wait(woken: &AtomicBool) {
+    woken.store(true, Ordering::Release);
+}
+
+// Never called; keeps the drivers' handlers from being dead code.
+#[allow(dead_code)]
+fn dispatch() {
+$dispatch}
+"""
+
+# Interrupt controller of each LiteX CPU: ("csr", mask CSR, pending CSR),
+# ("plic",) or ("none",).
+INTERRUPT_CONTROLLERS = {
+    "vexriscv":     ("csr", 0xbc0, 0xfc0),
+    "vexriscv_smp": ("plic",),
+    "minerva":      ("csr", 0x330, 0x360),
+    "serv":         ("none",),
+}
+
+# VexRiscv's data cache is write-through, so this only has to drop stale
+# lines; the L2 cache sits on the main bus and is shared with DMA masters.
+CACHE_VEXRISCV_RS = """//! Data cache maintenance
+
+/// Invalidate the data cache so that data written by DMA masters is seen
+#[inline(always)]
+pub fn flush_dcache() {
+    unsafe { core::arch::asm!(".word 0x500f") };
+}
+"""
+
+CACHE_NONE_RS = """//! Data cache maintenance
+
+/// Invalidate the data cache so that data written by DMA masters is seen
+/// (no-op: this CPU has no data cache)
+#[inline(always)]
+pub fn flush_dcache() {}
+"""
+
+CACHE_FLUSH = {
+    "vexriscv":     CACHE_VEXRISCV_RS,
+    "vexriscv_smp": CACHE_VEXRISCV_RS,
+}
+
+# Drivers ------------------------------------------------------------------------------------------
+
+TIMER_RS = """//! Delays on $name
+
+use core::task::Poll;
+
+use crate::executor::{poll_fn, WakerCell};
+use crate::pac::$name::{Instance, RegisterBlock, $INST, IRQ};
+use crate::{clear_bits, set_bits, SYS_CLK_FREQ};
+
+const EV_ZERO: u32 = 0x$ev_zero;
+
+static WAKER: WakerCell = WakerCell::new();
+
+pub struct Timer {
+    inst: Instance,
+}
+
+impl Timer {
+    pub fn new(inst: Instance) -> Self {
+        inst.EN.write(0);
+        inst.EV_ENABLE.write(0);
+        inst.EV_PENDING.write(EV_ZERO);
+        crate::interrupt::enable(IRQ);
+        Timer { inst }
+    }
+
+    /// Wait for `cycles` system clock cycles
+    pub async fn delay_cycles(&mut self, cycles: u32) {
+        let r: &RegisterBlock = &self.inst;
+        r.EN.write(0);
+        r.RELOAD.write(0);
+        r.LOAD.write(cycles.max(1));
+        r.EV_PENDING.write(EV_ZERO);
+        r.EN.write(1);
+        poll_fn(|cx| {
+            if r.EV_PENDING.read() & EV_ZERO != 0 {
+                r.EV_PENDING.write(EV_ZERO);
+                r.EN.write(0);
+                return Poll::Ready(());
+            }
+            // The event stays pending, so enabling it late still interrupts.
+            WAKER.register(cx.waker());
+            set_bits(&r.EV_ENABLE, EV_ZERO);
+            Poll::Pending
+        })
+        .await
+    }
+
+    /// Wait for `us` microseconds
+    pub async fn delay_us(&mut self, us: u32) {
+        self.delay_cycles(us.saturating_mul(SYS_CLK_FREQ / 1_000_000)).await
+    }
+
+    /// Wait for `ms` milliseconds
+    pub async fn delay_ms(&mut self, ms: u32) {
+        self.delay_cycles(ms.saturating_mul(SYS_CLK_FREQ / 1_000)).await
+    }
+
+    pub fn free(self) -> Instance {
+        crate::interrupt::disable(IRQ);
+        self.inst.EV_ENABLE.write(0);
+        self.inst
+    }
+}
+
+pub(crate) fn on_interrupt() {
+    let r = unsafe { &*$INST };
+    clear_bits(&r.EV_ENABLE, EV_ZERO);
+    WAKER.wake();
+}
+"""
+
+UART_RS = """//! Buffered, interrupt-driven driver for $name
+$rx_doc
+use core::task::Poll;
+
+use crate::executor::{poll_fn, WakerCell};
+use crate::pac::$name::{Instance, RegisterBlock, $INST, IRQ};
+use crate::{clear_bits, set_bits};
+
+const EV_TX: u32 = 0x$ev_tx;
+const EV_RX: u32 = 0x$ev_rx;
+
+/// Size of the receive buffer
+pub const RX_BUFFER_SIZE: usize = $rx_buffer_size;
+
+static TX_WAKER: WakerCell = WakerCell::new();
+static RX_WAKER: WakerCell = WakerCell::new();
+$rx_impl
+pub struct Uart {
+    inst: Instance,
+}
+
+impl Uart {
+    pub fn new(inst: Instance) -> Self {
+        inst.EV_ENABLE.write(0);
+        inst.EV_PENDING.write(EV_TX);
+        rx_init(&inst);
+        crate::interrupt::enable(IRQ);
+        Uart { inst }
+    }
+
+    /// Write all of `data`, waiting for room in the TX FIFO as needed
+    pub async fn write(&mut self, data: &[u8]) {
+        let r: &RegisterBlock = &self.inst;
+        let mut sent = 0;
+        poll_fn(|cx| {
+            while sent < data.len() && r.TXFULL.read() == 0 {
+                r.RXTX.write(data[sent] as u32);
+                sent += 1;
+            }
+            if sent == data.len() {
+                return Poll::Ready(());
+            }
+            TX_WAKER.register(cx.waker());
+            r.EV_PENDING.write(EV_TX);
+            set_bits(&r.EV_ENABLE, EV_TX);
+            // The FIFO may have drained before the event was enabled.
+            if r.TXFULL.read() == 0 {
+                cx.waker().wake_by_ref();
+            }
+            Poll::Pending
+        })
+        .await
+    }
+
+    /// Copy buffered bytes into `buf` without waiting; returns the count
+    pub fn read_available(&mut self, buf: &mut [u8]) -> usize {
+        rx_read(&self.inst, buf)
+    }
+
+    /// Wait for at least one byte and copy what is buffered into `buf`;
+    /// returns the count
+    pub async fn read(&mut self, buf: &mut [u8]) -> usize {
+        if buf.is_empty() {
+            return 0;
+        }
+        let r: &RegisterBlock = &self.inst;
+        poll_fn(|cx| {
+            RX_WAKER.register(cx.waker());
+            match rx_read(r, buf) {
+                0 => {
+                    rx_listen(r);
+                    Poll::Pending
+                }
+                n => Poll::Ready(n),
+            }
+        })
+        .await
+    }
+
+    /// Fill all of `buf`
+    pub async fn read_exact(&mut self, buf: &mut [u8]) {
+        let mut n = 0;
+        while n < buf.len() {
+            n += self.read(&mut buf[n..]).await;
+        }
+    }
+
+    /// Number of received bytes dropped because the buffer was full
+    pub fn overruns(&self) -> u32 {
+        rx_overruns(&self.inst)
+    }
+
+    pub fn free(self) -> Instance {
+        crate::interrupt::disable(IRQ);
+        self.inst.EV_ENABLE.write(0);
+        rx_free(&self.inst);
+        self.inst
+    }
+}
+
+pub(crate) fn on_interrupt() {
+    let r = unsafe { &*$INST };
+    let pending = r.EV_PENDING.read() & r.EV_ENABLE.read();
+    if pending & EV_RX != 0 {
+        rx_interrupt(r);
+        RX_WAKER.wake();
+    }
+    if pending & EV_TX != 0 {
+        clear_bits(&r.EV_ENABLE, EV_TX);
+        TX_WAKER.wake();
+    }
+}
+"""
+
+# Received bytes are moved from the RX FIFO into a ring buffer by the
+# interrupt handler.
+UART_RX_FIFO_RS = """
+// Written by the interrupt handler and read with interrupts off; indexed
+// directly so no references to the statics are taken.
+static mut RX_BUF: [u8; RX_BUFFER_SIZE] = [0; RX_BUFFER_SIZE];
+static mut RX_HEAD: usize = 0;
+static mut RX_TAIL: usize = 0;
+static mut RX_OVERRUNS: u32 = 0;
+
+// Move everything in the RX FIFO into the ring buffer. Acknowledging the
+// RX event pops the FIFO.
+fn rx_drain(r: &RegisterBlock) {
+    while r.RXEMPTY.read() == 0 {
+        let byte = r.RXTX.read() as u8;
+        r.EV_PENDING.write(EV_RX);
+        unsafe {
+            let next = (RX_HEAD + 1) % RX_BUFFER_SIZE;
+            if next == RX_TAIL {
+                RX_OVERRUNS += 1;
+            } else {
+                RX_BUF[RX_HEAD] = byte;
+                RX_HEAD = next;
+            }
+        }
+    }
+}
+
+fn rx_init(r: &RegisterBlock) {
+    r.EV_PENDING.write(EV_RX);
+    set_bits(&r.EV_ENABLE, EV_RX);
+}
+
+// Also drains the FIFO, so reads work without interrupts.
+fn rx_read(r: &RegisterBlock, buf: &mut [u8]) -> usize {
+    riscv::interrupt::free(|_| {
+        rx_drain(r);
+        let mut n = 0;
+        unsafe {
+            while n < buf.len() && RX_TAIL != RX_HEAD {
+                buf[n] = RX_BUF[RX_TAIL];
+                RX_TAIL = (RX_TAIL + 1) % RX_BUFFER_SIZE;
+                n += 1;
+            }
+        }
+        n
+    })
+}
+
+// The RX event is always enabled.
+fn rx_listen(_r: &RegisterBlock) {}
+
+fn rx_interrupt(r: &RegisterBlock) {
+    rx_drain(r);
+}
+
+fn rx_overruns(_r: &RegisterBlock) -> u32 {
+    riscv::interrupt::free(|_| unsafe { RX_OVERRUNS })
+}
+
+fn rx_free(_r: &RegisterBlock) {}
+"""
+
+# With --feather-uart-rx-dma, received bytes skip the UART and are written
+# to the ring buffer by $dma_name; its watermark event (set to one byte)
+# signals data.
+UART_RX_DMA_RS = """
+use crate::pac::$dma_name::{RegisterBlock as DmaRegisterBlock, $DMA_INST, IRQ as DMA_IRQ};
+
+const DMA_ENABLE: u32 = 0x$dma_enable;
+const DMA_EV_WATERMARK: u32 = 0x$dma_ev_watermark;
+
+#[repr(C, align(4))]
+struct RxRing(core::cell::UnsafeCell<[u8; RX_BUFFER_SIZE]>);
+
+unsafe impl Sync for RxRing {}
+
+// Written by $dma_name only.
+static RX_RING: RxRing = RxRing(core::cell::UnsafeCell::new([0; RX_BUFFER_SIZE]));
+
+#[inline(always)]
+fn dma() -> &'static DmaRegisterBlock {
+    unsafe { &*$DMA_INST }
+}
+
+fn rx_init(_r: &RegisterBlock) {
+    let d = dma();
+    d.CONTROL.write(0);
+    d.EV_ENABLE.write(0);
+    d.BASE.write(RX_RING.0.get() as u32);
+    d.SIZE.write(RX_BUFFER_SIZE as u32);
+    d.READ_OFFSET.write(0);
+    d.WATERMARK.write(1);
+    d.TIMEOUT.write(0);
+    d.OVERFLOW.write(1);
+    d.CONTROL.write(DMA_ENABLE);
+    crate::interrupt::enable(DMA_IRQ);
+}
+
+fn rx_read(_r: &RegisterBlock, buf: &mut [u8]) -> usize {
+    let d = dma();
+    let write = d.WRITE_OFFSET.read() as usize;
+    let mut read = d.READ_OFFSET.read() as usize;
+    crate::cache::flush_dcache();
+    let ring = RX_RING.0.get() as *const u8;
+    let mut n = 0;
+    while n < buf.len() && read != write {
+        buf[n] = unsafe { core::ptr::read_volatile(ring.add(read)) };
+        read = (read + 1) % RX_BUFFER_SIZE;
+        n += 1;
+    }
+    d.READ_OFFSET.write(read as u32);
+    n
+}
+
+// The watermark event stays pending while data is buffered, so enabling it
+// late still interrupts.
+fn rx_listen(_r: &RegisterBlock) {
+    set_bits(&dma().EV_ENABLE, DMA_EV_WATERMARK);
+}
+
+fn rx_interrupt(_r: &RegisterBlock) {}
+
+// The core only flags that data was dropped.
+fn rx_overruns(_r: &RegisterBlock) -> u32 {
+    dma().OVERFLOW.read()
+}
+
+fn rx_free(_r: &RegisterBlock) {
+    crate::interrupt::disable(DMA_IRQ);
+    dma().EV_ENABLE.write(0);
+    dma().CONTROL.write(0);
+}
+
+pub(crate) fn on_rx_dma_interrupt() {
+    clear_bits(&dma().EV_ENABLE, DMA_EV_WATERMARK);
+    RX_WAKER.wake();
+}
+"""
+
+SPI_RS = """//! SPI transfers on $name (SPIMaster, one byte at a time)
+//!
+//! At the default SPI clock a byte takes a few dozen system clock cycles,
+//! so the first poll usually finds it done; the end-of-transfer interrupt
+//! pays off at slower clocks.
+
+use core::task::Poll;
+
+use crate::executor::{poll_fn, WakerCell};
+use crate::pac::$name::{Instance, RegisterBlock, $INST, IRQ};
+use crate::{clear_bits, set_bits};
+
+const CONTROL_START: u32 = 0x$control_start;
+const CONTROL_LENGTH_OFFSET: u32 = $control_length_offset;
+const STATUS_DONE: u32 = 0x$status_done;
+const EV_EOT: u32 = 0x$ev_eot;
+
+static WAKER: WakerCell = WakerCell::new();
+
+pub struct Spi {
+    inst: Instance,
+}
+
+impl Spi {
+    pub fn new(inst: Instance) -> Self {
+        inst.EV_ENABLE.write(0);
+        inst.EV_PENDING.write(EV_EOT);
+        crate::interrupt::enable(IRQ);
+        Spi { inst }
+    }
+
+    /// Send `byte` and return the byte received
+    pub async fn transfer_byte(&mut self, byte: u8) -> u8 {
+        let r: &RegisterBlock = &self.inst;
+        r.EV_PENDING.write(EV_EOT);
+        r.MOSI.write(byte as u32);
+        r.CONTROL.write((8 << CONTROL_LENGTH_OFFSET) | CONTROL_START);
+        poll_fn(|cx| {
+            if r.STATUS.read() & STATUS_DONE != 0 {
+                return Poll::Ready(r.MISO.read() as u8);
+            }
+            WAKER.register(cx.waker());
+            set_bits(&r.EV_ENABLE, EV_EOT);
+            Poll::Pending
+        })
+        .await
+    }
+
+    /// Send `buf`, replacing each byte with the byte received
+    pub async fn transfer(&mut self, buf: &mut [u8]) {
+        for byte in buf.iter_mut() {
+            *byte = self.transfer_byte(*byte).await;
+        }
+    }
+
+    /// Send `data`, ignoring what is received
+    pub async fn write(&mut self, data: &[u8]) {
+        for &byte in data {
+            self.transfer_byte(byte).await;
+        }
+    }
+
+    pub fn free(self) -> Instance {
+        crate::interrupt::disable(IRQ);
+        self.inst.EV_ENABLE.write(0);
+        self.inst
+    }
+}
+
+pub(crate) fn on_interrupt() {
+    let r = unsafe { &*$INST };
+    clear_bits(&r.EV_ENABLE, EV_EOT);
+    WAKER.wake();
+}
+"""
+
+SPI_DMA_RS = """//! SPI transfers on $name (SPIDMA, whole buffers)
+//!
+//! Buffers must be word-aligned. The core reads and writes memory itself,
+//! so a transfer that is dropped before it completes waits for the core
+//! to finish.
+
+use core::task::Poll;
+
+use crate::executor::{poll_fn, WakerCell};
+use crate::pac::$name::{Instance, RegisterBlock, $INST, IRQ};
+use crate::{clear_bits, set_bits};
+
+const CONTROL_START: u32 = 0x$control_start;
+const CONTROL_TX_ENABLE: u32 = 0x$control_tx_enable;
+const CONTROL_RX_ENABLE: u32 = 0x$control_rx_enable;
+const STATUS_BUSY: u32 = 0x$status_busy;
+const EV_DONE: u32 = 0x$ev_done;
+
+static WAKER: WakerCell = WakerCell::new();
+
+// Keeps the buffers borrowed until the core is done with them.
+struct Busy<'a>(&'a RegisterBlock);
+
+impl Drop for Busy<'_> {
+    fn drop(&mut self) {
+        while self.0.STATUS.read() & STATUS_BUSY != 0 {}
+    }
+}
+
+pub struct SpiDma {
+    inst: Instance,
+}
+
+impl SpiDma {
+    pub fn new(inst: Instance) -> Self {
+        inst.EV_ENABLE.write(0);
+        inst.EV_PENDING.write(EV_DONE);
+        crate::interrupt::enable(IRQ);
+        SpiDma { inst }
+    }
+
+    /// Send `tx` and receive into `rx`; both must be the same length
+    pub async fn transfer(&mut self, tx: &[u8], rx: &mut [u8]) {
+        assert_eq!(tx.len(), rx.len());
+        self.run(tx.as_ptr(), rx.as_mut_ptr(), CONTROL_TX_ENABLE | CONTROL_RX_ENABLE, tx.len()).await
+    }
+
+    /// Send `tx`, ignoring what is received
+    pub async fn write(&mut self, tx: &[u8]) {
+        self.run(tx.as_ptr(), core::ptr::null_mut(), CONTROL_TX_ENABLE, tx.len()).await
+    }
+
+    /// Receive into `rx`, sending 0xff
+    pub async fn read(&mut self, rx: &mut [u8]) {
+        self.run(core::ptr::null(), rx.as_mut_ptr(), CONTROL_RX_ENABLE, rx.len()).await
+    }
+
+    async fn run(&mut self, tx: *const u8, rx: *mut u8, enables: u32, len: usize) {
+        assert!(tx as usize % 4 == 0 && rx as usize % 4 == 0, "SPI DMA buffers must be word-aligned");
+        if len == 0 {
+            return;
+        }
+        let r: &RegisterBlock = &self.inst;
+        r.TX_BASE.write(tx as u32);
+        r.RX_BASE.write(rx as u32);
+        r.LENGTH.write(len as u32);
+        r.EV_PENDING.write(EV_DONE);
+        r.CONTROL.write(CONTROL_START | enables);
+        let busy = Busy(r);
+        poll_fn(|cx| {
+            if r.STATUS.read() & STATUS_BUSY == 0 {
+                return Poll::Ready(());
+            }
+            WAKER.register(cx.waker());
+            set_bits(&r.EV_ENABLE, EV_DONE);
+            // The done event is a pulse: check again now that it's enabled.
+            if r.STATUS.read() & STATUS_BUSY == 0 {
+                cx.waker().wake_by_ref();
+            }
+            Poll::Pending
+        })
+        .await;
+        drop(busy);
+        crate::cache::flush_dcache();
+    }
+
+    pub fn free(self) -> Instance {
+        crate::interrupt::disable(IRQ);
+        self.inst.EV_ENABLE.write(0);
+        self.inst
+    }
+}
+
+pub(crate) fn on_interrupt() {
+    let r = unsafe { &*$INST };
+    clear_bits(&r.EV_ENABLE, EV_DONE);
+    WAKER.wake();
+}
+"""
+
+I2C_RS = """//! I2C transactions on $name (OpenCores-style I2C master)
+
+use core::task::Poll;
+
+use crate::executor::{poll_fn, WakerCell};
+use crate::pac::$name::{Instance, RegisterBlock, $INST, IRQ};
+use crate::{clear_bits, set_bits, SYS_CLK_FREQ};
+
+const CONTROL_EN: u32 = 0x$control_en;
+const CONTROL_IEN: u32 = 0x$control_ien;
+const COMMAND_STA: u32 = 0x$command_sta;
+const COMMAND_STO: u32 = 0x$command_sto;
+const COMMAND_RD: u32 = 0x$command_rd;
+const COMMAND_WR: u32 = 0x$command_wr;
+const COMMAND_ACK: u32 = 0x$command_ack;
+const COMMAND_IACK: u32 = 0x$command_iack;
+const STATUS_TIP: u32 = 0x$status_tip;
+const STATUS_RXACK: u32 = 0x$status_rxack;
+const EV_DONE: u32 = 0x$ev_done;
+
+static WAKER: WakerCell = WakerCell::new();
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Error {
+    /// The address or a data byte was not acknowledged; the bus has been
+    /// released with a STOP.
+    Nack,
+}
+
+pub struct I2c {
+    inst: Instance,
+}
+
+impl I2c {
+    /// `frequency` is the SCL frequency in Hz, e.g. 100_000 or 400_000
+    pub fn new(inst: Instance, frequency: u32) -> Self {
+        inst.CONTROL.write(0);
+        inst.PRESCALE.write((SYS_CLK_FREQ / (5 * frequency)).saturating_sub(1));
+        inst.EV_ENABLE.write(0);
+        inst.EV_PENDING.write(EV_DONE);
+        inst.CONTROL.write(CONTROL_EN | CONTROL_IEN);
+        crate::interrupt::enable(IRQ);
+        I2c { inst }
+    }
+
+    // Issue `command` and wait for the byte to be transferred.
+    async fn command(&mut self, command: u32) {
+        let r: &RegisterBlock = &self.inst;
+        r.EV_PENDING.write(EV_DONE);
+        r.COMMAND.write(command | COMMAND_IACK);
+        poll_fn(|cx| {
+            if r.STATUS.read() & STATUS_TIP == 0 {
+                return Poll::Ready(());
+            }
+            WAKER.register(cx.waker());
+            set_bits(&r.EV_ENABLE, EV_DONE);
+            if r.STATUS.read() & STATUS_TIP == 0 {
+                cx.waker().wake_by_ref();
+            }
+            Poll::Pending
+        })
+        .await
+    }
+
+    async fn write_byte(&mut self, byte: u8, command: u32) -> Result<(), Error> {
+        self.inst.TXR.write(byte as u32);
+        self.command(COMMAND_WR | command).await;
+        if self.inst.STATUS.read() & STATUS_RXACK != 0 {
+            if command & COMMAND_STO == 0 {
+                self.command(COMMAND_STO).await;
+            }
+            return Err(Error::Nack);
+        }
+        Ok(())
+    }
+
+    async fn write_bytes(&mut self, data: &[u8], stop: bool) -> Result<(), Error> {
+        for (i, &byte) in data.iter().enumerate() {
+            let last = stop && i == data.len() - 1;
+            self.write_byte(byte, if last { COMMAND_STO } else { 0 }).await?;
+        }
+        Ok(())
+    }
+
+    // Receive `buf`, NACKing the last byte and ending with a STOP.
+    async fn read_bytes(&mut self, buf: &mut [u8]) {
+        let n = buf.len();
+        for (i, byte) in buf.iter_mut().enumerate() {
+            let last = if i == n - 1 { COMMAND_ACK | COMMAND_STO } else { 0 };
+            self.command(COMMAND_RD | last).await;
+            *byte = self.inst.RXR.read() as u8;
+        }
+    }
+
+    /// Write `data` to the device at 7-bit `address`
+    pub async fn write(&mut self, address: u8, data: &[u8]) -> Result<(), Error> {
+        let stop = if data.is_empty() { COMMAND_STO } else { 0 };
+        self.write_byte(address << 1, COMMAND_STA | stop).await?;
+        self.write_bytes(data, true).await
+    }
+
+    /// Read `buf` from the device at 7-bit `address`
+    pub async fn read(&mut self, address: u8, buf: &mut [u8]) -> Result<(), Error> {
+        let stop = if buf.is_empty() { COMMAND_STO } else { 0 };
+        self.write_byte((address << 1) | 1, COMMAND_STA | stop).await?;
+        self.read_bytes(buf).await;
+        Ok(())
+    }
+
+    /// Write `data`, then read `buf` after a repeated START
+    pub async fn write_read(&mut self, address: u8, data: &[u8], buf: &mut [u8]) -> Result<(), Error> {
+        self.write_byte(address << 1, COMMAND_STA).await?;
+        self.write_bytes(data, false).await?;
+        self.read(address, buf).await
+    }
+
+    pub fn free(self) -> Instance {
+        crate::interrupt::disable(IRQ);
+        self.inst.EV_ENABLE.write(0);
+        self.inst.CONTROL.write(0);
+        self.inst
+    }
+}
+
+pub(crate) fn on_interrupt() {
+    let r = unsafe { &*$INST };
+    clear_bits(&r.EV_ENABLE, EV_DONE);
+    WAKER.wake();
+}
+"""
+
+I2C_BURST_RS = """//! I2C transactions on $name (I2CBurst, whole transactions queued)
+//!
+//! A transaction is queued as commands and completes with one interrupt.
+
+use core::task::Poll;
+
+use crate::executor::{poll_fn, yield_now, WakerCell};
+use crate::pac::$name::{Instance, RegisterBlock, $INST, IRQ};
+use crate::{clear_bits, set_bits};
+
+const CONTROL_SPEED_OFFSET: u32 = $control_speed_offset;
+const CONTROL_RESET: u32 = 0x$control_reset;
+const CMD_START: u32 = 0x$cmd_start;
+const CMD_STOP: u32 = 0x$cmd_stop;
+const CMD_READ: u32 = 0x$cmd_read;
+const STATUS_NACK: u32 = 0x$status_nack;
+const STATUS_CMD_FULL: u32 = 0x$status_cmd_full;
+const EV_DONE: u32 = 0x$ev_done;
+const EV_RX_FULL: u32 = 0x$ev_rx_full;
+
+static WAKER: WakerCell = WakerCell::new();
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Speed {
+    /// 100 kHz
+    Standard = 0,
+    /// 400 kHz
+    Fast = 1,
+    /// 1 MHz
+    FastPlus = 2,
+}
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Error {
+    /// The address or a data byte was not acknowledged; the bus has been
+    /// released with a STOP.
+    Nack,
+}
+
+pub struct I2cBurst {
+    inst: Instance,
+    control: u32,
+}
+
+// Move the bytes in the RX FIFO to `buf[n..]`, returning the new `n`.
+fn drain(r: &RegisterBlock, buf: &mut [u8], mut n: usize) -> usize {
+    for _ in 0..r.RX_LEVEL.read() {
+        let byte = r.RX.read() as u8;
+        r.RX.write(0);
+        if n < buf.len() {
+            buf[n] = byte;
+            n += 1;
+        }
+    }
+    n
+}
+
+impl I2cBurst {
+    pub fn new(inst: Instance, speed: Speed) -> Self {
+        let control = (speed as u32) << CONTROL_SPEED_OFFSET;
+        inst.EV_ENABLE.write(0);
+$dma_disable        inst.CONTROL.write(control | CONTROL_RESET);
+        inst.EV_PENDING.write(EV_DONE);
+        crate::interrupt::enable(IRQ);
+        I2cBurst { inst, control }
+    }
+
+    // Queue `cmd`. Only transactions longer than the command FIFO have to
+    // wait for room.
+    async fn push(&mut self, cmd: u32) {
+        while self.inst.STATUS.read() & STATUS_CMD_FULL != 0 {
+            yield_now().await;
+        }
+        self.inst.CMD.write(cmd);
+    }
+
+    // Write `data` to `address`, then read `buf` after a repeated START. The
+    // transaction ends with a STOP.
+    async fn transfer(&mut self, address: u8, data: &[u8], buf: &mut [u8]) -> Result<(), Error> {
+        assert!(buf.len() <= 256);
+        self.inst.EV_PENDING.write(EV_DONE);
+
+        if !data.is_empty() || buf.is_empty() {
+            let stop = if data.is_empty() { CMD_STOP } else { 0 };
+            self.push(CMD_START | (address as u32) << 1 | stop).await;
+            for (i, &byte) in data.iter().enumerate() {
+                let stop = if buf.is_empty() && i == data.len() - 1 { CMD_STOP } else { 0 };
+                self.push(byte as u32 | stop).await;
+            }
+        }
+        if !buf.is_empty() {
+            self.push(CMD_START | (address as u32) << 1 | 1).await;
+            self.push(CMD_READ | CMD_STOP | (buf.len() - 1) as u32).await;
+        }
+
+        let r: &RegisterBlock = &self.inst;
+        let mut n = 0;
+        poll_fn(|cx| {
+            n = drain(r, buf, n);
+            if r.EV_PENDING.read() & EV_DONE != 0 {
+                return Poll::Ready(());
+            }
+            WAKER.register(cx.waker());
+            set_bits(&r.EV_ENABLE, EV_DONE | EV_RX_FULL);
+            if r.EV_PENDING.read() & (EV_DONE | EV_RX_FULL) != 0 {
+                cx.waker().wake_by_ref();
+            }
+            Poll::Pending
+        })
+        .await;
+        drain(r, buf, n);
+
+        if r.STATUS.read() & STATUS_NACK != 0 {
+            r.CONTROL.write(self.control | CONTROL_RESET);
+            return Err(Error::Nack);
+        }
+        Ok(())
+    }
+
+    /// Write `data` to the device at 7-bit `address`
+    pub async fn write(&mut self, address: u8, data: &[u8]) -> Result<(), Error> {
+        self.transfer(address, data, &mut []).await
+    }
+
+    /// Read `buf` (at most 256 bytes) from the device at 7-bit `address`
+    pub async fn read(&mut self, address: u8, buf: &mut [u8]) -> Result<(), Error> {
+        self.transfer(address, &[], buf).await
+    }
+
+    /// Write `data`, then read `buf` (at most 256 bytes) after a repeated
+    /// START
+    pub async fn write_read(&mut self, address: u8, data: &[u8], buf: &mut [u8]) -> Result<(), Error> {
+        self.transfer(address, data, buf).await
+    }
+
+    pub fn free(self) -> Instance {
+        crate::interrupt::disable(IRQ);
+        self.inst.EV_ENABLE.write(0);
+        self.inst
+    }
+}
+
+pub(crate) fn on_interrupt() {
+    let r = unsafe { &*$INST };
+    clear_bits(&r.EV_ENABLE, EV_DONE | EV_RX_FULL);
+    WAKER.wake();
+}
+"""
+
+# Matching -----------------------------------------------------------------------------------------
+
+# Mask of field `field` of register `reg`, or None if either is missing.
+# Field names are matched case-insensitively: RTLI2C's are upper case.
+def _mask(registers, reg, field):
+    if reg not in registers:
+        return None
+    for name, offset, size in registers[reg].fields:
+        if name.lower() == field:
+            return ((1 << size) - 1) << offset
+    return None
+
+def _offset(registers, reg, field):
+    for name, offset, size in registers[reg].fields:
+        if name.lower() == field:
+            return offset
+
+# Mask of the first of `names` that is an event of the peripheral, or of all
+# its events if `all_events` is set.
+def _event(registers, names, all_events=False):
+    for name in names:
+        mask = _mask(registers, "EV_PENDING", name)
+        if mask is not None:
+            return mask
+    if all_events and "EV_PENDING" in registers:
+        return sum(((1 << size) - 1) << offset
+            for _, offset, size in registers["EV_PENDING"].fields)
+    return None
+
+def _has(registers, *names):
+    return all(name in registers for name in names)
+
+def _hex(mask):
+    return "{:x}".format(mask)
+
+def _timer(periph, registers, peripherals):
+    ev_zero = _event(registers, ["zero"])
+    if not _has(registers, "LOAD", "RELOAD", "EN") or ev_zero is None:
+        return None
+    return "Timer", Template(TIMER_RS).safe_substitute(ev_zero=_hex(ev_zero)), []
+
+def _uart(periph, registers, peripherals, rx_buffer_size=256):
+    ev_tx = _event(registers, ["tx"])
+    ev_rx = _event(registers, ["rx"])
+    if not _has(registers, "RXTX", "TXFULL", "RXEMPTY") or ev_tx is None or ev_rx is None:
+        return None
+
+    handlers = []
+    dma = peripherals.get(periph.name + "_rx_dma")
+    if dma is not None and dma.irq is not None:
+        dma_registers = {r.name: r for r in dma.registers}
+        rx_impl = Template(UART_RX_DMA_RS).substitute(
+            dma_name         = dma.name,
+            DMA_INST         = dma.name.upper(),
+            dma_enable       = _hex(_mask(dma_registers, "CONTROL", "enable")),
+            dma_ev_watermark = _hex(_event(dma_registers, ["watermark"])))
+        rx_doc = "//!\n//! Received bytes are written to memory by {}.\n".format(dma.name)
+        handlers.append((dma.irq, "{}::on_rx_dma_interrupt".format(periph.name)))
+    else:
+        rx_impl = UART_RX_FIFO_RS
+        rx_doc = ""
+
+    return "Uart", Template(UART_RS).safe_substitute(
+        rx_doc         = rx_doc,
+        rx_impl        = rx_impl,
+        ev_tx          = _hex(ev_tx),
+        ev_rx          = _hex(ev_rx),
+        rx_buffer_size = rx_buffer_size), handlers
+
+def _spi(periph, registers, peripherals):
+    ev_eot = _event(registers, ["eot"], all_events=True)
+    control_start = _mask(registers, "CONTROL", "start")
+    status_done   = _mask(registers, "STATUS", "done")
+    if (not _has(registers, "MOSI", "MISO") or None in (ev_eot, control_start, status_done) or
+        _mask(registers, "CONTROL", "length") is None):
+        return None
+    return "Spi", Template(SPI_RS).safe_substitute(
+        control_start         = _hex(control_start),
+        control_length_offset = _offset(registers, "CONTROL", "length"),
+        status_done           = _hex(status_done),
+        ev_eot                = _hex(ev_eot)), []
+
+def _spi_dma(periph, registers, peripherals):
+    masks = dict(
+        control_start     = _mask(registers, "CONTROL", "start"),
+        control_tx_enable = _mask(registers, "CONTROL", "tx_enable"),
+        control_rx_enable = _mask(registers, "CONTROL", "rx_enable"),
+        status_busy       = _mask(registers, "STATUS", "busy"),
+        ev_done           = _event(registers, ["done"]))
+    if not _has(registers, "TX_BASE", "RX_BASE", "LENGTH") or None in masks.values():
+        return None
+    return "SpiDma", Template(SPI_DMA_RS).safe_substitute(
+        {k: _hex(v) for k, v in masks.items()}), []
+
+def _i2c(periph, registers, peripherals):
+    masks = dict(
+        control_en   = _mask(registers, "CONTROL", "en"),
+        command_sta  = _mask(registers, "COMMAND", "sta"),
+        command_sto  = _mask(registers, "COMMAND", "sto"),
+        command_rd   = _mask(registers, "COMMAND", "rd"),
+        command_wr   = _mask(registers, "COMMAND", "wr"),
+        command_ack  = _mask(registers, "COMMAND", "ack"),
+        status_tip   = _mask(registers, "STATUS", "tip"),
+        status_rxack = _mask(registers, "STATUS", "rxack"),
+        ev_done      = _event(registers, ["txrx_done", "done"], all_events=True))
+    if not _has(registers, "PRESCALE", "TXR", "RXR") or None in masks.values():
+        return None
+    # Optional: interrupt enable and acknowledge of the core itself.
+    masks["control_ien"]  = _mask(registers, "CONTROL", "ien") or 0
+    masks["command_iack"] = _mask(registers, "COMMAND", "iack") or 0
+    return "I2c", Template(I2C_RS).safe_substitute(
+        {k: _hex(v) for k, v in masks.items()}), []
+
+def _i2c_burst(periph, registers, peripherals):
+    masks = dict(
+        control_reset   = _mask(registers, "CONTROL", "reset"),
+        cmd_start       = _mask(registers, "CMD", "start"),
+        cmd_stop        = _mask(registers, "CMD", "stop"),
+        cmd_read        = _mask(registers, "CMD", "read"),
+        status_nack     = _mask(registers, "STATUS", "nack"),
+        status_cmd_full = _mask(registers, "STATUS", "cmd_full"),
+        ev_done         = _event(registers, ["done"]),
+        ev_rx_full      = _event(registers, ["rx_full"]))
+    if (not _has(registers, "RX", "RX_LEVEL") or None in masks.values() or
+        _mask(registers, "CONTROL", "speed") is None):
+        return None
+    # The driver leaves received bytes in the RX FIFO.
+    dma_disable = "        inst.DMA_CONTROL.write(0);\n" if "DMA_CONTROL" in registers else ""
+    return "I2cBurst", Template(I2C_BURST_RS).safe_substitute(
+        {k: _hex(v) for k, v in masks.items()},
+        control_speed_offset = _offset(registers, "CONTROL", "speed"),
+        dma_disable          = dma_disable), []
+
+# Each returns (driver type, source, extra IRQ handlers) or None. The source
+# still has $name and $INST to fill in. Tried in order; the first match
+# wins.
+DRIVERS = [_timer, _uart, _spi_dma, _spi, _i2c_burst, _i2c]
+
+# Generation ---------------------------------------------------------------------------------------
+
+def _interrupt_rs(soc, handlers):
+    controller = INTERRUPT_CONTROLLERS.get(soc.cpu_type, ("none",))
+    if controller[0] == "csr":
+        dispatch = "".join("    if pending & (1 << {}) != 0 {{\n        crate::{}();\n    }}\n".format(irq, handler)
+            for irq, handler in handlers)
+        return Template(INTERRUPT_CSR_RS).substitute(
+            cpu_type    = soc.cpu_type,
+            mask_csr    = "0x{:x}".format(controller[1]),
+            pending_csr = "0x{:x}".format(controller[2]),
+            dispatch    = dispatch)
+    if controller[0] == "plic":
+        plic = soc.cpu.mem_map.get("plic", 0xf0c00000)
+        dispatch = "".join("            {} => crate::{}(),\n".format(irq, handler)
+            for irq, handler in handlers)
+        return Template(INTERRUPT_PLIC_RS).substitute(
+            cpu_type  = soc.cpu_type,
+            priority  = "{:08x}".format(plic),
+            enabled   = "{:08x}".format(plic + 0x2000),
+            threshold = "{:08x}".format(plic + 0x200000),
+            claim     = "{:08x}".format(plic + 0x200004),
+            dispatch  = dispatch)
+    dispatch = "".join("    crate::{}();\n".format(handler) for irq, handler in handlers)
+    return Template(INTERRUPT_NONE_RS).substitute(
+        cpu_type = soc.cpu_type,
+        dispatch = dispatch)
+
+# Returns a dict of paths relative to the crate and their contents, and the
+# peripherals that got a driver (name -> driver type).
+def generate_hal(soc, cpu_crate, cpu_crate_version, exclude=("IDENTIFIER_MEM",)):
+    peripherals = {p.name: p for p in collect_peripherals(soc, exclude)}
+
+    files    = {}
+    drivers  = {}
+    handlers = []
+    for periph in peripherals.values():
+        if periph.irq is None:
+            continue
+        registers = {r.name: r for r in periph.registers}
+        for driver in DRIVERS:
+            match = driver(periph, registers, peripherals)
+            if match is not None:
+                break
+        else:
+            continue
+
+        driver_type, rs, extra_handlers = match
+        files["src/{}.rs".format(periph.name)] = Template(rs).substitute(
+            name = periph.name,
+            INST = periph.name.upper())
+        drivers[periph.name] = driver_type
+        handlers.append((periph.irq, "{}::on_interrupt".format(periph.name)))
+        handlers += extra_handlers
+
+    files["Cargo.toml"] = Template(CARGO_TOML).substitute(
+        cpu_crate         = cpu_crate,
+        cpu_crate_version = cpu_crate_version)
+    files["src/lib.rs"] = Template(LIB_RS).substitute(
+        driver_mods  = "".join("pub mod {};\n".format(name) for name in drivers),
+        sys_clk_freq = int(soc.sys_clk_freq))
+    files["src/executor.rs"]  = EXECUTOR_RS
+    files["src/interrupt.rs"] = _interrupt_rs(soc, sorted(handlers))
+    files["src/cache.rs"]     = CACHE_FLUSH.get(soc.cpu_type, CACHE_NONE_RS)
+    return files, drivers
@@ -0,0 +1,408 @@
+from migen import *
+from migen.genlib.cdc import MultiReg
+from migen.fhdl.specials import Tristate
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.csr_eventmanager import *
+
+# I2C Burst Engine ---------------------------------------------------------------------------------
+
+# SCL frequencies selected by control.speed.
+I2C_SPEEDS = [100e3, 400e3, 1e6]
+
+class I2CBurst(Module, AutoCSR):
+    """I2C master that runs whole transactions from a command FIFO.
+
+    Each command is one byte on the bus: a write of ``data``, or, with
+    ``read`` set, a read of ``data + 1`` bytes into the RX FIFO (the last one
+    is NACKed). ``start`` puts a (repeated) START before the command and
+    ``stop`` a STOP after it. A register read is then four commands:
+    START + address, register, START + (address | 1), read + STOP.
+
+    Commands run as soon as they are queued. The ``done`` event fires once a
+    STOP has been sent and the command FIFO is empty, so a transaction costs
+    one interrupt; reads longer than the RX FIFO also raise ``rx_full``. If
+    a written byte is not ACKed, the engine sends a STOP, drops the queued
+    commands, sets ``nack`` and fires ``done``.
+
+    With ``with_dma``, the engine can also fetch ``dma_cmd_count`` command
+    words from ``dma_cmd_base`` and write received bytes to ``dma_rx_base``
+    (``done`` then also waits for those writes).
+    """
+    def __init__(self, pads, sys_clk_freq, fifo_depth=32, with_dma=False):
+        self.scl_i  = scl_i  = Signal(reset=1)
+        self.sda_i  = sda_i  = Signal(reset=1)
+        self.scl_oe = scl_oe = Signal()
+        self.sda_oe = sda_oe = Signal()
+
+        self._control = CSRStorage(fields=[
+            CSRField("speed", size=2, offset=0, reset=1, values=[
+                ("``0b00``", "100 kHz (standard mode)."),
+                ("``0b01``", "400 kHz (fast mode)."),
+                ("``0b10``", "1 MHz (fast mode plus; needs stronger pull-ups)."),
+            ]),
+            CSRField("reset", size=1, offset=4, pulse=True,
+                description="Write ``1`` to drop queued commands and received data and clear ``nack``/``overflow``."),
+        ])
+        self._cmd = CSRStorage(fields=[
+            CSRField("data",  size=8, offset=0,  description="Byte to write; for reads, number of bytes to read minus one."),
+            CSRField("start", size=1, offset=8,  description="Send a (repeated) START first."),
+            CSRField("stop",  size=1, offset=9,  description="Send a STOP afterwards."),
+            CSRField("read",  size=1, offset=10, description="Read ``data + 1`` bytes instead of writing ``data``."),
+        ], description="Writing queues a command.")
+        self._rx     = CSR(8)
+        self._status = CSRStatus(fields=[
+            CSRField("busy",     size=1, offset=0, description="Commands are queued or running."),
+            CSRField("nack",     size=1, offset=1, description="The last transaction was aborted because a byte was not ACKed."),
+            CSRField("overflow", size=1, offset=2, description="A command was written while the command FIFO was full, and dropped."),
+            CSRField("cmd_full", size=1, offset=3, description="The command FIFO is full."),
+        ])
+        self._cmd_level = CSRStatus(bits_for(fifo_depth), description="Number of queued commands.")
+        self._rx_level  = CSRStatus(bits_for(fifo_depth), description="Number of bytes in the RX FIFO; read them from ``rx``, writing ``rx`` pops a byte.")
+
+        self.submodules.ev = EventManager()
+        self.ev.done    = EventSourcePulse(description="A transaction ended with a STOP (or was aborted) and no commands are queued.")
+        self.ev.rx_full = EventSourceLevel(description="The RX FIFO is full; the engine holds SCL low until it is read.")
+        self.ev.finalize()
+
+        # # #
+
+        if pads is not None:
+            self.specials += [
+                Tristate(pads.scl, 0, scl_oe, scl_i),
+                Tristate(pads.sda, 0, sda_oe, sda_i),
+            ]
+
+        reset    = self._control.fields.reset
+        nack     = Signal()
+        overflow = Signal()
+        stopped  = Signal()
+        set_nack = Signal()
+        set_stop = Signal()
+
+        self.submodules.cmd_fifo = cmd_fifo = ResetInserter()(stream.SyncFIFO([("data", 11)], fifo_depth))
+        self.submodules.rx_fifo  = rx_fifo  = ResetInserter()(stream.SyncFIFO([("data", 8)], fifo_depth))
+        self.comb += [
+            cmd_fifo.reset.eq(reset),
+            rx_fifo.reset.eq(reset),
+            self._cmd_level.status.eq(cmd_fifo.level),
+            self._rx_level.status.eq(rx_fifo.level),
+            self._rx.w.eq(rx_fifo.source.data),
+        ]
+
+        # Commands come from the CSR or, with DMA, from memory; the CSR has
+        # priority.
+        cmd_csr       = Signal()
+        self.dma_cmd  = Signal(11)
+        self.dma_push = Signal()
+        self.dma_busy = Signal()
+        self.comb += [
+            cmd_csr.eq(self._cmd.re),
+            If(cmd_csr,
+                cmd_fifo.sink.valid.eq(1),
+                cmd_fifo.sink.data.eq(self._cmd.storage)
+            ).Else(
+                cmd_fifo.sink.valid.eq(self.dma_push),
+                cmd_fifo.sink.data.eq(self.dma_cmd)
+            )
+        ]
+
+        self.sync += [
+            If(reset,
+                nack.eq(0),
+                overflow.eq(0)
+            ).Else(
+                If(set_nack, nack.eq(1)),
+                If(cmd_csr & ~cmd_fifo.sink.ready, overflow.eq(1))
+            ),
+            If(reset,
+                stopped.eq(0)
+            ).Elif(set_stop,
+                stopped.eq(1)
+            ).Elif(self.ev.done.trigger,
+                stopped.eq(0)
+            )
+        ]
+
+        # Inputs are asynchronous.
+        scl = Signal(reset=1)
+        sda = Signal(reset=1)
+        self.specials += [
+            MultiReg(scl_i, scl, reset=1),
+            MultiReg(sda_i, sda, reset=1),
+        ]
+
+        # Quarter-bit tick.
+        quarters = [max(1, int(sys_clk_freq/(4*f))) for f in I2C_SPEEDS]
+        quarter  = Signal(max=max(quarters) + 1)
+        count    = Signal(max=max(quarters) + 1)
+        tick     = Signal()
+        wait_scl = Signal()
+        cases = {i: quarter.eq(q) for i, q in enumerate(quarters)}
+        cases["default"] = quarter.eq(quarters[-1])
+        self.comb += Case(self._control.fields.speed, cases)
+        self.comb += tick.eq(count == 0)
+        self.sync += [
+            If(tick,
+                # SCL was released: wait for it to rise (clock stretching).
+                If(~wait_scl | scl,
+                    count.eq(quarter - 1)
+                )
+            ).Else(
+                count.eq(count - 1)
+            )
+        ]
+
+        # Byte engine.
+        cmd_data  = Signal(8)
+        cmd_start = Signal()
+        cmd_stop  = Signal()
+        cmd_read  = Signal()
+        shift     = Signal(8)
+        bit       = Signal(4)
+        phase     = Signal(2)
+        remaining = Signal(8)
+        step      = Signal()
+        abort     = Signal()
+
+        self.comb += step.eq(tick & (~wait_scl | scl))
+
+        # The reset also releases SCL and SDA.
+        self.submodules.fsm = fsm = ResetInserter()(FSM(reset_state="IDLE"))
+        self.comb += fsm.reset.eq(reset)
+
+        fsm.act("IDLE",
+            If(cmd_fifo.source.valid,
+                cmd_fifo.source.ready.eq(1),
+                NextValue(cmd_data,  cmd_fifo.source.data[0:8]),
+                NextValue(cmd_start, cmd_fifo.source.data[8]),
+                NextValue(cmd_stop,  cmd_fifo.source.data[9]),
+                NextValue(cmd_read,  cmd_fifo.source.data[10]),
+                NextValue(phase, 0),
+                NextState("LOAD")
+            )
+        )
+        fsm.act("LOAD",
+            NextValue(shift, Mux(cmd_read, 0, cmd_data)),
+            NextValue(remaining, cmd_data),
+            NextValue(bit, 0),
+            If(cmd_start,
+                NextState("START")
+            ).Else(
+                NextState("BIT")
+            )
+        )
+        # SDA falls while SCL is high. For a repeated START, SCL is low on
+        # entry: release SDA first, then SCL.
+        fsm.act("START",
+            wait_scl.eq(phase == 2),
+            If(step,
+                NextValue(phase, phase + 1),
+                Case(phase, {
+                    0: NextValue(sda_oe, 0),
+                    1: NextValue(scl_oe, 0),
+                    2: NextValue(sda_oe, 1),
+                    3: [NextValue(scl_oe, 1), NextState("BIT")],
+                })
+            )
+        )
+        # 8 data bits and the ACK bit. SDA changes while SCL is low and is
+        # sampled in the middle of the high half.
+        last_ack = Signal()
+        self.comb += last_ack.eq(remaining == 0)
+        fsm.act("BIT",
+            wait_scl.eq(phase == 2),
+            If(step,
+                NextValue(phase, phase + 1),
+                Case(phase, {
+                    0: If(bit == 8,
+                           # ACK slot: the device ACKs writes; we ACK reads but the last.
+                           NextValue(sda_oe, cmd_read & ~last_ack)
+                       ).Else(
+                           NextValue(sda_oe, ~cmd_read & ~shift[7])
+                       ),
+                    1: NextValue(scl_oe, 0),
+                    2: If(bit == 8,
+                           NextValue(abort, ~cmd_read & sda)
+                       ).Else(
+                           NextValue(shift, Cat(sda, shift[:7]))
+                       ),
+                    3: [
+                        NextValue(scl_oe, 1),
+                        If(bit == 8,
+                            NextState("ACK")
+                        ).Else(
+                            NextValue(bit, bit + 1)
+                        )
+                    ],
+                })
+            )
+        )
+        fsm.act("ACK",
+            NextValue(bit, 0),
+            If(cmd_read,
+                # Wait for room before reading the next byte.
+                rx_fifo.sink.valid.eq(1),
+                rx_fifo.sink.data.eq(shift),
+                If(rx_fifo.sink.ready,
+                    NextValue(remaining, remaining - 1),
+                    If(last_ack,
+                        If(cmd_stop,
+                            NextState("STOP")
+                        ).Else(
+                            NextState("IDLE")
+                        )
+                    ).Else(
+                        NextState("BIT")
+                    )
+                )
+            ).Elif(abort,
+                set_nack.eq(1),
+                NextState("STOP")
+            ).Elif(cmd_stop,
+                NextState("STOP")
+            ).Else(
+                NextState("IDLE")
+            )
+        )
+        # SDA rises while SCL is high.
+        fsm.act("STOP",
+            wait_scl.eq(phase == 2),
+            If(step,
+                NextValue(phase, phase + 1),
+                Case(phase, {
+                    0: NextValue(sda_oe, 1),
+                    1: NextValue(scl_oe, 0),
+                    2: NextValue(sda_oe, 0),
+                    3: [
+                        set_stop.eq(1),
+                        NextValue(abort, 0),
+                        If(abort,
+                            NextState("FLUSH")
+                        ).Else(
+                            NextState("IDLE")
+                        )
+                    ],
+                })
+            )
+        )
+        fsm.act("FLUSH",
+            cmd_fifo.source.ready.eq(1),
+            If(~cmd_fifo.source.valid & ~self.dma_busy,
+                NextState("IDLE")
+            )
+        )
+        self.comb += [
+            self._status.fields.nack.eq(nack),
+            self._status.fields.overflow.eq(overflow),
+            self._status.fields.cmd_full.eq(~cmd_fifo.sink.ready),
+            self.ev.rx_full.trigger.eq(~rx_fifo.sink.ready),
+        ]
+
+        # RX FIFO to CSR or memory, and the completion event.
+        rx_drained = Signal()
+        if with_dma:
+            self.add_dma(cmd_fifo, rx_fifo, cmd_csr, reset, flush=fsm.ongoing("FLUSH"))
+            self.comb += rx_drained.eq(~self.dma_rx_enable | ~rx_fifo.source.valid)
+        else:
+            self.comb += [
+                rx_fifo.source.ready.eq(self._rx.re),
+                rx_drained.eq(1),
+            ]
+        busy = ~fsm.ongoing("IDLE") | cmd_fifo.source.valid | self.dma_busy
+        self.comb += [
+            self._status.fields.busy.eq(busy),
+            self.ev.done.trigger.eq(stopped & ~busy & rx_drained),
+        ]
+
+    def add_dma(self, cmd_fifo, rx_fifo, cmd_csr, reset, flush):
+        self.bus = bus = wishbone.Interface()
+
+        self._dma_control = CSRStorage(fields=[
+            CSRField("start",     size=1, offset=0, pulse=True, description="Write ``1`` to fetch ``dma_cmd_count`` commands from ``dma_cmd_base``."),
+            CSRField("rx_enable", size=1, offset=1, description="Write received bytes to ``dma_rx_base`` instead of leaving them in the RX FIFO."),
+        ])
+        self._dma_cmd_base  = CSRStorage(32, description="Word-aligned address of the command words.")
+        self._dma_cmd_count = CSRStorage(16, description="Number of command words to fetch.")
+        self._dma_rx_base   = CSRStorage(32, description="Address received bytes are written to; restarts at each ``start``.")
+        self._dma_rx_count  = CSRStatus(16,  description="Number of bytes written to ``dma_rx_base`` since ``start``.")
+
+        self.dma_rx_enable = self._dma_control.fields.rx_enable
+
+        # # #
+
+        start     = self._dma_control.fields.start
+        cmd_index = Signal(16)
+        rx_index  = Signal(16)
+        fetching  = Signal()
+        cmd_adr   = Signal(32)
+        rx_adr    = Signal(32)
+        fetched   = Signal()
+        written   = Signal()
+
+        self.comb += [
+            cmd_adr.eq(self._dma_cmd_base.storage + (cmd_index << 2)),
+            rx_adr.eq(self._dma_rx_base.storage + rx_index),
+            self._dma_rx_count.status.eq(rx_index),
+            If(~self.dma_rx_enable,
+                rx_fifo.source.ready.eq(self._rx.re)
+            ),
+        ]
+        self.sync += [
+            If(start,
+                cmd_index.eq(0),
+                rx_index.eq(0)
+            ).Else(
+                If(fetched, cmd_index.eq(cmd_index + 1)),
+                If(written, rx_index.eq(rx_index + 1))
+            ),
+            If(reset | flush,
+                fetching.eq(0)
+            ).Elif(start,
+                fetching.eq(self._dma_cmd_count.storage != 0)
+            ).Elif(fetched & (cmd_index == (self._dma_cmd_count.storage - 1)),
+                fetching.eq(0)
+            )
+        ]
+
+        self.submodules.dma_fsm = fsm = FSM(reset_state="IDLE")
+        self.comb += self.dma_busy.eq(fetching | fsm.ongoing("PUSH"))
+        fsm.act("IDLE",
+            If(self.dma_rx_enable & rx_fifo.source.valid,
+                NextState("WRITE")
+            ).Elif(fetching,
+                NextState("READ")
+            )
+        )
+        fsm.act("READ",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.adr.eq(cmd_adr[2:]),
+            bus.sel.eq(0xf),
+            If(bus.ack,
+                fetched.eq(1),
+                NextValue(self.dma_cmd, bus.dat_r),
+                NextState("PUSH")
+            )
+        )
+        fsm.act("PUSH",
+            self.dma_push.eq(~flush),
+            If(flush | (~cmd_csr & cmd_fifo.sink.ready),
+                NextState("IDLE")
+            )
+        )
+        fsm.act("WRITE",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.adr.eq(rx_adr[2:]),
+            bus.sel.eq(1 << rx_adr[:2]),
+            bus.dat_w.eq(Replicate(rx_fifo.source.data, 4)),
+            If(bus.ack,
+                rx_fifo.source.ready.eq(1),
+                written.eq(1),
+                NextState("IDLE")
+            )
+        )
@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import time
+import zlib
+import shutil
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .firmware import dfu_load, report
+from .build_hash import read_build_hash
+from .feather_soc import IDENT
+
+# The OrangeCrab bootloader's DFU device; alt setting 0 is the bitstream
+# partition.
+DFU_DEVICE    = "1209:5af0"
+BITSTREAM_ALT = 0
+
+# Running SoC --------------------------------------------------------------------------------------
+
+# Send a command to the BIOS console and wait for a line matching pattern.
+def _bios_command(ser, command, pattern, timeout):
+    ser.write((command + "\n").encode())
+    received = ""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        received += ser.read(256).decode(errors="replace")
+        match = pattern.search(received)
+        if match:
+            return match.group(1)
+    return None
+
+# Ask the BIOS of the SoC running on the board for its identifier and read
+# the build hash CSR at hash_addr. Either is None if the board doesn't
+# answer, e.g. because firmware rather than the BIOS is running.
+def query_board(port, hash_addr, timeout=2):
+    import serial
+
+    with serial.Serial(port, 115200, timeout=0.1) as ser:
+        ser.reset_input_buffer()
+        ident = _bios_command(ser, "ident",
+            re.compile(r"Ident: ([^\r\n]*)\r?\n"), timeout)
+        # mem_read dumps bytes; CSR words are little-endian in memory, most
+        # significant word first.
+        dump = _bios_command(ser, "mem_read 0x{:08x} 8".format(hash_addr),
+            re.compile(r"0x{:08x} +((?:[0-9a-f]{{2}} ){{8}})".format(hash_addr)), timeout)
+
+    value = None
+    if dump is not None:
+        hi, lo = struct.unpack("<II", bytes(int(b, 16) for b in dump.split()))
+        value = (hi << 32) | lo
+    return ident, value
+
+# True if the board on port runs a FeatherSoC with the same build hash as
+# the bitstream in gateware_dir. That is the hash recorded when the
+# bitstream was built, not the hash of the design just generated, which
+# differs if it changed since (e.g. --load without --build).
+def board_runs(soc, port, gateware_dir, timeout=2):
+    if "build_hash" not in soc.csr.regions:
+        print("No build_hash CSR in this design (see --with build_hash), loading.")
+        return False
+    build_hash = read_build_hash(gateware_dir, soc.build_name)
+    if build_hash is None:
+        print("No build hash for this bitstream, loading.")
+        return False
+
+    try:
+        ident, value = query_board(port, soc.csr.regions["build_hash"].origin, timeout)
+    except OSError as e:
+        print("Can't query the board on {} ({}), loading.".format(port, e))
+        return False
+
+    if ident is None or not ident.startswith(IDENT) or value is None:
+        print("Board on {} isn't at a FeatherSoC BIOS prompt, loading.".format(port))
+        return False
+    print("Board runs: {} (build hash {:016x})".format(ident, value))
+    if value != build_hash:
+        print("Build hash differs from this bitstream's ({:016x}), loading.".format(build_hash))
+        return False
+    return True
+
+# Loading ------------------------------------------------------------------------------------------
+
+# Paths of the attached OrangeCrab bootloaders, as dfu-util lists them.
+def list_dfu_devices(dfu_util="dfu-util"):
+    out = subprocess.run([dfu_util, "-l"], stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT, universal_newlines=True).stdout
+    paths = []
+    for line in out.splitlines():
+        match = re.search(r"\[{}\].*path=\"([^\"]+)\"".format(DFU_DEVICE), line)
+        if match and match.group(1) not in paths:
+            paths.append(match.group(1))
+    return paths
+
+# With wait, dfu-util waits for the bootloader to appear.
+def load_bitstream(filename, dfu_util="dfu-util", verify=True, path=None, wait=False, quiet=False):
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    device_args = ["-d", DFU_DEVICE]
+    if path is not None:
+        device_args += ["-p", path]
+    if wait:
+        device_args += ["-w"]
+    elapsed, verified = dfu_load(data, BITSTREAM_ALT, dfu_util, verify,
+        device_args = device_args,
+        reset       = True,
+        quiet       = quiet)
+    report("Bitstream" if path is None else "Bitstream ({})".format(path),
+        len(data), elapsed, zlib.crc32(data), verified)
+    return verified is not False
+
+# Load every attached board at once. A board that fails doesn't stop the
+# others; returns the paths of those that failed.
+def load_many(filename, dfu_util="dfu-util", verify=True, jobs=None):
+    paths = list_dfu_devices(dfu_util)
+    if not paths:
+        raise OSError("No OrangeCrab bootloader ({}) found.".format(DFU_DEVICE))
+    print("Loading {} boards: {}".format(len(paths), ", ".join(paths)))
+
+    def load_one(path):
+        try:
+            return load_bitstream(filename, dfu_util, verify, path=path, quiet=True)
+        except OSError as e:
+            print("{}: {}".format(path, e))
+            return False
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=jobs or len(paths)) as pool:
+        results = list(pool.map(load_one, paths))
+    failed = [path for path, ok in zip(paths, results) if not ok]
+    print("Loaded {} of {} boards in {:.2f}s.".format(len(paths) - len(failed),
+        len(paths), time.monotonic() - start))
+    return failed
+
+# Command Line -------------------------------------------------------------------------------------
+
+def load_args(parser):
+    parser.add_argument("--load-port",       default=None,         help="Serial port of the board's console; --load is skipped if it already runs this design")
+    parser.add_argument("--force-load",      action="store_true",  help="Load even if the board already runs this design")
+    parser.add_argument("--load-no-verify",  action="store_true",  help="Skip reading the bitstream back after loading")
+    parser.add_argument("--load-many",       action="store_true",  help="Load the bitstream onto every attached board in DFU mode at once")
+    parser.add_argument("--dfu-util",        default="dfu-util",   help="dfu-util executable")
+
+def load(args, soc, builder):
+    filename = os.path.join(builder.gateware_dir, soc.build_name + ".bit")
+    if not shutil.which(args.dfu_util):
+        raise OSError("{} not found.".format(args.dfu_util))
+
+    if args.load_many:
+        if load_many(filename, args.dfu_util, verify=not args.load_no_verify, jobs=args.jobs):
+            sys.exit(1)
+        return
+
+    # A board that answered on its console runs the SoC, not the bootloader.
+    wait = False
+    if args.load_port and not args.force_load:
+        if board_runs(soc, args.load_port, builder.gateware_dir):
+            print("Board already runs this design, skipping load.")
+            return
+        print("Waiting for the bootloader (hold the button while plugging the board in)...")
+        wait = True
+    if not load_bitstream(filename, args.dfu_util, verify=not args.load_no_verify, wait=wait):
+        sys.exit(1)
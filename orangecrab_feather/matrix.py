@@ -0,0 +1,141 @@
+import os
+import copy
+import argparse
+import json
+import time
+import itertools
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+from .report import *
+
+# Build several FeatherSoC variants in parallel. A matrix is either a JSON
+# file or a spec string on the command line:
+#
+#   revision=0.1,0.2;device=25F,85F;integrated-main-ram-size=0,0x4000
+#
+# A spec string (or a JSON object mapping option names to lists of values)
+# is expanded as a cross product. A JSON list of objects gives the variants
+# explicitly. Option names are the long command line options, with or
+# without leading dashes.
+
+def _dest(name):
+    return name.lstrip("-").replace("-", "_")
+
+
+def parse_matrix(spec):
+    if os.path.isfile(spec):
+        with open(spec) as f:
+            matrix = json.load(f)
+    else:
+        matrix = {}
+        for axis in filter(None, spec.split(";")):
+            name, values = axis.split("=", 1)
+            matrix[name.strip()] = [v.strip() for v in values.split(",")]
+
+    if isinstance(matrix, list):
+        return [{_dest(k): v for k, v in variant.items()} for variant in matrix]
+
+    names = [_dest(k) for k in matrix.keys()]
+    return [dict(zip(names, values)) for values in itertools.product(*matrix.values())]
+
+
+def variant_name(variant):
+    return "-".join("{}_{}".format(k, v) for k, v in variant.items()) or "default"
+
+
+BOOLEANS = {
+    "true":  True,  "yes": True,  "on":  True,  "1": True,
+    "false": False, "no":  False, "off": False, "0": False,
+}
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    key = str(value).strip().lower()
+    if key not in BOOLEANS:
+        raise ValueError("Not a boolean: {}".format(value))
+    return BOOLEANS[key]
+
+
+# Apply a variant on top of the base command line, converting string values
+# the same way argparse would have. Options are looked up by their name on
+# the command line (e.g. "with" for --with) or by their dest
+# ("with_peripherals"). Flags (store_true/store_false) take a boolean:
+# true/false, yes/no, on/off or 1/0.
+def variant_args(parser, args, variant, output_dir):
+    actions = {action.dest: action for action in parser._actions}
+    for action in parser._actions:
+        for option in action.option_strings:
+            actions.setdefault(_dest(option), action)
+    vargs = copy.copy(args)
+    for name, value in variant.items():
+        if name not in actions:
+            raise ValueError("Unknown matrix option {}".format(name))
+        action = actions[name]
+        if isinstance(action, (argparse._StoreTrueAction, argparse._StoreFalseAction)):
+            value = _parse_bool(value)
+        elif isinstance(value, str) and action.type is not None:
+            value = action.type(value)
+        setattr(vargs, action.dest, value)
+    vargs.output_dir = output_dir
+    vargs.matrix = None
+    vargs.load = False
+    vargs.load_many = False
+    return vargs
+
+
+def _run_variant(build, name, vargs):
+    start = time.time()
+    result = {"name": name, "ok": False, "fmax": {}, "utilization": {}}
+    try:
+        builder = build(vargs)
+        result["ok"] = True
+        log = build_log(builder.gateware_dir, builder.soc.build_name)
+        if os.path.exists(log):
+            result.update(parse_nextpnr_log(log))
+    except Exception:
+        result["error"] = traceback.format_exc()
+    result["time"] = time.time() - start
+    return result
+
+
+def run_matrix(parser, args, build, jobs=None):
+    base_dir = args.output_dir or os.path.join("build", "matrix")
+    variants = parse_matrix(args.matrix)
+
+    work = []
+    for variant in variants:
+        name = variant_name(variant)
+        work.append((name, variant_args(parser, args, variant, os.path.join(base_dir, name))))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(_run_variant, build, name, vargs) for name, vargs in work]
+        results = [f.result() for f in futures]
+
+    print_summary(results)
+    return results
+
+
+def print_summary(results):
+    if not results:
+        print()
+        print("No variants to build.")
+        return
+    width = max(len(r["name"]) for r in results)
+    print()
+    print("{:<{w}}  {:<6}  {:>8}  {}".format("Variant", "Status", "Time (s)", "Fmax (MHz) / Utilization", w=width))
+    for r in results:
+        status = "ok" if r["ok"] else "FAILED"
+        if r["ok"] and r["fmax"] and timing_margin(r["fmax"]) < 1.0:
+            status = "timing"
+        print("{:<{w}}  {:<6}  {:>8.1f}  {}".format(r["name"], status, r["time"],
+            format_fmax(r["fmax"]), w=width))
+        if r["utilization"]:
+            print("{:<{w}}  {:<6}  {:>8}  {}".format("", "", "",
+                format_utilization(r["utilization"]), w=width))
+    for r in results:
+        if not r["ok"]:
+            print()
+            print("{} failed:".format(r["name"]))
+            print(r["error"])
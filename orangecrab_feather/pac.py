@@ -1,43 +1,76 @@
 import os
+import re
+import hashlib
 import subprocess
-import shutil
 from string import Template
 
+from .ral import generate_ral
+from .hal import generate_hal
+from .profiler import generate_profile
+
+# Cargo decides what to rebuild from mtimes, so leave files alone unless
+# their contents would actually change. Returns True if the file was
+# written.
+def write_if_changed(filename, contents):
+    new_hash = hashlib.sha256(contents.encode()).digest()
+    if os.path.exists(filename):
+        with open(filename, "rb") as f:
+            if hashlib.sha256(f.read()).digest() == new_hash:
+                return False
+
+    with open(filename, "w") as f:
+        f.write(contents)
+    return True
+
+# Single-letter extensions of the ISA in a GCC -march string, e.g.
+# "rv32i2p0_mac" -> "imac". Multi-letter (z/s/x) extensions are ignored.
+def riscv_isa(gcc_flags):
+    m = re.search(r"-march=rv32(\S+)", gcc_flags)
+    if m is None:
+        raise ValueError("Not an RV32 CPU: {}".format(gcc_flags))
+
+    isa = ""
+    for ext in m.group(1).split("_"):
+        if ext[:1] in ("z", "s", "x"):
+            continue
+        isa += re.sub(r"\d+(p\d+)?", "", ext).replace("g", "imafd")
+    return "".join(e for e in "iemafdc" if e in isa)
+
+# Rust's bare-metal RV32 targets. Extensions the CPU has on top of the
+# closest one are turned on with target-feature. F/D are left off: LiteX
+# builds everything for the soft-float ilp32 ABI.
+RUST_TARGETS = [
+    ("imac", "riscv32imac-unknown-none-elf"),
+    ("imc",  "riscv32imc-unknown-none-elf"),
+    ("i",    "riscv32i-unknown-none-elf"),
+]
+
+def rust_target(isa):
+    for exts, target in RUST_TARGETS:
+        if all(e in isa for e in exts):
+            features = ["+" + e for e in "mac" if e in isa and e not in exts]
+            return target, features
+    raise ValueError("No Rust target for ISA rv32{}".format(isa))
+
 class PacBuilder:
-    # Exclude [dependencies] line, as it will already exist.
-    DEPS = """$rt_crate = "$rt_crate_version"
-$cpu_crate = "$cpu_crate_version"
+    CARGO_TOML = """[package]
+name = "litex-pac"
+version = "0.1.0"
+edition = "2018"
 
-[build-dependencies]
-svd2ral = { git = "https://github.com/Disasm/svd2ral" }
+[dependencies]
+$rt_crate = "$rt_crate_version"
+$cpu_crate = "$cpu_crate_version"
 """
 
-    BUILD_RS = """use std::fs::{self, File};
-use std::io::Read;
-use std::path::{Path, PathBuf};
-use std::env;
-use svd2ral::{generate, AddressSize};
-
-const SVD_FILE: &str = "$svd_file";
-const REGIONS_FILE: &str = "$regions";
+    # The register access code is generated by us, so all that's left for
+    # cargo to do is point the linker at regions.ld.
+    BUILD_RS = """const REGIONS_DIR: &str = "$regions_dir";
 
 fn main() {
     // Put the memory definitions somewhere the linker can find it
-    let out_dir = PathBuf::from(env::var("OUT_DIR").unwrap());
-    let dest_path = Path::new(&out_dir);
-    fs::copy(REGIONS_FILE, &dest_path.join("regions.ld")).unwrap();
-
-    let xml = &mut String::new();
-    File::open(SVD_FILE).unwrap().read_to_string(xml).unwrap();
-
-    let crate_dir = PathBuf::from(env::var("CARGO_MANIFEST_DIR").unwrap());
-    generate(&xml, crate_dir.join("src"), AddressSize::U32, &["IDENTIFIER_MEM"]).unwrap();
-
-    println!("cargo:rustc-link-search={}", out_dir.display());
-    println!("cargo:rerun-if-changed={}", REGIONS_FILE);
-    println!("cargo:rerun-if-changed={}", SVD_FILE);
+    println!("cargo:rustc-link-search={}", REGIONS_DIR);
     println!("cargo:rerun-if-changed=build.rs");
-    println!("cargo:rerun-if-env-changed=FORCE");
 }
 """
 
@@ -52,47 +85,114 @@ pub use crate::register::{RWRegister, UnsafeRWRegister};
 
 mod soc;
 pub use soc::*;
+$profile_mod"""
+
+    # Merged by cargo with the firmware crate's own config (which keeps the
+    # linker arguments), e.g. with "cargo build --config <this file>".
+    CARGO_CONFIG = """[build]
+target = "$target"
+
+[target.$target]
+rustflags = [$rustflags]
 """
 
+    # Peripherals svd2ral was told to skip; kept for the same reasons.
+    EXCLUDE = ["IDENTIFIER_MEM"]
+
+    # Runtime and CPU support crates for each LiteX CPU. Not PicoRV32: it has
+    # none of the machine-mode CSRs riscv-rt's startup code and
+    # riscv::interrupt::free() use, so firmware couldn't boot.
+    CPU_CRATES = {
+        "vexriscv":     ("riscv-rt", "0.8.0", "riscv", "0.6.0"),
+        "vexriscv_smp": ("riscv-rt", "0.8.0", "riscv", "0.6.0"),
+        "serv":         ("riscv-rt", "0.8.0", "riscv", "0.6.0"),
+        "minerva":      ("riscv-rt", "0.8.0", "riscv", "0.6.0"),
+    }
+
     def __init__(self, soc, builder):
         self.soc = soc
         self.software_dir = builder.software_dir
         self.rust_dir = os.path.join(builder.software_dir, "rust")
 
     def generate(self):
-        if self.soc.cpu_type in ["vexriscv"]:
-            rt_crate = "riscv-rt"
-            rt_crate_version = "0.8.0"
-            cpu_crate = "riscv"
-            cpu_crate_version = "0.6.0"
-        else:
+        if self.soc.cpu_type not in PacBuilder.CPU_CRATES:
             raise ValueError(f"Unsupported CPU {self.soc.cpu_type}")
+        rt_crate, rt_crate_version, cpu_crate, cpu_crate_version = \
+            PacBuilder.CPU_CRATES[self.soc.cpu_type]
+
+        isa = riscv_isa(self.soc.cpu.gcc_flags)
+        target, features = rust_target(isa)
+        rustflags = ["-C", "target-feature=" + ",".join(features)] if features else []
 
         cwd = os.getcwd()
         os.chdir(self.rust_dir)
 
-        if not os.path.exists("litex-pac"):
-            os.makedirs("litex-pac")
-
-        os.chdir("litex-pac")
-
-        if not os.path.exists("Cargo.toml"):
-            subprocess.check_call(["cargo", "init", "--lib", "--vcs", "none", "."])
-            with open("Cargo.toml", "a+") as f:
-                f.seek(0, 2)
-                f.write(Template(PacBuilder.DEPS)
-                    .substitute(rt_crate=rt_crate,
-                                rt_crate_version=rt_crate_version,
-                                cpu_crate=cpu_crate,
-                                cpu_crate_version=cpu_crate_version))
+        os.makedirs(".cargo", exist_ok=True)
+        cargo_config = Template(PacBuilder.CARGO_CONFIG).substitute(target=target,
+            rustflags=", ".join('"{}"'.format(f) for f in rustflags))
+        config_changed = write_if_changed(os.path.join(".cargo", "config"), cargo_config)
+
+        files = {
+            "Cargo.toml": Template(PacBuilder.CARGO_TOML)
+                .substitute(rt_crate=rt_crate,
+                            rt_crate_version=rt_crate_version,
+                            cpu_crate=cpu_crate,
+                            cpu_crate_version=cpu_crate_version),
+            "build.rs": Template(PacBuilder.BUILD_RS)
+                .substitute(regions_dir=os.path.join(self.software_dir, "include", "generated")
+                    .replace("\\", "/")),
+            "src/lib.rs": Template(PacBuilder.LIB_RS)
+                .substitute(cpu_crate=cpu_crate,
+                            profile_mod="\npub mod profile;\n" if "perf" in self.soc.csr.regions else ""),
+        }
+        for name, contents in generate_ral(self.soc, PacBuilder.EXCLUDE).items():
+            files["src/" + name] = contents
+        if "perf" in self.soc.csr.regions:
+            files["src/profile.rs"] = generate_profile(self.soc)
+
+        changed = [".cargo/config"] if config_changed else []
+        changed += self._write_crate("litex-pac", files)
+        if changed:
+            print("Rust PAC updated: {}".format(", ".join(changed)))
+        else:
+            print("Rust PAC is up to date.")
 
-        with open(os.path.join("build.rs"), "w") as f:
-            f.write(Template(PacBuilder.BUILD_RS)
-                .substitute(regions=os.path.join(self.software_dir, "include", "generated", "regions.ld"),
-                            svd_file=os.path.join(self.rust_dir, "csr.svd")))
+        hal_files, drivers = generate_hal(self.soc, cpu_crate, cpu_crate_version, PacBuilder.EXCLUDE)
+        changed = self._write_crate("litex-hal", hal_files)
+        if changed:
+            print("Rust HAL updated: {}".format(", ".join(changed)))
+        else:
+            print("Rust HAL is up to date.")
+        print("Rust HAL drivers: {}".format(", ".join("{} ({})".format(name, driver)
+            for name, driver in drivers.items()) or "none"))
 
-        with open(os.path.join("src", "lib.rs"), "w") as f:
-            f.write(Template(PacBuilder.LIB_RS)
-                .substitute(cpu_crate=cpu_crate))
+        print("Rust target for {} ({}, rv32{}): {}{}".format(self.soc.cpu_type,
+            self.soc.cpu_variant, isa, target,
+            " with " + ",".join(features) if features else ""))
 
         os.chdir(cwd)
+
+    # Write the files of the crate in directory crate_dir that changed, and
+    # remove anything else under src/: modules of peripherals that are no
+    # longer in the SoC, and leftovers from svd2ral-generated PACs. Returns
+    # the paths that changed.
+    def _write_crate(self, crate_dir, files):
+        changed = []
+        for name, contents in files.items():
+            filename = os.path.join(crate_dir, *name.split("/"))
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            if write_if_changed(filename, contents):
+                changed.append(name)
+
+        for root, dirs, filenames in os.walk(os.path.join(crate_dir, "src"), topdown=False):
+            for filename in filenames:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, crate_dir).replace(os.sep, "/")
+                if name not in files:
+                    os.remove(path)
+                    changed.append(name + " (removed)")
+            for dirname in dirs:
+                path = os.path.join(root, dirname)
+                if not os.listdir(path):
+                    os.rmdir(path)
+        return changed
@@ -0,0 +1,105 @@
+from migen import *
+
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+
+# Performance Counters -----------------------------------------------------------------------------
+
+class PerfCounters(Module, AutoCSR):
+    """Cycle, bus and L2 cache counters for profiling.
+
+    While ``enable`` is set, ``cycles`` counts clock cycles and, for each
+    Wishbone master ``m_<name>_*`` and slave ``s_<name>_*``, ``transactions``
+    counts acknowledged accesses and ``waits`` the cycles an access waited,
+    for arbitration or for the slave. With an L2 cache, ``l2_hits`` counts
+    accesses it served without a refill, ``l2_misses`` refills and
+    ``l2_writebacks`` dirty lines written back.
+
+    Counters don't stop at their maximum; stop counting before reading them
+    so they are consistent with each other.
+    """
+    def __init__(self, masters={}, slaves={}, l2_cache=None):
+        self._control = CSRStorage(fields=[
+            CSRField("enable", size=1, offset=0, description="Count while set."),
+            CSRField("clear",  size=1, offset=1, pulse=True, description="Write ``1`` to zero every counter."),
+        ])
+        self._cycles = CSRStatus(64, description="Cycles counted.")
+
+        # # #
+
+        self.enable = enable = self._control.fields.enable
+        self.clear  = clear  = self._control.fields.clear
+
+        self.sync += [
+            If(clear,
+                self._cycles.status.eq(0)
+            ).Elif(enable,
+                self._cycles.status.eq(self._cycles.status + 1)
+            )
+        ]
+
+        for name, bus in masters.items():
+            self.add_bus(bus, "m_" + name, "master " + name)
+        for name, bus in slaves.items():
+            self.add_bus(bus, "s_" + name, "slave " + name)
+        if l2_cache is not None:
+            self.add_l2_cache(l2_cache)
+
+    def add_counter(self, name, event, description):
+        csr = CSRStatus(32, name=name, description=description)
+        setattr(self, "_" + name, csr)
+        self.sync += [
+            If(self.clear,
+                csr.status.eq(0)
+            ).Elif(self.enable & event,
+                csr.status.eq(csr.status + 1)
+            )
+        ]
+
+    def add_bus(self, bus, name, what):
+        self.add_counter(name + "_transactions", bus.cyc & bus.stb & bus.ack,
+            "Accesses of {}.".format(what))
+        self.add_counter(name + "_waits", bus.cyc & bus.stb & ~bus.ack,
+            "Cycles accesses of {} waited.".format(what))
+
+    # LiteX's L2 cache faces the CPU with its master interface and main RAM
+    # with its slave one. A miss refills a line, after writing the old one
+    # back if it is dirty.
+    def add_l2_cache(self, l2_cache):
+        access    = l2_cache.master.cyc & l2_cache.master.stb & l2_cache.master.ack
+        memory    = l2_cache.slave.cyc & l2_cache.slave.stb & l2_cache.slave.ack
+        refill    = memory & ~l2_cache.slave.we
+        writeback = memory & l2_cache.slave.we
+
+        refilled = Signal()
+        self.sync += If(access, refilled.eq(0)).Elif(refill, refilled.eq(1))
+
+        self.add_counter("l2_hits", access & ~refilled & ~refill,
+            "L2 cache accesses served without a refill.")
+        self.add_counter("l2_misses", refill,
+            "L2 cache lines refilled from main RAM.")
+        self.add_counter("l2_writebacks", writeback,
+            "Dirty L2 cache lines written back to main RAM.")
+
+# The buses PerfCounters can watch: the SoC's Wishbone masters and slaves
+# (after any width adaptation) and its L2 cache.
+def perf_counter_buses(soc):
+    masters = {name: bus for name, bus in soc.bus.masters.items()
+        if isinstance(bus, wishbone.Interface)}
+    slaves  = {name: bus for name, bus in soc.bus.slaves.items()
+        if isinstance(bus, wishbone.Interface)}
+    return masters, slaves, getattr(soc, "l2_cache", None)
+
+# Counter CSRs of a finalized SoC: (name, address, words) in CSR order, most
+# significant word first.
+def perf_counter_map(soc, name="perf"):
+    region = soc.csr.regions[name]
+    busword = soc.csr.data_width
+    counters = []
+    address = region.origin
+    for csr in region.obj:
+        words = (csr.size + busword - 1)//busword
+        if csr.name != "control":
+            counters.append((csr.name, address, words))
+        address += 4*words
+    return counters
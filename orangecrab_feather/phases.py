@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import contextlib
+
+# Build phase timing. Each phase records wall time, CPU time (ours plus that
+# of the child processes it waited for) and peak RSS. Phases nest; a phase's
+# numbers exclude the time spent in phases inside it.
+
+# The resource module is POSIX-only. Without it (Windows), CPU time is only
+# our own and peak RSS isn't reported.
+def _resource():
+    try:
+        import resource
+    except ImportError:
+        return None
+    return resource
+
+
+# ru_maxrss is in bytes on macOS, KiB elsewhere.
+def _maxrss_kib(ru):
+    if sys.platform == "darwin":
+        return ru.ru_maxrss//1024
+    return ru.ru_maxrss
+
+
+def _cpu_time():
+    resource = _resource()
+    if resource is None:
+        return time.process_time()
+    self_ru = resource.getrusage(resource.RUSAGE_SELF)
+    children_ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (self_ru.ru_utime + self_ru.ru_stime +
+        children_ru.ru_utime + children_ru.ru_stime)
+
+
+def _self_maxrss_kib():
+    resource = _resource()
+    if resource is None:
+        return 0
+    return _maxrss_kib(resource.getrusage(resource.RUSAGE_SELF))
+
+
+class BuildTimer:
+    def __init__(self):
+        self.phases = {}
+        self._stack = []
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        entry = {"wall": 0.0, "cpu": 0.0, "rss": None}
+        self._stack.append(entry)
+        wall = time.perf_counter()
+        cpu = _cpu_time()
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            wall = time.perf_counter() - wall
+            cpu = _cpu_time() - cpu
+            # Phases that run tools report the tools' peak RSS. Otherwise use
+            # our own, which is a high-water mark for the whole process and so
+            # only an upper bound.
+            rss = entry["rss"]
+            if rss is None:
+                rss = _self_maxrss_kib()
+
+            phase = self.phases.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "peak_rss_kib": 0})
+            phase["wall_s"] += wall - entry["wall"]
+            phase["cpu_s"] += cpu - entry["cpu"]
+            phase["peak_rss_kib"] = max(phase["peak_rss_kib"], rss)
+
+            if self._stack:
+                parent = self._stack[-1]
+                parent["wall"] += wall
+                parent["cpu"] += cpu
+
+    # Record the rusage of a child process reaped with os.wait4().
+    def add_child(self, ru):
+        if self._stack:
+            entry = self._stack[-1]
+            entry["rss"] = max(entry["rss"] or 0, _maxrss_kib(ru))
+
+    def total(self):
+        return {
+            "wall_s": sum(p["wall_s"] for p in self.phases.values()),
+            "cpu_s": sum(p["cpu_s"] for p in self.phases.values()),
+            "peak_rss_kib": max([p["peak_rss_kib"] for p in self.phases.values()], default=0),
+        }
+
+
+# Wait for a Popen process, passing its rusage to timer if there is one.
+def wait_process(proc, timer=None):
+    if timer is None or not hasattr(os, "wait4"):
+        return proc.wait()
+    _, status, ru = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    timer.add_child(ru)
+    return proc.returncode
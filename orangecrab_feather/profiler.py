@@ -0,0 +1,291 @@
+import re
+import json
+from string import Template
+
+from .perf import perf_counter_map
+
+# The two halves of profiling with the perf counters (--with perf): a
+# profile module for the PAC, which firmware uses to measure a piece of code
+# and print the counters as a "PERF {...}" line, and a host tool that reads
+# those lines from the console and prints them as a table. The host tool can
+# also drive the counters itself around a BIOS command.
+
+# PAC Module ---------------------------------------------------------------------------------------
+
+PROFILE_RS = """//! Profiling with the perf counters
+//!
+//! ```ignore
+//! let (result, profile) = litex_pac::profile::measure(|| work());
+//! writeln!(uart, "{}", profile.report("work")).ok();
+//! ```
+//!
+//! `python -m orangecrab_feather profile --port <console>` prints the
+//! `PERF` lines this writes as a table.
+
+use core::fmt;
+use core::ptr::{read_volatile, write_volatile};
+
+const CONTROL: *mut u32 = 0x$control as *mut u32;
+const ENABLE: u32 = 1 << $enable_offset;
+const CLEAR: u32 = 1 << $clear_offset;
+
+/// Counter names, in the order of `Profile::values`.
+pub const NAMES: [&str; $count] = [
+$names];
+
+// Address of each counter's most significant word, and its size in words.
+const COUNTERS: [(u32, u32); $count] = [
+$counters];
+
+/// Counter values of one measurement.
+#[derive(Clone, Copy)]
+pub struct Profile {
+    pub values: [u64; $count],
+    /// Instructions retired, if the CPU counts them ($cpu_type $cpu_variant: $instret_note).
+    pub instret: Option<u64>,
+}
+
+static mut INSTRET_START: u32 = 0;
+
+fn instret() -> Option<u32> {
+    $instret
+}
+
+fn read_counter(address: u32, words: u32) -> u64 {
+    let mut value = 0u64;
+    for i in 0..words {
+        let word = unsafe { read_volatile((address + 4*i) as *const u32) };
+        value = (value << 32) | word as u64;
+    }
+    value
+}
+
+/// Zero the counters and start counting.
+pub fn start() {
+    unsafe {
+        INSTRET_START = instret().unwrap_or(0);
+        write_volatile(CONTROL, CLEAR | ENABLE);
+    }
+}
+
+/// Stop counting and read the counters.
+pub fn stop() -> Profile {
+    unsafe { write_volatile(CONTROL, 0) };
+    let end = instret();
+
+    let mut values = [0u64; $count];
+    for (value, &(address, words)) in values.iter_mut().zip(COUNTERS.iter()) {
+        *value = read_counter(address, words);
+    }
+    Profile {
+        values,
+        instret: end.map(|end| end.wrapping_sub(unsafe { INSTRET_START }) as u64),
+    }
+}
+
+/// Run `f` with the counters counting.
+pub fn measure<R>(f: impl FnOnce() -> R) -> (R, Profile) {
+    start();
+    let result = f();
+    (result, stop())
+}
+
+impl Profile {
+    /// The value of the counter called `name`, e.g. `"cycles"` or `"l2_misses"`.
+    pub fn get(&self, name: &str) -> Option<u64> {
+        NAMES.iter().position(|&n| n == name).map(|i| self.values[i])
+    }
+
+    /// A `PERF` line for the host tool, with a label that has no quotes or
+    /// backslashes.
+    pub fn report<'a>(&'a self, label: &'a str) -> Report<'a> {
+        Report { profile: self, label }
+    }
+}
+
+pub struct Report<'a> {
+    profile: &'a Profile,
+    label: &'a str,
+}
+
+impl fmt::Display for Report<'_> {
+    fn fmt(&self, f: &mut fmt::Formatter) -> fmt::Result {
+        write!(f, "PERF {{\\"label\\": \\"{}\\"", self.label)?;
+        for (name, value) in NAMES.iter().zip(self.profile.values.iter()) {
+            write!(f, ", \\"{}\\": {}", name, value)?;
+        }
+        match self.profile.instret {
+            Some(instret) => write!(f, ", \\"instret\\": {}}}", instret),
+            None => write!(f, "}}"),
+        }
+    }
+}
+"""
+
+# CPUs whose instret counter LiteX builds in. VexRiscv only has it in its
+# full and Linux configurations.
+def cpu_has_instret(soc):
+    if soc.cpu_type == "vexriscv_smp":
+        return True
+    if soc.cpu_type == "vexriscv":
+        return any(v in (soc.cpu_variant or "standard") for v in ("full", "linux"))
+    return False
+
+def generate_profile(soc):
+    counters = perf_counter_map(soc)
+    control  = soc.csr.regions["perf"].origin
+    fields   = {f.name: f.offset for f in soc.perf._control.fields.fields}
+    has_instret = cpu_has_instret(soc)
+    return Template(PROFILE_RS).substitute(
+        control       = "{:08x}".format(control),
+        enable_offset = fields["enable"],
+        clear_offset  = fields["clear"],
+        count         = len(counters),
+        names         = "".join('    "{}",\n'.format(name) for name, address, words in counters),
+        counters      = "".join("    (0x{:08x}, {}),\n".format(address, words)
+            for name, address, words in counters),
+        cpu_type      = soc.cpu_type,
+        cpu_variant   = soc.cpu_variant or "standard",
+        instret_note  = "counted" if has_instret else "not counted",
+        instret       = "Some(crate::arch::register::instret::read() as u32)" if has_instret else "None")
+
+# Host Tool ----------------------------------------------------------------------------------------
+
+PERF_RE = re.compile(r"PERF (\{.*\})")
+
+def _percent(part, whole):
+    return "{:.1f}%".format(100*part/whole) if whole else "-"
+
+# Print one profile: a dict of counter values, as in a PERF line.
+def print_profile(profile, label=None):
+    cycles  = profile.get("cycles", 0)
+    instret = profile.get("instret")
+    print()
+    print("Profile{}: {} cycles".format(" " + label if label else "", cycles), end="")
+    if instret is not None:
+        print(", {} instructions (IPC {:.2f})".format(instret, instret/cycles if cycles else 0), end="")
+    print()
+
+    buses = []
+    for name in profile:
+        m = re.match(r"([ms])_(.+)_transactions$", name)
+        if m:
+            kind = {"m": "master", "s": "slave"}[m.group(1)]
+            waits = profile.get(name[:-len("transactions")] + "waits", 0)
+            buses.append((kind, m.group(2), profile[name], waits))
+    if buses:
+        width = max(len(bus) for kind, bus, t, w in buses)
+        print("  {:<6} {:<{w}}  {:>12}  {:>12}  {:>10}  {:>6}".format(
+            "", "Bus", "Transactions", "Wait states", "Waits/txn", "Busy", w=width))
+        for kind, bus, transactions, waits in buses:
+            print("  {:<6} {:<{w}}  {:>12}  {:>12}  {:>10}  {:>6}".format(
+                kind, bus, transactions, waits,
+                "{:.2f}".format(waits/transactions) if transactions else "-",
+                _percent(transactions + waits, cycles), w=width))
+
+    if "l2_hits" in profile:
+        hits, misses = profile["l2_hits"], profile["l2_misses"]
+        print("  L2 cache: {} hits, {} misses ({} hit rate), {} writebacks".format(
+            hits, misses, _percent(hits, hits + misses), profile.get("l2_writebacks", 0)))
+
+# Print a profile for each PERF line firmware writes to the console.
+def listen(ser, count=None, json_file=None):
+    profiles = []
+    line = b""
+    while count is None or len(profiles) < count:
+        line += ser.read(256)
+        *lines, line = line.split(b"\n")
+        for l in lines:
+            m = PERF_RE.search(l.decode(errors="replace"))
+            if not m:
+                continue
+            profile = json.loads(m.group(1))
+            print_profile(profile, profile.pop("label", None))
+            profiles.append(profile)
+            if json_file is not None:
+                with open(json_file, "w") as f:
+                    json.dump(profiles, f, indent=4)
+    return profiles
+
+# Counters from the C header LiteX generated: (name, address, words) as
+# perf_counter_map() gives for the SoC.
+def read_counter_map(csr_h):
+    with open(csr_h) as f:
+        header = f.read()
+    base = re.search(r"#define CSR_BASE (0x[0-9a-fA-F]+)", header)
+    base = int(base.group(1), 16) if base else 0
+
+    counters = {}
+    for name, expr in re.findall(r"#define CSR_PERF_(\w+)_ADDR \(?(.*?)\)?\s*$", header, re.M):
+        offset = re.search(r"(0x[0-9a-fA-F]+)L?\s*$", expr)
+        address = int(offset.group(1), 16) + (base if "CSR_BASE" in expr else 0)
+        size = re.search(r"#define CSR_PERF_{}_SIZE (\d+)".format(name), header)
+        counters[name.lower()] = (address, int(size.group(1)) if size else 1)
+    if "control" not in counters:
+        raise ValueError("No perf counters in {}; build with --with perf.".format(csr_h))
+    control = counters.pop("control")[0]
+    return control, [(name, address, words) for name, (address, words) in
+        sorted(counters.items(), key=lambda c: c[1][0])]
+
+# Run a BIOS command with the counters counting, reading and writing them
+# with the BIOS' mem_read/mem_write. Counting starts and stops a command
+# away from the one profiled, so the counts include a little of the BIOS.
+def profile_bios_command(ser, csr_h, command, timeout=60):
+    from .load import _bios_command
+
+    control, counters = read_counter_map(csr_h)
+    prompt = re.compile(r"(litex> )")
+
+    def bios(cmd):
+        if _bios_command(ser, cmd, prompt, timeout) is None:
+            raise OSError("No BIOS prompt after {}.".format(cmd or "a newline"))
+
+    ser.reset_input_buffer()
+    bios("")
+    bios("mem_write 0x{:08x} 0x{:x}".format(control, 0b11))
+    bios(command)
+    bios("mem_write 0x{:08x} 0".format(control))
+
+    profile = {}
+    for name, address, words in counters:
+        # CSR words are little-endian in memory, most significant word first.
+        dump = _bios_command(ser, "mem_read 0x{:08x} {}".format(address, 4*words),
+            re.compile(r"0x{:08x} +((?:[0-9a-f]{{2}} ){{{}}})".format(address, 4*words)), timeout)
+        if dump is None:
+            raise OSError("Can't read {} from the BIOS.".format(name))
+        data = bytes(int(b, 16) for b in dump.split())
+        value = 0
+        for i in range(words):
+            value = (value << 32) | int.from_bytes(data[4*i:4*i + 4], "little")
+        profile[name] = value
+        bios("")
+    print_profile(profile, command)
+    return profile
+
+# Command Line -------------------------------------------------------------------------------------
+
+def profile_args(subparsers):
+    parser = subparsers.add_parser("profile", help="Print profiles from the perf counters (--with perf)")
+    parser.add_argument("--port",      required=True,              help="Serial port of the board's console")
+    parser.add_argument("--baudrate",  default=115200, type=int,   help="Console baudrate (default: 115200)")
+    parser.add_argument("--count",     default=None, type=int,     help="Stop after this many PERF lines (default: run until interrupted)")
+    parser.add_argument("--json",      default=None,               help="Also write the profiles to this JSON file")
+    parser.add_argument("--command",   default=None,               help="Profile this BIOS command instead of listening for PERF lines")
+    parser.add_argument("--csr-h",     default="build/gsd_orangecrab/software/include/generated/csr.h",
+                                                                   help="LiteX's csr.h of the build, for --command")
+    parser.set_defaults(func=run_profiler)
+
+def run_profiler(args):
+    import serial
+
+    with serial.Serial(args.port, args.baudrate, timeout=0.1) as ser:
+        if args.command:
+            profile = profile_bios_command(ser, args.csr_h, args.command)
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump([profile], f, indent=4)
+            return
+        try:
+            listen(ser, args.count, args.json)
+        except KeyboardInterrupt:
+            pass
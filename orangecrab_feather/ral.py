@@ -0,0 +1,407 @@
+from litex.soc.doc.csr import DocumentedCSRRegion
+
+# Generate the Rust register access layer for the PAC straight from the
+# SoC's CSR map. The output follows what svd2ral produced from csr.svd (same
+# register names, offsets and RORegister/RWRegister/write_reg! API), but
+# without a build script having to fetch svd2ral and parse XML on every
+# clean firmware build.
+#
+# Register names, fields and offsets are derived the same way LiteX's SVD
+# export does it, so firmware written against the svd2ral PAC still builds.
+
+REGISTER_RS = """use core::cell::UnsafeCell;
+use core::ptr::{read_volatile, write_volatile};
+
+pub struct RWRegister<T> {
+    register: UnsafeCell<T>,
+}
+
+impl<T: Copy> RWRegister<T> {
+    #[inline(always)]
+    pub fn read(&self) -> T {
+        unsafe { read_volatile(self.register.get()) }
+    }
+
+    #[inline(always)]
+    pub fn write(&self, val: T) {
+        unsafe { write_volatile(self.register.get(), val) }
+    }
+}
+
+unsafe impl<T: Send> Sync for RWRegister<T> {}
+
+pub struct UnsafeRWRegister<T> {
+    register: UnsafeCell<T>,
+}
+
+impl<T: Copy> UnsafeRWRegister<T> {
+    #[inline(always)]
+    pub unsafe fn read(&self) -> T {
+        read_volatile(self.register.get())
+    }
+
+    #[inline(always)]
+    pub unsafe fn write(&self, val: T) {
+        write_volatile(self.register.get(), val)
+    }
+}
+
+unsafe impl<T: Send> Sync for UnsafeRWRegister<T> {}
+
+pub struct RORegister<T> {
+    register: UnsafeCell<T>,
+}
+
+impl<T: Copy> RORegister<T> {
+    #[inline(always)]
+    pub fn read(&self) -> T {
+        unsafe { read_volatile(self.register.get()) }
+    }
+}
+
+unsafe impl<T: Send> Sync for RORegister<T> {}
+
+pub struct UnsafeRORegister<T> {
+    register: UnsafeCell<T>,
+}
+
+impl<T: Copy> UnsafeRORegister<T> {
+    #[inline(always)]
+    pub unsafe fn read(&self) -> T {
+        read_volatile(self.register.get())
+    }
+}
+
+unsafe impl<T: Send> Sync for UnsafeRORegister<T> {}
+
+pub struct WORegister<T> {
+    register: UnsafeCell<T>,
+}
+
+impl<T: Copy> WORegister<T> {
+    #[inline(always)]
+    pub fn write(&self, val: T) {
+        unsafe { write_volatile(self.register.get(), val) }
+    }
+}
+
+unsafe impl<T: Send> Sync for WORegister<T> {}
+
+pub struct UnsafeWORegister<T> {
+    register: UnsafeCell<T>,
+}
+
+impl<T: Copy> UnsafeWORegister<T> {
+    #[inline(always)]
+    pub unsafe fn write(&self, val: T) {
+        write_volatile(self.register.get(), val)
+    }
+}
+
+unsafe impl<T: Send> Sync for UnsafeWORegister<T> {}
+
+#[macro_export]
+macro_rules! write_reg {
+    ( $periph:path, $instance:expr, $reg:ident, $( $field:ident : $value:expr ),+ ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        #[allow(unused_imports)]
+        (*$instance).$reg.write(
+            $({ use $periph::{$reg::$field::{mask, offset, W::*, RW::*}}; ($value << offset) & mask }) | *
+        );
+    }};
+    ( $periph:path, $instance:expr, $reg:ident, $value:expr ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        (*$instance).$reg.write($value);
+    }};
+}
+
+#[macro_export]
+macro_rules! modify_reg {
+    ( $periph:path, $instance:expr, $reg:ident, $( $field:ident : $value:expr ),+ ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        #[allow(unused_imports)]
+        (*$instance).$reg.write(
+            ((*$instance).$reg.read() & !( $({ use $periph::{$reg::$field::mask}; mask }) | * ))
+            | $({ use $periph::{$reg::$field::{mask, offset, W::*, RW::*}}; ($value << offset) & mask }) | *);
+    }};
+    ( $periph:path, $instance:expr, $reg:ident, $fn:expr ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        (*$instance).$reg.write($fn((*$instance).$reg.read()));
+    }};
+}
+
+#[macro_export]
+macro_rules! read_reg {
+    ( $periph:path, $instance:expr, $reg:ident, $( $field:ident ),+ ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        let val = ((*$instance).$reg.read());
+        ( $({
+            #[allow(unused_imports)]
+            use $periph::{$reg::$field::{mask, offset, R::*, RW::*}};
+            (val & mask) >> offset
+        }) , *)
+    }};
+    ( $periph:path, $instance:expr, $reg:ident, $field:ident $($cmp:tt)* ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        #[allow(unused_imports)]
+        use $periph::{$reg::$field::{mask, offset, R::*, RW::*}};
+        (((*$instance).$reg.read() & mask) >> offset) $($cmp)*
+    }};
+    ( $periph:path, $instance:expr, $reg:ident ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        ((*$instance).$reg.read())
+    }};
+}
+
+#[macro_export]
+macro_rules! reset_reg {
+    ( $periph:path, $instance:expr, $instancemod:path, $reg:ident, $( $field:ident ),+ ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        use $periph::{$instancemod::{reset}};
+        #[allow(unused_imports)]
+        (*$instance).$reg.write({
+            let resetmask: u32 = $({
+                #[allow(unused_imports)]
+                use $periph::{$reg::$field::mask};
+                mask
+            }) | *;
+            ((*$instance).$reg.read() & !resetmask) | (reset.$reg & resetmask)
+        });
+    }};
+    ( $periph:path, $instance:expr, $instancemod:path, $reg:ident ) => {{
+        #[allow(unused_imports)]
+        use $periph::{*};
+        use $periph::{$instancemod::{reset}};
+        (*$instance).$reg.write(reset.$reg);
+    }};
+}
+"""
+
+PERIPHERAL_RS = """#![allow(non_snake_case, non_upper_case_globals)]
+#![allow(non_camel_case_types)]
+//! $name
+
+use crate::RWRegister;
+use core::marker::PhantomData;
+
+$field_mods
+#[repr(C)]
+pub struct RegisterBlock {
+$block_regs}
+
+pub struct ResetValues {
+$reset_regs}
+
+pub struct Instance {
+    pub(crate) addr: u32,
+    pub(crate) _marker: PhantomData<*const RegisterBlock>,
+}
+
+impl ::core::ops::Deref for Instance {
+    type Target = RegisterBlock;
+    #[inline(always)]
+    fn deref(&self) -> &RegisterBlock {
+        unsafe { &*(self.addr as *const _) }
+    }
+}
+$irq
+/// Access functions for the $INST peripheral instance
+pub mod $INST {
+    use super::ResetValues;
+    use super::Instance;
+
+    const INSTANCE: Instance = Instance {
+        addr: 0x$base,
+        _marker: ::core::marker::PhantomData,
+    };
+
+    /// Reset values for each field in $INST
+    pub const reset: ResetValues = ResetValues {
+$reset_vals    };
+
+    #[allow(renamed_and_removed_lints)]
+    #[allow(private_no_mangle_statics)]
+    #[no_mangle]
+    static mut $INST_TAKEN: bool = false;
+
+    /// Safe access to $INST
+    ///
+    /// This function returns `Some(Instance)` if this instance is not
+    /// currently taken, and `None` if it is. This ensures that if you
+    /// do get `Some(Instance)`, you are ensured unique access to
+    /// the peripheral and there cannot be data races (unless other
+    /// code uses `unsafe`, of course). You can then pass the
+    /// `Instance` around to other functions as required. When you're
+    /// done with it, you can call `release(instance)` to return it.
+    ///
+    /// `Instance` itself dereferences to a `RegisterBlock`, which
+    /// provides access to the peripheral's registers.
+    #[inline]
+    pub fn take() -> Option<Instance> {
+        crate::arch::interrupt::free(|_| unsafe {
+            if $INST_TAKEN {
+                None
+            } else {
+                $INST_TAKEN = true;
+                Some(INSTANCE)
+            }
+        })
+    }
+
+    /// Release exclusive access to $INST
+    ///
+    /// This function allows you to return an `Instance` so that it
+    /// is available to `take()` again. This function will panic if
+    /// you return a different `Instance` or if this instance is not
+    /// already taken.
+    #[inline]
+    pub fn release(inst: Instance) {
+        crate::arch::interrupt::free(|_| unsafe {
+            if $INST_TAKEN && inst.addr == INSTANCE.addr {
+                $INST_TAKEN = false;
+            } else {
+                panic!("Released a peripheral which was not taken");
+            }
+        });
+    }
+
+    /// Unsafely steal $INST
+    ///
+    /// This function is similar to take() but forcibly takes the
+    /// Instance, marking it as taken irregardless of its previous
+    /// state.
+    #[inline]
+    pub unsafe fn steal() -> Instance {
+        $INST_TAKEN = true;
+        INSTANCE
+    }
+}
+
+/// Raw pointer to $INST
+///
+/// Dereferencing this is unsafe because you are not ensured unique
+/// access to the peripheral, so you may encounter data races with
+/// other users of this peripheral. It is up to you to ensure you
+/// will not cause data races.
+///
+/// This constant is provided for ease of use in unsafe code: you can
+/// simply call for example `write_reg!(gpio, GPIOA, ODR, 1);`.
+pub const $INST: *const RegisterBlock = 0x$base as *const _;
+"""
+
+
+class Register:
+    def __init__(self, name, reset, fields):
+        self.name = name
+        self.reset = reset
+        self.fields = fields
+
+
+class Peripheral:
+    def __init__(self, name, base, registers, irq=None):
+        self.name = name
+        self.base = base
+        self.registers = registers
+        self.irq = irq
+
+
+# Walk the CSR regions the same way litex.soc.integration.export.get_csr_svd
+# does. Every CSR word gets its own 32-bit slot.
+def collect_peripherals(soc, exclude=()):
+    peripherals = []
+    for region_name, region in soc.csr.regions.items():
+        if region_name.upper() in exclude:
+            continue
+
+        documented = DocumentedCSRRegion(
+            name           = region_name,
+            region         = region,
+            csr_data_width = soc.csr.data_width)
+
+        registers = []
+        for csr in documented.csrs:
+            length = ((csr.size + documented.busword - 1)//documented.busword)*documented.busword
+            if len(csr.fields) > 0:
+                fields = [(f.name, f.offset, f.size) for f in csr.fields]
+            else:
+                field_name = csr.short_name.lower()
+                # Strip off "ev_" from eventmanager fields
+                if field_name in ("ev_enable", "ev_pending", "ev_status"):
+                    field_name = field_name[3:]
+                fields = [(field_name, 0, min(length, 32))]
+            registers.append(Register(csr.short_numbered_name.upper(), csr.reset_value, fields))
+
+        peripherals.append(Peripheral(region_name, region.origin, registers,
+            soc.irq.locs.get(region_name)))
+    return peripherals
+
+
+def _field_mod(reg):
+    r = "/// {}\n".format(reg.name)
+    r += "pub mod {} {{\n".format(reg.name)
+    for name, offset, size in reg.fields:
+        r += "\n"
+        r += "    pub mod {} {{\n".format(name.upper())
+        r += "        /// Offset ({} bits)\n".format(offset)
+        r += "        pub const offset: u32 = {};\n".format(offset)
+        r += "        /// Mask ({} bits: 0x{:x} << {})\n".format(size, (1 << size) - 1, offset)
+        r += "        pub const mask: u32 = 0x{:x} << offset;\n".format((1 << size) - 1)
+        r += "        /// Read-only values (empty)\n"
+        r += "        pub mod R {}\n"
+        r += "        /// Write-only values (empty)\n"
+        r += "        pub mod W {}\n"
+        r += "        /// Read-write values (empty)\n"
+        r += "        pub mod RW {}\n"
+        r += "    }\n"
+    r += "}\n"
+    return r
+
+
+def peripheral_rs(periph):
+    inst = periph.name.upper()
+    irq = ""
+    if periph.irq is not None:
+        irq = "\n/// Interrupt line of this peripheral\npub const IRQ: u32 = {};\n".format(periph.irq)
+
+    return (PERIPHERAL_RS
+        .replace("$field_mods", "".join(_field_mod(r) for r in periph.registers))
+        .replace("$block_regs", "".join("    pub {}: RWRegister<u32>,\n".format(r.name)
+            for r in periph.registers))
+        .replace("$reset_regs", "".join("    pub {}: u32,\n".format(r.name)
+            for r in periph.registers))
+        .replace("$reset_vals", "".join("        {}: 0x{:08x},\n".format(r.name, r.reset & 0xffffffff)
+            for r in periph.registers))
+        .replace("$irq", irq)
+        .replace("$name", periph.name)
+        .replace("$base", "{:08x}".format(periph.base))
+        .replace("$INST", inst))
+
+
+def soc_mod_rs(peripherals):
+    r = "#![allow(non_snake_case, non_upper_case_globals)]\n"
+    r += "#![allow(non_camel_case_types)]\n"
+    r += "//! Peripherals of the SoC's CSR bus\n\n"
+    for periph in peripherals:
+        r += "pub mod {};\n".format(periph.name)
+    return r
+
+
+# Returns a dict of paths relative to the crate's src/ directory and their
+# contents.
+def generate_ral(soc, exclude=("IDENTIFIER_MEM",)):
+    peripherals = collect_peripherals(soc, exclude)
+    files = {
+        "register.rs": REGISTER_RS,
+        "soc/mod.rs": soc_mod_rs(peripherals),
+    }
+    for periph in peripherals:
+        files["soc/{}.rs".format(periph.name)] = peripheral_rs(periph)
+    return files
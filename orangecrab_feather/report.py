@@ -0,0 +1,165 @@
+import os
+import re
+
+# Helpers to pull timing and utilization out of the toolchain log that
+# FeatherBuilder saves as <build_name>.log.
+
+FMAX_RE = re.compile(r"Max frequency for clock\s+'([^']+)':\s+([\d.]+) MHz \((PASS|FAIL) at ([\d.]+) MHz\)")
+UTIL_RE = re.compile(r"^Info:\s+(\w+):\s+(\d+)/\s*(\d+)\s+\d+%", re.M)
+YOSYS_CELL_RE = re.compile(r"^\s+(?:([A-Za-z_$][\w$]*)\s+(\d+)|(\d+)\s+(?:[\d.]+\s+)?([A-Za-z_$][\w$]*))\s*$")
+
+
+def parse_nextpnr_log(path):
+    with open(path, "r", errors="replace") as f:
+        log = f.read()
+
+    # nextpnr reports Fmax after placement and again after routing; the
+    # later (post-route) numbers win.
+    fmax = {}
+    for clk, achieved, status, target in FMAX_RE.findall(log):
+        fmax[clk] = {
+            "achieved": float(achieved),
+            "target": float(target),
+            "pass": status == "PASS",
+        }
+
+    utilization = {}
+    for bel, used, total in UTIL_RE.findall(log):
+        utilization[bel] = {"used": int(used), "total": int(total)}
+
+    return {"fmax": fmax, "utilization": utilization}
+
+
+def build_log(gateware_dir, build_name):
+    return os.path.join(gateware_dir, build_name + ".log")
+
+
+# Worst ratio of achieved to target frequency over all clocks. Anything
+# >= 1.0 met timing.
+def timing_margin(fmax):
+    if not fmax:
+        return None
+    return min(v["achieved"]/v["target"] for v in fmax.values())
+
+
+def format_fmax(fmax):
+    return ", ".join("{}={:.1f}".format(clk.replace("$glbnet$", ""), v["achieved"])
+        for clk, v in sorted(fmax.items()))
+
+
+def format_utilization(utilization, bels=("TRELLIS_SLICE", "TRELLIS_FF", "DP16KD", "MULT18X18D")):
+    return ", ".join("{}={}/{}".format(bel, utilization[bel]["used"], utilization[bel]["total"])
+        for bel in bels if bel in utilization)
+
+
+# Cell counts from the last "stat" in Yosys' report (<build_name>.rpt).
+# Depending on the Yosys version the count comes before or after the name.
+def parse_yosys_report(path):
+    with open(path, "r", errors="replace") as f:
+        lines = f.read().splitlines()
+
+    starts = [i for i, l in enumerate(lines) if "Number of cells" in l]
+    cells = {}
+    if not starts:
+        return cells
+    for line in lines[starts[-1] + 1:]:
+        m = YOSYS_CELL_RE.match(line)
+        if not m:
+            if cells:
+                break
+            continue
+        name, count = (m.group(1), m.group(2)) if m.group(1) else (m.group(4), m.group(3))
+        cells[name] = int(count)
+    return cells
+
+
+# LUT/FF/BRAM/DSP usage. nextpnr has the totals; LUTs and FFs come from
+# Yosys when nextpnr only reports slices (2 LUT4s and 2 FFs each).
+def resource_summary(utilization, cells):
+    def bel(name, cell=None):
+        if name in utilization:
+            return dict(utilization[name])
+        if cell in cells:
+            return {"used": cells[cell], "total": None}
+        return None
+
+    lut = bel("TRELLIS_COMB", "LUT4")
+    ff  = bel("TRELLIS_FF", "TRELLIS_FF")
+    for r in (lut, ff):
+        if r is not None and r["total"] is None and "TRELLIS_SLICE" in utilization:
+            r["total"] = 2*utilization["TRELLIS_SLICE"]["total"]
+
+    return {
+        "lut":  lut,
+        "ff":   ff,
+        "bram": bel("DP16KD", "DP16KD"),
+        "dsp":  bel("MULT18X18D", "MULT18X18D"),
+    }
+
+
+def bitstream_sizes(gateware_dir, build_name):
+    sizes = {}
+    for ext in (".bit", ".svf"):
+        path = os.path.join(gateware_dir, build_name + ext)
+        if os.path.exists(path):
+            sizes[ext[1:]] = os.path.getsize(path)
+    return sizes
+
+
+# What a build saves over a baseline build, e.g. the full profile of the same
+# configuration: resources and toolchain time (positive is less than the
+# baseline) and Fmax (positive is faster).
+def compare_reports(report, baseline):
+    resources = {}
+    for name, r in report["resources"].items():
+        b = baseline.get("resources", {}).get(name)
+        if r is not None and b is not None:
+            resources[name] = b["used"] - r["used"]
+
+    phases = ("synth", "pnr", "pack")
+    def toolchain_time(rep):
+        return sum(rep.get("phases", {}).get(p, {}).get("wall_s", 0) for p in phases)
+
+    fmax = {}
+    for clk, v in report["fmax"].items():
+        if clk in baseline.get("fmax", {}):
+            fmax[clk] = v["achieved"] - baseline["fmax"][clk]["achieved"]
+
+    return {
+        "resources":   resources,
+        "toolchain_s": toolchain_time(baseline) - toolchain_time(report),
+        "fmax":        fmax,
+    }
+
+
+def format_savings(saved):
+    parts = ["{}={}".format(name, n) for name, n in sorted(saved["resources"].items())]
+    parts.append("toolchain={:.1f}s".format(saved["toolchain_s"]))
+    parts += ["fmax {}={:+.1f}MHz".format(clk.replace("$glbnet$", ""), d)
+        for clk, d in sorted(saved["fmax"].items())]
+    return ", ".join(parts)
+
+
+# Everything FeatherBuilder knows about a build, for tracking build time and
+# timing across commits.
+def build_report(gateware_dir, build_name, timer, peripherals=None):
+    report = {
+        "build_name": build_name,
+        "peripherals": sorted(peripherals) if peripherals is not None else None,
+        "phases": timer.phases,
+        "total": timer.total(),
+        "fmax": {},
+        "utilization": {},
+        "resources": {},
+        "bitstream": bitstream_sizes(gateware_dir, build_name),
+    }
+
+    log = build_log(gateware_dir, build_name)
+    if os.path.exists(log):
+        report.update(parse_nextpnr_log(log))
+
+    rpt = os.path.join(gateware_dir, build_name + ".rpt")
+    cells = parse_yosys_report(rpt) if os.path.exists(rpt) else {}
+    report["resources"] = resource_summary(report["utilization"], cells)
+
+    return report
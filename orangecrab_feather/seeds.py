@@ -0,0 +1,136 @@
+import os
+import sys
+import json
+import shlex
+import shutil
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from .report import *
+
+# Run nextpnr with several placement seeds on a single synthesized design
+# and keep the bitstream with the best timing. We reuse the script LiteX
+# generated: everything before nextpnr (Yosys) runs once in the gateware
+# dir, and the nextpnr/ecppack lines are rerun per seed in a subdirectory.
+class SeedSweep:
+    def __init__(self, gateware_dir, build_name, seeds, jobs=None, stop_on_pass=False):
+        self.gateware_dir = gateware_dir
+        self.build_name = build_name
+        self.seeds = list(seeds)
+        self.jobs = jobs
+        self.stop_on_pass = stop_on_pass
+
+        self._stop = threading.Event()
+        self._procs = []
+        self._lock = threading.Lock()
+
+    def _split_script(self):
+        if sys.platform in ("win32", "cygwin"):
+            raise OSError("Seed sweeps are only supported with bash build scripts.")
+
+        with open(os.path.join(self.gateware_dir, "build_" + self.build_name + ".sh")) as f:
+            lines = f.read().splitlines()
+
+        for i, line in enumerate(lines):
+            if line.startswith("nextpnr-ecp5"):
+                break
+        else:
+            raise OSError("No nextpnr invocation found in build script.")
+
+        synth = lines[:i]
+        pnr = [shlex.split(l) for l in lines[i:] if l.strip() and not l.startswith("#")]
+        return synth, pnr
+
+    # Inputs shared by all seeds live one level up; outputs stay local.
+    def _seed_cmd(self, cmd, seed):
+        shared = [self.build_name + ext for ext in (".json", ".lpf")]
+        out = []
+        it = iter(cmd)
+        for arg in it:
+            if arg == "--seed":
+                next(it)
+                out += ["--seed", str(seed)]
+            elif arg in shared:
+                out.append(os.path.join("..", arg))
+            else:
+                out.append(arg)
+        if cmd[0] == "nextpnr-ecp5" and "--seed" not in cmd:
+            out += ["--seed", str(seed)]
+        return out
+
+    def _run_seed(self, seed, pnr):
+        seed_dir = os.path.join(self.gateware_dir, "seed_{}".format(seed))
+        os.makedirs(seed_dir, exist_ok=True)
+        log_path = build_log(seed_dir, self.build_name)
+        result = {"seed": seed, "ok": False, "fmax": {}, "utilization": {}}
+
+        with open(log_path, "w") as log:
+            for cmd in pnr:
+                if self._stop.is_set():
+                    result["skipped"] = True
+                    return result
+                proc = subprocess.Popen(self._seed_cmd(cmd, seed), cwd=seed_dir,
+                    stdout=log, stderr=subprocess.STDOUT)
+                with self._lock:
+                    self._procs.append(proc)
+                ret = proc.wait()
+                with self._lock:
+                    self._procs.remove(proc)
+                if ret != 0:
+                    result["skipped"] = self._stop.is_set()
+                    result.update(parse_nextpnr_log(log_path))
+                    return result
+
+        result["ok"] = True
+        result.update(parse_nextpnr_log(log_path))
+        result["margin"] = timing_margin(result["fmax"])
+
+        if self.stop_on_pass and result["margin"] is not None and result["margin"] >= 1.0:
+            self._stop.set()
+            with self._lock:
+                for proc in self._procs:
+                    proc.terminate()
+        return result
+
+    def run(self):
+        synth, pnr = self._split_script()
+
+        synth_script = os.path.join(self.gateware_dir, "synth_" + self.build_name + ".sh")
+        with open(synth_script, "w") as f:
+            f.write("\n".join(synth) + "\n")
+        if subprocess.call(["bash", os.path.basename(synth_script)], cwd=self.gateware_dir) != 0:
+            raise OSError("Error occured during Trellis's script execution.")
+
+        with ThreadPoolExecutor(max_workers=self.jobs or os.cpu_count()) as pool:
+            results = list(pool.map(lambda s: self._run_seed(s, pnr), self.seeds))
+
+        with open(os.path.join(self.gateware_dir, "seed_sweep.json"), "w") as f:
+            json.dump(results, f, indent=2)
+
+        self.print_summary(results)
+
+        placed = [r for r in results if r["ok"] and r.get("margin") is not None]
+        if not placed:
+            raise OSError("No seed produced a bitstream.")
+        best = max(placed, key=lambda r: r["margin"])
+
+        seed_dir = os.path.join(self.gateware_dir, "seed_{}".format(best["seed"]))
+        for ext in (".config", ".bit", ".svf", ".log"):
+            src = os.path.join(seed_dir, self.build_name + ext)
+            if os.path.exists(src):
+                shutil.copy2(src, os.path.join(self.gateware_dir, self.build_name + ext))
+        print("Using seed {} (timing margin {:.3f}).".format(best["seed"], best["margin"]))
+        return best
+
+    def print_summary(self, results):
+        print()
+        print("{:>6}  {:<8}  {}".format("Seed", "Status", "Fmax (MHz)"))
+        for r in results:
+            if r.get("skipped"):
+                status = "skipped"
+            elif not r["ok"]:
+                status = "FAILED"
+            else:
+                status = "pass" if (r["margin"] or 0) >= 1.0 else "timing"
+            print("{:>6}  {:<8}  {}".format(r["seed"], status, format_fmax(r["fmax"])))
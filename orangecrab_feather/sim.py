@@ -0,0 +1,298 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import subprocess
+
+from migen import *
+from migen.genlib.io import CRG
+from migen.fhdl.specials import Tristate
+
+from litex.build.generic_platform import Pins, Subsignal
+from litex.build.sim import SimPlatform
+from litex.build.sim.config import SimConfig
+from litex.soc.integration.soc_core import *
+from litex.soc.integration.common import get_mem_data
+from litex.soc.interconnect.csr import *
+
+from litedram import modules as litedram_modules
+from litedram.phy.model import sdram_module_nphases, get_sdram_phy_settings, SDRAMPHYModel
+
+from .feather_soc import FeatherSoC
+from .builder import FeatherBuilder
+from .args import selected_peripherals
+
+# Simulation of FeatherSoC under Verilator (litex_sim). The CPU, timer, main
+# RAM (BRAM, or a DRAM model with --integrated-main-ram-size=0) and Feather
+# peripherals are the same as on hardware. Stand-in pads loop the Feather
+# UART's TX back to RX and SPI MOSI back to MISO; the I2C bus has pull-ups
+# but no devices, so transactions are NACKed (which doesn't change their
+# timing). The ADC (--adc) sees a model of the board's RC network and
+# comparator, whose input level firmware sets through sim_analog. Undriven
+# GPIOs (--gpio) read 1, driven ones read back their output.
+
+# IOs ----------------------------------------------------------------------------------------------
+
+_io = [
+    ("sys_clk", 0, Pins(1)),
+    ("sys_rst", 0, Pins(1)),
+    ("serial", 0,
+        Subsignal("source_valid", Pins(1)),
+        Subsignal("source_ready", Pins(1)),
+        Subsignal("source_data",  Pins(8)),
+        Subsignal("sink_valid",   Pins(1)),
+        Subsignal("sink_ready",   Pins(1)),
+        Subsignal("sink_data",    Pins(8)),
+    ),
+]
+
+# Platform -----------------------------------------------------------------------------------------
+
+# Verilator has no pads to resolve a tristate with, so model an open-drain
+# line with a pull-up: the line reads back what is driven, or 1.
+class _SimTristateImpl(Module):
+    def __init__(self, target, o, oe, i):
+        self.comb += target.eq(Mux(oe, o, Replicate(1, len(target))))
+        if i is not None:
+            self.comb += i.eq(target)
+
+class _SimTristate:
+    @staticmethod
+    def lower(dr):
+        return _SimTristateImpl(dr.target, dr.o, dr.oe, dr.i)
+
+class FeatherSimPlatform(SimPlatform):
+    def __init__(self):
+        SimPlatform.__init__(self, "SIM", _io)
+
+    def get_verilog(self, *args, special_overrides=dict(), **kwargs):
+        so = {Tristate: _SimTristate}
+        so.update(special_overrides)
+        return SimPlatform.get_verilog(self, *args, special_overrides=so, **kwargs)
+
+# Analog input -------------------------------------------------------------------------------------
+
+# The ADC compares its input against an RC network it charges from ctrl. Model
+# the network's voltage as a fraction of full scale that moves 1/1024th of the
+# way towards ctrl every clock cycle. The extra fraction bits keep rounding
+# from biasing the loop.
+class _SimAnalog(Module, AutoCSR):
+    def __init__(self, pads):
+        self._level = CSRStorage(16, description="Simulated input level, as a fraction of full scale.")
+
+        # # #
+
+        v = Signal(24)
+        self.sync += v.eq(v + ((Mux(pads.ctrl[0], 2**24, 0) - v) >> 10))
+        self.comb += pads.sense.eq(Cat(Replicate(0, 8), self._level.storage) > v)
+
+# FeatherSimSoC ------------------------------------------------------------------------------------
+
+class FeatherSimSoC(FeatherSoC):
+    def __init__(self, sys_clk_freq=int(48e6), sdram_device="MT41K64M16", ram_init=[],
+                 spi_dma=False, feather_uart_baudrate=115200, feather_uart_tx_fifo_depth=16,
+                 feather_uart_rx_fifo_depth=16, feather_uart_rx_dma=False,
+                 i2c_burst=False, i2c_burst_dma=False, adc=False, gpio=False, perf=False, **kwargs):
+        platform = FeatherSimPlatform()
+
+        # SoCCore ----------------------------------------------------------------------------------
+        if kwargs.get("integrated_main_ram_size", 0):
+            kwargs["integrated_main_ram_init"] = ram_init
+        SoCCore.__init__(self, platform, sys_clk_freq,
+            uart_name      = "sim",
+            ident          = "FeatherSoC simulation (using LiteX)",
+            ident_version  = True,
+            **kwargs)
+
+        # CRG --------------------------------------------------------------------------------------
+        self.submodules.crg = CRG(platform.request("sys_clk"))
+
+        # DDR3 SDRAM model -------------------------------------------------------------------------
+        if not self.integrated_main_ram_size:
+            sdram_module_cls = getattr(litedram_modules, sdram_device)
+            sdram_rate       = "1:{}".format(sdram_module_nphases[sdram_module_cls.memtype])
+            sdram_module     = sdram_module_cls(sys_clk_freq, sdram_rate)
+            phy_settings     = get_sdram_phy_settings(
+                memtype    = sdram_module.memtype,
+                data_width = 16,
+                clk_freq   = sys_clk_freq)
+            self.submodules.sdrphy = SDRAMPHYModel(
+                module    = sdram_module,
+                settings  = phy_settings,
+                clk_freq  = sys_clk_freq,
+                init      = ram_init)
+            self.add_sdram("sdram",
+                phy                     = self.sdrphy,
+                module                  = sdram_module,
+                origin                  = self.mem_map["main_ram"],
+                size                    = kwargs.get("max_sdram_size", 0x40000000),
+                l2_cache_size           = kwargs.get("l2_size", 8192),
+                l2_cache_min_data_width = kwargs.get("min_l2_data_width", 128),
+                l2_cache_reverse        = kwargs.get("l2_reverse", True)
+            )
+            # The BIOS' memtest would overwrite the firmware and takes ages
+            # in simulation.
+            if ram_init:
+                self.add_constant("SDRAM_TEST_DISABLE")
+            else:
+                self.add_constant("MEMTEST_DATA_SIZE", 8*1024)
+                self.add_constant("MEMTEST_ADDR_SIZE", 8*1024)
+
+        if ram_init:
+            self.add_constant("ROM_BOOT_ADDRESS", self.mem_map["main_ram"])
+
+        # Feather peripherals with loopback pads ---------------------------------------------------
+        uart_pads = Record([("tx", 1), ("rx", 1)])
+        self.comb += uart_pads.rx.eq(uart_pads.tx)
+        self.add_feather_uart(uart_pads,
+            baudrate      = feather_uart_baudrate,
+            tx_fifo_depth = feather_uart_tx_fifo_depth,
+            rx_fifo_depth = feather_uart_rx_fifo_depth,
+            rx_dma        = feather_uart_rx_dma)
+
+        spi_pads = Record([("clk", 1), ("mosi", 1), ("miso", 1)])
+        self.comb += spi_pads.miso.eq(spi_pads.mosi)
+        self.add_feather_spi(spi_pads, dma=spi_dma)
+
+        self.add_feather_i2c(Record([("scl", 1), ("sda", 1)]),
+            burst     = i2c_burst,
+            burst_dma = i2c_burst_dma)
+
+        if adc:
+            adc_pads = Record([("ctrl", 1), ("sense", 1), ("mux", 4)])
+            self.submodules.sim_analog = _SimAnalog(adc_pads)
+            self.add_csr("sim_analog")
+            self.add_adc(adc_pads)
+
+        if gpio:
+            self.add_feather_gpio(Signal(13))
+
+        self.with_perf = perf
+
+
+def sim_config(sys_clk_freq):
+    config = SimConfig()
+    config.add_clocker("sys_clk", freq_hz=sys_clk_freq)
+    config.add_module("serial2console", "serial")
+    return config
+
+# Build --------------------------------------------------------------------------------------------
+
+def build_sim(args, ram_init=[], run=False):
+    sys_clk_freq = int(float(args.sys_clk_freq))
+    soc = FeatherSimSoC(
+        sys_clk_freq = sys_clk_freq,
+        sdram_device = args.sdram_device,
+        ram_init     = ram_init,
+        spi_dma      = args.spi_dma,
+        # Feather UART parameters
+        feather_uart_baudrate      = args.feather_uart_baudrate,
+        feather_uart_tx_fifo_depth = args.feather_uart_tx_fifo_depth,
+        feather_uart_rx_fifo_depth = args.feather_uart_rx_fifo_depth,
+        feather_uart_rx_dma        = args.feather_uart_rx_dma,
+        # I2C parameters
+        i2c_burst     = args.i2c_burst,
+        i2c_burst_dma = args.i2c_burst_dma,
+        adc           = args.adc,
+        gpio          = args.gpio,
+        perf          = "perf" in selected_peripherals(args),
+        # kwargs- SoC args
+        cpu_type                 = args.cpu_type,
+        cpu_variant              = args.cpu_variant,
+        integrated_rom_size      = args.integrated_rom_size,
+        integrated_sram_size     = args.integrated_sram_size,
+        integrated_main_ram_size = args.integrated_main_ram_size,
+        uart_fifo_depth          = args.uart_fifo_depth,
+        timer_uptime             = args.timer_uptime,
+        max_sdram_size           = args.max_sdram_size,
+        l2_size                  = args.l2_size,
+        min_l2_data_width        = args.min_l2_data_width,
+        l2_reverse               = not args.no_l2_reverse)
+
+    builder = FeatherBuilder(soc,
+        output_dir= args.output_dir or os.path.join("build", "sim"),
+        compile_software= not args.no_compile_software,
+        compile_gateware= False,
+        generate_doc= args.doc,
+        generate_pac= not args.no_pac)
+    builder.build(run=run, sim_config=sim_config(sys_clk_freq))
+    return builder
+
+# Compile the Verilator model LiteX generated and run it, echoing the
+# console and collecting "BENCH {...}" lines until the firmware is done.
+# The console is read on a thread, so that a simulation that hangs or goes
+# quiet still times out.
+def run_sim(gateware_dir, build_name="sim", timeout=600):
+    subprocess.run(["bash", "build_" + build_name + ".sh"], cwd=gateware_dir, check=True,
+        stdout=subprocess.DEVNULL)
+
+    results = []
+    done = False
+    proc = subprocess.Popen([os.path.join("obj_dir", "Vsim")], cwd=gateware_dir,
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        universal_newlines=True, errors="replace")
+    lines = queue.Queue()
+    def read():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+    threading.Thread(target=read, daemon=True).start()
+
+    deadline = time.monotonic() + timeout
+    try:
+        while True:
+            try:
+                line = lines.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise OSError("Simulation timed out after {}s.".format(timeout))
+            if line is None:
+                break
+            sys.stdout.write(line)
+            if line.startswith("BENCH "):
+                result = json.loads(line[len("BENCH "):])
+                if result.get("done"):
+                    done = True
+                    break
+                results.append(result)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+    if not done:
+        raise OSError("Simulation ended before the benchmark finished.")
+    return results
+
+# Benchmarks ---------------------------------------------------------------------------------------
+
+# Benchmark firmware under bench/ that is run in simulation by default.
+SIM_BENCHES = ["peripherals", "memory", "adc"]
+
+def run_sim_benchmarks(args, benches=SIM_BENCHES):
+    bench_root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench")
+
+    # Build once without firmware so the benchmarks have headers to compile
+    # against; the CSR map doesn't depend on the RAM contents.
+    builder = build_sim(args)
+    build_dir = os.path.abspath(builder.output_dir)
+
+    report = {"benches": {}}
+    for bench in benches:
+        bench_dir = os.path.join(bench_root, bench)
+        subprocess.run(["make", "-C", bench_dir, "BUILD_DIR=" + build_dir], check=True)
+
+        ram_init = get_mem_data(os.path.join(bench_dir, bench + ".bin"), endianness="little")
+        builder = build_sim(args, ram_init=ram_init)
+        results = run_sim(builder.gateware_dir, builder.soc.build_name, args.sim_timeout)
+        report["benches"][bench] = {r.pop("name"): r for r in results}
+
+    filename = os.path.join(build_dir, "sim_bench.json")
+    with open(filename, "w") as f:
+        json.dump(report, f, indent=4, sort_keys=True)
+    print("Benchmark results written to {}.".format(filename))
+    return report
@@ -0,0 +1,178 @@
+from migen import *
+
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.csr_eventmanager import *
+
+# SPI DMA ------------------------------------------------------------------------------------------
+
+class SPIDMA(Module, AutoCSR):
+    """SPI master (mode 0) which streams whole buffers between memory and the
+    SPI bus through its own Wishbone master, raising one interrupt when the
+    transfer is finished.
+
+    Buffers must be word-aligned: a transfer started with an enabled buffer
+    that isn't is refused, setting ``error`` and raising ``done`` without
+    touching the bus, as does a transfer of zero bytes. Transmit data is read from ``tx_base`` (or
+    ``0xff`` is sent if ``tx_enable`` is clear) and received data is written
+    to ``rx_base`` (unless ``rx_enable`` is clear). With a data cache, flush
+    it before starting a transfer and invalidate it afterwards.
+    """
+    def __init__(self, pads, sys_clk_freq, spi_clk_freq=12e6):
+        if pads is None:
+            pads = Record([("clk", 1), ("cs_n", 1), ("mosi", 1), ("miso", 1)])
+        self.pads = pads
+        self.bus  = bus = wishbone.Interface()
+
+        self._control = CSRStorage(fields=[
+            CSRField("start",     size=1, offset=0, pulse=True, description="Write ``1`` to start a transfer."),
+            CSRField("tx_enable", size=1, offset=1, reset=1,    description="Send data from ``tx_base``; send ``0xff`` when clear."),
+            CSRField("rx_enable", size=1, offset=2, reset=1,    description="Store received data at ``rx_base``."),
+        ])
+        self._status      = CSRStatus(fields=[
+            CSRField("busy",  size=1, offset=0, description="A transfer is in progress."),
+            CSRField("error", size=1, offset=1, description="The last transfer was refused because an enabled buffer isn't word-aligned."),
+        ])
+        self._cs          = CSRStorage(fields=[
+            CSRField("sel", size=1, offset=0, description="Assert chip select (if the pads have one)."),
+        ])
+        self._tx_base     = CSRStorage(32, description="Word-aligned address of the transmit buffer; transfers from an unaligned one are refused.")
+        self._rx_base     = CSRStorage(32, description="Word-aligned address of the receive buffer; transfers to an unaligned one are refused.")
+        self._length      = CSRStorage(32, description="Transfer length in bytes; a zero-length transfer finishes at once.")
+        self._clk_divider = CSRStorage(16, reset=max(1, int(sys_clk_freq/(2*spi_clk_freq))),
+            description="SPI clock half-period in ``sys_clk`` cycles; ``1`` gives ``sys_clk/2``.")
+
+        self.submodules.ev = EventManager()
+        self.ev.done = EventSourcePulse(description="Transfer finished.")
+        self.ev.finalize()
+
+        # # #
+
+        index     = Signal(32)
+        tx_word   = Signal(32)
+        rx_word   = Signal(32)
+        rx_sel    = Signal(4)
+        rx_adr    = Signal(30)
+        shift_out = Signal(8)
+        shift_in  = Signal(8)
+        bit       = Signal(3)
+        div       = Signal(16)
+        half      = Signal(16)
+        lane      = Signal(2)
+        error     = Signal()
+        unaligned = Signal()
+
+        self.comb += [
+            lane.eq(index[:2]),
+            half.eq(Mux(self._clk_divider.storage == 0, 0, self._clk_divider.storage - 1)),
+            pads.mosi.eq(shift_out[7]),
+            unaligned.eq(
+                (self._control.fields.tx_enable & (self._tx_base.storage[:2] != 0)) |
+                (self._control.fields.rx_enable & (self._rx_base.storage[:2] != 0))),
+        ]
+        if hasattr(pads, "cs_n"):
+            self.comb += pads.cs_n.eq(~self._cs.fields.sel)
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        self.comb += [
+            self._status.fields.busy.eq(~fsm.ongoing("IDLE")),
+            self._status.fields.error.eq(error),
+        ]
+
+        fsm.act("IDLE",
+            If(self._control.fields.start,
+                NextValue(error, unaligned),
+                NextValue(index, 0),
+                NextValue(rx_sel, 0),
+                If(unaligned | (self._length.storage == 0),
+                    NextState("DONE")
+                ).Else(
+                    NextState("FETCH")
+                )
+            )
+        )
+        fsm.act("FETCH",
+            If(~self._control.fields.tx_enable,
+                NextValue(tx_word, 0xffffffff),
+                NextState("LOAD")
+            ).Else(
+                bus.cyc.eq(1),
+                bus.stb.eq(1),
+                bus.we.eq(0),
+                bus.sel.eq(0b1111),
+                bus.adr.eq(self._tx_base.storage[2:] + index[2:]),
+                If(bus.ack,
+                    NextValue(tx_word, bus.dat_r),
+                    NextState("LOAD")
+                )
+            )
+        )
+        fsm.act("LOAD",
+            Case(lane, {i: NextValue(shift_out, tx_word[8*i:8*(i+1)]) for i in range(4)}),
+            NextValue(bit, 0),
+            NextValue(div, half),
+            NextState("LOW")
+        )
+        fsm.act("LOW",
+            pads.clk.eq(0),
+            If(div == 0,
+                NextValue(shift_in, Cat(pads.miso, shift_in[:-1])),
+                NextValue(div, half),
+                NextState("HIGH")
+            ).Else(
+                NextValue(div, div - 1)
+            )
+        )
+        fsm.act("HIGH",
+            pads.clk.eq(1),
+            If(div == 0,
+                NextValue(shift_out, Cat(0, shift_out[:-1])),
+                NextValue(bit, bit + 1),
+                NextValue(div, half),
+                If(bit == 7,
+                    NextState("BYTE-DONE")
+                ).Else(
+                    NextState("LOW")
+                )
+            ).Else(
+                NextValue(div, div - 1)
+            )
+        )
+        fsm.act("BYTE-DONE",
+            Case(lane, {i: [
+                NextValue(rx_word, Cat(*[shift_in if j == i else rx_word[8*j:8*(j+1)] for j in range(4)])),
+                NextValue(rx_sel, rx_sel | (1 << i)),
+            ] for i in range(4)}),
+            NextValue(rx_adr, self._rx_base.storage[2:] + index[2:]),
+            NextValue(index, index + 1),
+            If(self._control.fields.rx_enable & ((lane == 3) | (index + 1 == self._length.storage)),
+                NextState("STORE")
+            ).Else(
+                NextState("NEXT")
+            )
+        )
+        fsm.act("STORE",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.sel.eq(rx_sel),
+            bus.adr.eq(rx_adr),
+            bus.dat_w.eq(rx_word),
+            If(bus.ack,
+                NextValue(rx_sel, 0),
+                NextState("NEXT")
+            )
+        )
+        fsm.act("NEXT",
+            If(index == self._length.storage,
+                NextState("DONE")
+            ).Elif(lane == 0,
+                NextState("FETCH")
+            ).Else(
+                NextState("LOAD")
+            )
+        )
+        fsm.act("DONE",
+            self.ev.done.trigger.eq(1),
+            NextState("IDLE")
+        )
@@ -0,0 +1,119 @@
+from migen import *
+
+from litex.soc.interconnect import stream
+from litex.soc.interconnect import wishbone
+from litex.soc.interconnect.csr import *
+from litex.soc.interconnect.csr_eventmanager import *
+
+# UART RX DMA --------------------------------------------------------------------------------------
+
+class UARTRXDMA(Module, AutoCSR):
+    """Writes bytes received by a UART PHY into a ring buffer in memory.
+
+    The core owns ``write_offset``; firmware advances ``read_offset`` as it
+    consumes data. The ``watermark`` event stays pending while at least
+    ``watermark`` bytes are buffered, and the ``idle`` event fires when data is
+    buffered but nothing was received for ``timeout`` cycles, so the tail of a
+    burst doesn't sit below the watermark. If the ring fills up, further bytes
+    are dropped and ``overflow`` is set until written with ``1``. Bytes
+    received while ``enable`` is clear are dropped too, so the ring only ever
+    holds data received after it was set up.
+    """
+    def __init__(self, fifo_depth=16):
+        self.sink = sink = stream.Endpoint([("data", 8)])
+        self.bus  = bus  = wishbone.Interface()
+
+        self._control      = CSRStorage(fields=[
+            CSRField("enable", size=1, offset=0, description="Enable writes to the ring buffer. While clear, received bytes are dropped."),
+        ])
+        self._base         = CSRStorage(32, description="Word-aligned address of the ring buffer.")
+        self._size         = CSRStorage(32, description="Ring buffer size in bytes.")
+        self._read_offset  = CSRStorage(32, description="Offset of the next byte firmware will read.")
+        self._write_offset = CSRStatus(32,  description="Offset of the next byte the core will write.")
+        self._level        = CSRStatus(32,  description="Number of buffered bytes.")
+        self._watermark    = CSRStorage(32, description="Buffered byte count at which the ``watermark`` event is raised; ``0`` disables it.")
+        self._timeout      = CSRStorage(32, description="Idle time in ``sys_clk`` cycles before the ``idle`` event is raised; ``0`` disables it.")
+        self._overflow     = CSR()
+
+        self.submodules.ev = EventManager()
+        self.ev.watermark = EventSourceLevel(description="At least ``watermark`` bytes are buffered.")
+        self.ev.idle      = EventSourcePulse(description="Data is buffered and the line has been idle for ``timeout`` cycles.")
+        self.ev.finalize()
+
+        # # #
+
+        write_offset = Signal(32)
+        read_offset  = self._read_offset.storage
+        size         = self._size.storage
+        level        = Signal(32)
+        full         = Signal()
+        overflow     = Signal()
+        adr          = Signal(32)
+        idle_count   = Signal(32)
+        set_overflow = Signal()
+
+        self.submodules.fifo = fifo = stream.SyncFIFO([("data", 8)], fifo_depth)
+        self.comb += sink.connect(fifo.sink)
+
+        self.comb += [
+            level.eq(Mux(write_offset >= read_offset,
+                write_offset - read_offset,
+                size - read_offset + write_offset)),
+            full.eq(level == (size - 1)),
+            adr.eq(self._base.storage + write_offset),
+            self._write_offset.status.eq(write_offset),
+            self._level.status.eq(level),
+            self._overflow.w.eq(overflow),
+            self.ev.watermark.trigger.eq(self._control.fields.enable &
+                (self._watermark.storage != 0) & (level >= self._watermark.storage)),
+        ]
+        self.sync += [
+            If(set_overflow,
+                overflow.eq(1)
+            ).Elif(self._overflow.re & self._overflow.r,
+                overflow.eq(0)
+            )
+        ]
+
+        # Idle detection.
+        self.sync += [
+            If(fifo.source.valid | (level == 0),
+                idle_count.eq(0)
+            ).Elif(idle_count != self._timeout.storage,
+                idle_count.eq(idle_count + 1)
+            )
+        ]
+        self.comb += self.ev.idle.trigger.eq((self._timeout.storage != 0) & (level != 0) &
+            (idle_count == self._timeout.storage - 1))
+
+        self.submodules.fsm = fsm = FSM(reset_state="IDLE")
+        fsm.act("IDLE",
+            If(~self._control.fields.enable,
+                fifo.source.ready.eq(1),
+                NextValue(write_offset, 0)
+            ).Elif(fifo.source.valid,
+                If(full,
+                    fifo.source.ready.eq(1),
+                    set_overflow.eq(1)
+                ).Else(
+                    NextState("WRITE")
+                )
+            )
+        )
+        fsm.act("WRITE",
+            bus.cyc.eq(1),
+            bus.stb.eq(1),
+            bus.we.eq(1),
+            bus.adr.eq(adr[2:]),
+            bus.sel.eq(1 << adr[:2]),
+            bus.dat_w.eq(Replicate(fifo.source.data, 4)),
+            If(bus.ack,
+                fifo.source.ready.eq(1),
+                If(write_offset == (size - 1),
+                    NextValue(write_offset, 0)
+                ).Else(
+                    NextValue(write_offset, write_offset + 1)
+                ),
+                NextState("IDLE")
+            )
+        )
@@ -0,0 +1,54 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# A FeatherSoC with the peripherals that need nothing outside LiteX (USB,
+# the Feather UART and RTLI2C come from valentyusb and the gateware repo).
+# Main RAM is integrated unless integrated_main_ram_size=0 is passed, as
+# elaborating LiteDRAM is slow. Skips if the board or the CPU's sources
+# aren't installed.
+def _make_soc(**kwargs):
+    pytest.importorskip("litex_boards.platforms.orangecrab")
+    pytest.importorskip("litedram")
+    pytest.importorskip("pythondata_cpu_vexriscv")
+    from orangecrab_feather.feather_soc import FeatherSoC
+
+    args = dict(
+        cpu_type                 = "vexriscv",
+        integrated_rom_size      = 0x8000,
+        integrated_main_ram_size = 0x4000,
+        with_usb                 = False,
+        with_feather_uart        = False,
+        with_i2c                 = False,
+    )
+    args.update(kwargs)
+    return FeatherSoC(**args)
+
+# Factory for finalized FeatherSoCs.
+@pytest.fixture
+def feather_soc():
+    def make(**kwargs):
+        soc = _make_soc(**kwargs)
+        soc.finalize()
+        return soc
+    return make
+
+# The same FeatherSoC elaborated twice into separate directories (without
+# running the toolchain), to check that nothing but the design goes into
+# the hashes. Elaborating is slow, so the builders are shared.
+@pytest.fixture(scope="session")
+def feather_builds(tmp_path_factory):
+    from orangecrab_feather.builder import FeatherBuilder
+
+    builders = []
+    for i in range(2):
+        builder = FeatherBuilder(_make_soc(),
+            output_dir       = str(tmp_path_factory.mktemp("build")),
+            compile_software = False,
+            compile_gateware = False)
+        builder.build(run=False)
+        builders.append(builder)
+    return builders
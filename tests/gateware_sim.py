@@ -0,0 +1,84 @@
+from migen import *
+
+from litex.soc.interconnect import csr_bus
+from litex.soc.interconnect.csr import AutoCSR
+from litex.soc.interconnect.csr_bus import CSRBankArray
+
+# Helpers for Migen simulations of the gateware cores.
+
+# Testbench base for cores with CSRs: add_csr_bank() puts the CSRs of
+# submodule name behind a CSR bank, which read() and write() then access by
+# CSR name, the way the CPU would.
+class CSRBankDUT(Module, AutoCSR):
+    def add_csr_bank(self, name):
+        self.submodules.csr_bank = CSRBankArray(self, lambda n, memory: {name: 0}.get(n),
+            data_width=32)
+        self.csr_bus = csr_bus.Interface(data_width=32, address_width=14)
+        self.submodules.csr_con = csr_bus.Interconnect(self.csr_bus, self.csr_bank.get_buses())
+        # (address, words) by name; wider CSRs take several words, most
+        # significant first.
+        self.csrs = {}
+        address = 0
+        for csr in getattr(self, name).get_csrs():
+            words = (csr.size + 31)//32
+            self.csrs[csr.name] = (address, words)
+            address += words
+
+    def read(self, name):
+        address, words = self.csrs[name]
+        value = 0
+        for i in range(words):
+            # The bank's data is valid a cycle after the address.
+            yield from self.csr_bus.read(address + i)
+            value = (value << 32) | (yield from self.csr_bus.read(address + i))
+        return value
+
+    def write(self, name, value):
+        address, words = self.csrs[name]
+        for i in range(words):
+            yield from self.csr_bus.write(address + i, (value >> 32*(words - 1 - i)) & 0xffffffff)
+
+    def wait_event(self, n, limit=100000):
+        for i in range(limit):
+            if (yield from self.read("ev_pending")) & (1 << n):
+                yield from self.write("ev_pending", 1 << n)
+                return
+        raise AssertionError("No event {}".format(n))
+
+# Simulate dut with generators, each called as generator(dut, result) to
+# store what it saw in result, which is returned.
+def simulate(dut, *generators, **kwargs):
+    result = {}
+    run_simulation(dut, [generator(dut, result) for generator in generators], **kwargs)
+    return result
+
+# Wishbone master generators.
+
+def wb_write(bus, adr, dat, sel=None):
+    yield bus.cyc.eq(1)
+    yield bus.stb.eq(1)
+    yield bus.we.eq(1)
+    yield bus.sel.eq(2**len(bus.sel) - 1 if sel is None else sel)
+    yield bus.adr.eq(adr)
+    yield bus.dat_w.eq(dat)
+    yield
+    while not (yield bus.ack):
+        yield
+    yield bus.cyc.eq(0)
+    yield bus.stb.eq(0)
+    yield bus.we.eq(0)
+    yield
+
+def wb_read(bus, adr):
+    yield bus.cyc.eq(1)
+    yield bus.stb.eq(1)
+    yield bus.we.eq(0)
+    yield bus.adr.eq(adr)
+    yield
+    while not (yield bus.ack):
+        yield
+    dat = yield bus.dat_r
+    yield bus.cyc.eq(0)
+    yield bus.stb.eq(0)
+    yield
+    return dat
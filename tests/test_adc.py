@@ -0,0 +1,101 @@
+import pytest
+
+pytest.importorskip("litex")
+
+from migen import *
+
+from litex.soc.interconnect import wishbone
+
+from orangecrab_feather.adc import SigmaDeltaADC
+
+from gateware_sim import CSRBankDUT, simulate
+
+EV_HALF, EV_FULL = 0, 1
+
+# SigmaDeltaADC writing into a small SRAM, with a comparator that follows
+# a fixed bitstream instead of the RC network.
+class ADCDUT(CSRBankDUT):
+    def __init__(self):
+        self.pads = Record([("ctrl", 1), ("sense", 1), ("mux", 4)])
+        self.submodules.adc  = SigmaDeltaADC(self.pads)
+        self.submodules.sram = wishbone.SRAM(64, bus=self.adc.bus)
+        self.add_csr_bank("adc")
+
+    def start(self, divider, decimation, size):
+        yield from self.write("divider", divider)
+        yield from self.write("decimation", decimation)
+        yield from self.write("size", size)
+        yield from self.write("control", 1)
+
+# Hold each bit of bitstream on sense for one modulator period.
+def comparator(bitstream, divider):
+    @passive
+    def generator(dut, result):
+        cycle = 0
+        while True:
+            yield dut.pads.sense.eq(bitstream[(cycle//divider) % len(bitstream)])
+            yield
+            cycle += 1
+    return generator
+
+# Record the cycle and value of each sample written to memory.
+@passive
+def writes(dut, result):
+    bus = dut.adc.bus
+    result["writes"] = []
+    cycle = 0
+    while True:
+        if (yield bus.cyc) and (yield bus.we) and (yield bus.ack):
+            dat_w = yield bus.dat_w
+            lane = 16 if (yield bus.sel) == 0b1100 else 0
+            result["writes"].append((cycle, (dat_w >> lane) & 0xffff))
+        yield
+        cycle += 1
+
+# CIC output is ones density * 2**(3*decimation), scaled to 16 bits.
+@pytest.mark.parametrize("divider,decimation,bitstream,sample", [
+    (1, 4, [1, 0, 0, 0], 0x4000),
+    (2, 6, [1, 1, 1, 0], 0xc000),
+    (1, 4, [1],          0xffff),
+])
+def test_rate_and_value(divider, decimation, bitstream, sample):
+    def generator(dut, result):
+        yield from dut.start(divider, decimation, 64)
+        while len(result["writes"]) < 8:
+            yield
+
+    result = simulate(ADCDUT(), generator, comparator(bitstream, divider), writes)
+    cycles  = [cycle for cycle, value in result["writes"]]
+    samples = [value for cycle, value in result["writes"]]
+    assert samples == [sample]*len(samples)
+    period = divider*2**decimation
+    assert [b - a for a, b in zip(cycles, cycles[1:])] == [period]*(len(cycles) - 1)
+
+def test_ring():
+    def generator(dut, result):
+        yield from dut.write("base", 16)
+        yield from dut.start(1, 2, 16)
+        yield from dut.wait_event(EV_HALF)
+        result["half_offset"] = yield from dut.read("write_offset")
+        yield from dut.wait_event(EV_FULL)
+        result["full_offset"] = yield from dut.read("write_offset")
+        result["overrun"]     = yield from dut.read("overrun")
+        result["sample"]      = yield from dut.read("sample")
+        result["ring"] = []
+        for i in range(4, 8):
+            result["ring"].append((yield dut.sram.mem[i]))
+        result["before"] = yield dut.sram.mem[3]
+
+    result = simulate(ADCDUT(), generator, comparator([1, 0], 1))
+    assert result["half_offset"] in (8, 10)
+    assert result["full_offset"] in (0, 2)
+    assert result["overrun"] == 0
+    assert result["sample"] == 0x8000
+    assert result["ring"] == [0x80008000]*4
+    assert result["before"] == 0
+
+def test_adc_pads(feather_soc):
+    soc = feather_soc(adc=True)
+    assert "adc" in soc.csr.regions
+    with pytest.raises(ValueError, match="revision 0.1 has none"):
+        feather_soc(adc=True, revision="0.1")
@@ -0,0 +1,55 @@
+import argparse
+
+import pytest
+
+pytest.importorskip("litex")
+
+from orangecrab_feather.args import peripheral_args, selected_peripherals, check_peripherals, PROFILES
+from orangecrab_feather.matrix import variant_args
+
+def parse(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--adc",  action="store_true")
+    parser.add_argument("--gpio", action="store_true")
+    parser.add_argument("--output-dir", default=None)
+    parser.add_argument("--matrix",     default=None)
+    parser.add_argument("--load",       action="store_true")
+    parser.add_argument("--load-many",  action="store_true")
+    parser.add_argument("--revision",    default="0.2")
+    parser.add_argument("--sdcard-mode", default="spi")
+    peripheral_args(parser)
+    return parser, parser.parse_args(argv)
+
+def test_default_profile():
+    parser, args = parse([])
+    assert selected_peripherals(args) == set(PROFILES["full"])
+
+def test_with_without():
+    parser, args = parse(["--profile", "minimal", "--with", "spi,i2c", "--with", "adc", "--gpio"])
+    assert selected_peripherals(args) == {"spi", "i2c", "adc", "gpio"}
+
+    parser, args = parse(["--without", "sdcard, leds"])
+    assert selected_peripherals(args) == set(PROFILES["full"]) - {"sdcard", "leds"}
+
+def test_unknown_peripheral():
+    parser, args = parse(["--with", "spi,ethernet"])
+    with pytest.raises(ValueError, match="ethernet"):
+        selected_peripherals(args)
+
+def test_sdcard_mode_revision():
+    parser, args = parse(["--revision", "0.1", "--sdcard-mode", "sd4"])
+    with pytest.raises(ValueError, match="revision 0.1"):
+        check_peripherals(args, selected_peripherals(args))
+
+    for argv in (["--revision", "0.1", "--sdcard-mode", "sd4", "--without", "sdcard"],
+                 ["--revision", "0.1", "--sdcard-mode", "spi-dma"],
+                 ["--sdcard-mode", "sd4"]):
+        parser, args = parse(argv)
+        check_peripherals(args, selected_peripherals(args))
+
+def test_matrix_variant():
+    parser, args = parse([])
+    vargs = variant_args(parser, args, {"profile": "minimal", "with": "spi,i2c"}, "out")
+    assert selected_peripherals(vargs) == {"spi", "i2c"}
+    vargs = variant_args(parser, args, {"without": "usb"}, "out")
+    assert "usb" not in selected_peripherals(vargs)
@@ -0,0 +1,38 @@
+import types
+
+import pytest
+
+pytest.importorskip("litex")
+
+from orangecrab_feather.build_hash import (BuildHash, clear_build_hash, record_build_hash,
+    read_build_hash)
+
+def soc_with_hash(init):
+    return types.SimpleNamespace(build_hash=types.SimpleNamespace(
+        mem=types.SimpleNamespace(init=init)))
+
+def test_record_and_read(tmp_path):
+    gateware_dir = str(tmp_path)
+    assert read_build_hash(gateware_dir, "top") is None
+
+    record_build_hash(soc_with_hash([0x01234567, 0x89abcdef]), gateware_dir, "top")
+    assert read_build_hash(gateware_dir, "top") == 0x0123456789abcdef
+
+    clear_build_hash(gateware_dir, "top")
+    assert read_build_hash(gateware_dir, "top") is None
+
+def test_placeholder_not_recorded(tmp_path):
+    gateware_dir = str(tmp_path)
+    record_build_hash(soc_with_hash(list(BuildHash.PLACEHOLDER)), gateware_dir, "top")
+    assert read_build_hash(gateware_dir, "top") is None
+    record_build_hash(types.SimpleNamespace(), gateware_dir, "top")
+    assert read_build_hash(gateware_dir, "top") is None
+
+def test_build_hash_stable(feather_builds):
+    first, second = [list(b.soc.build_hash.mem.init) for b in feather_builds]
+    assert first == second
+    assert first != list(BuildHash.PLACEHOLDER)
+
+def test_without_build_hash(feather_soc):
+    soc = feather_soc(with_build_hash=False)
+    assert "build_hash" not in soc.csr.regions
@@ -0,0 +1,55 @@
+import os
+import types
+
+from orangecrab_feather.cache import BitstreamCache, soc_ident, write_ident, read_ident
+
+def soc_with_ident(ident):
+    return types.SimpleNamespace(identifier=types.SimpleNamespace(
+        mem=types.SimpleNamespace(init=list(ident.encode()) + [0])))
+
+def test_ident(tmp_path):
+    gateware_dir = str(tmp_path)
+    assert soc_ident(types.SimpleNamespace()) is None
+    assert read_ident(gateware_dir, "top") is None
+
+    soc = soc_with_ident("FeatherSoC on OrangeCrab 2026-10-17 12:00:00")
+    assert soc_ident(soc) == "FeatherSoC on OrangeCrab 2026-10-17 12:00:00"
+    write_ident(soc, gateware_dir, "top")
+    assert read_ident(gateware_dir, "top") == soc_ident(soc)
+
+# A hit restores the identifier of the build that stored the bitstream.
+def test_restore_ident(tmp_path):
+    cache = BitstreamCache(str(tmp_path / "cache"))
+    os.makedirs(cache.cache_dir)
+    first, second = str(tmp_path / "first"), str(tmp_path / "second")
+    os.makedirs(first)
+    os.makedirs(second)
+
+    with open(os.path.join(first, "top.bit"), "wb") as f:
+        f.write(b"bitstream")
+    write_ident(soc_with_ident("first build"), first, "top")
+    cache.store("key", first, "top")
+
+    write_ident(soc_with_ident("second build"), second, "top")
+    assert cache.restore("key", second, "top")
+    assert read_ident(second, "top") == "first build"
+
+# Outputs an entry doesn't have are removed rather than left over.
+def test_restore_removes_stale(tmp_path):
+    cache = BitstreamCache(str(tmp_path / "cache"))
+    os.makedirs(os.path.join(cache.cache_dir, "key"))
+    with open(os.path.join(cache.cache_dir, "key", "top.bit"), "wb") as f:
+        f.write(b"bitstream")
+
+    gateware_dir = str(tmp_path / "gateware")
+    os.makedirs(gateware_dir)
+    write_ident(soc_with_ident("stale"), gateware_dir, "top")
+    assert cache.restore("key", gateware_dir, "top")
+    assert read_ident(gateware_dir, "top") is None
+
+# LiteX stamps the Verilog with the time it was written; that mustn't make
+# every rebuild miss.
+def test_key_stable(feather_builds):
+    cache = BitstreamCache()
+    keys = [cache.key(b.soc, b.gateware_dir, b.soc.build_name, {}) for b in feather_builds]
+    assert keys[0] == keys[1]
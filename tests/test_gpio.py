@@ -0,0 +1,143 @@
+import pytest
+
+pytest.importorskip("litex")
+
+from migen import *
+from migen.fhdl.specials import Tristate
+
+from litex.soc.interconnect import wishbone
+
+from orangecrab_feather.gpio import FeatherGPIO
+
+from gateware_sim import CSRBankDUT, simulate
+
+NPINS = 13
+EV_CAPTURE, EV_PLAYBACK = NPINS, NPINS + 1
+
+# The pads float high unless driven, and read back what is driven: playback
+# loops back into capture.
+class _SimTristateImpl(Module):
+    def __init__(self, target, o, oe, i):
+        self.comb += target.eq(Mux(oe, o, Replicate(1, len(target))))
+        if i is not None:
+            self.comb += i.eq(target)
+
+class _SimTristate:
+    @staticmethod
+    def lower(dr):
+        return _SimTristateImpl(dr.target, dr.o, dr.oe, dr.i)
+
+SIM_TRISTATE = {Tristate: _SimTristate}
+
+# FeatherGPIO behind a CSR bank, with both its masters sharing an SRAM.
+class GPIODUT(CSRBankDUT):
+    def __init__(self):
+        self.pads = Signal(NPINS)
+        self.submodules.gpio = FeatherGPIO(self.pads, capture_depth=16, playback_depth=8)
+        self.submodules.sram = wishbone.SRAM(1024)
+        self.submodules.arbiter = wishbone.Arbiter(
+            [self.gpio.capture_bus, self.gpio.playback_bus], self.sram.bus)
+        self.add_csr_bank("gpio")
+
+    def load(self, base, samples):
+        samples = samples + [0]*(len(samples) % 2)
+        for k in range(0, len(samples), 2):
+            yield self.sram.mem[base + k//2].eq(samples[k] | (samples[k + 1] << 16))
+        yield
+
+    def captured(self, base, n):
+        samples = []
+        for k in range((n + 1)//2):
+            word = yield self.sram.mem[base + k]
+            samples += [word & 0xffff, word >> 16]
+        return samples[:n]
+
+    # Play a pattern (from word 0x40) into a capture (to word 0x80)
+    # triggered on its first sample.
+    def loopback(self, pattern, divider, loop=False, length=None):
+        yield from self.load(0x40, pattern)
+        yield from self.write("oe", 2**NPINS - 1)
+        yield from self.write("out", 0)
+        yield from self.write("capture_divider", divider)
+        yield from self.write("capture_trigger_mask", 2**NPINS - 1)
+        yield from self.write("capture_trigger_value", pattern[0])
+        yield from self.write("capture_base", 0x80*4)
+        yield from self.write("capture_length", length or len(pattern))
+        yield from self.write("capture_control", 0b101)
+        yield from self.write("playback_divider", divider)
+        yield from self.write("playback_base", 0x40*4)
+        yield from self.write("playback_length", len(pattern))
+        yield from self.write("playback_control", 0b101 if loop else 0b001)
+
+def test_edge_events():
+    def generator(dut, result):
+        # Pin 0 on its rising edge, pin 1 on any change.
+        yield from dut.write("oe", 0b11)
+        yield from dut.write("out", 0b00)
+        yield from dut.write("mode", 0b10)
+        for i in range(8):
+            yield
+        yield from dut.write("ev_pending", 2**16 - 1)
+        result["pending"] = []
+        for out in (0b01, 0b10):
+            yield from dut.write("out", out)
+            for i in range(8):
+                yield
+            result["pending"].append((yield from dut.read("ev_pending")) & 0b11)
+            yield from dut.write("ev_pending", 2**16 - 1)
+
+    assert simulate(GPIODUT(), generator, special_overrides=SIM_TRISTATE)["pending"] == [0b01, 0b10]
+
+@pytest.mark.parametrize("divider,length", [(1, 16), (4, 41)])
+def test_playback_capture(divider, length):
+    pattern = [0x1000 | (k*291) & 0xfff for k in range(length)]
+
+    def generator(dut, result):
+        yield from dut.loopback(pattern, divider)
+        yield from dut.wait_event(EV_PLAYBACK)
+        yield from dut.wait_event(EV_CAPTURE)
+        result["count"]           = yield from dut.read("capture_count")
+        result["capture_status"]  = yield from dut.read("capture_status")
+        result["playback_status"] = yield from dut.read("playback_status")
+        result["captured"]        = yield from dut.captured(0x80, length)
+
+    result = simulate(GPIODUT(), generator, special_overrides=SIM_TRISTATE)
+    assert result["captured"] == pattern
+    assert result["count"] == length
+    assert result["capture_status"] == 0
+    assert result["playback_status"] == 0
+
+def test_loop():
+    pattern = [0x11, 0x22, 0x33, 0x44, 0x55]
+
+    def generator(dut, result):
+        yield from dut.loopback(pattern, 3, loop=True, length=30)
+        yield from dut.wait_event(EV_CAPTURE)
+        result["captured"] = yield from dut.captured(0x80, 30)
+        yield from dut.write("playback_control", 0b110)
+        yield from dut.wait_event(EV_PLAYBACK)
+        result["playback_status"] = yield from dut.read("playback_status")
+
+    result = simulate(GPIODUT(), generator, special_overrides=SIM_TRISTATE)
+    assert result["captured"] == pattern*6
+    assert result["playback_status"] == 0
+
+# Capturing every cycle outruns the writer (one bus cycle per word at best
+# with the CSR accesses in between), so the capture ends early.
+def test_overflow():
+    def generator(dut, result):
+        yield from dut.write("capture_trigger_mask", 0)
+        yield from dut.write("capture_length", 2000)
+        yield from dut.write("capture_control", 0b001)
+        yield from dut.wait_event(EV_CAPTURE)
+        result["count"]  = yield from dut.read("capture_count")
+        result["status"] = yield from dut.read("capture_status")
+
+    result = simulate(GPIODUT(), generator, special_overrides=SIM_TRISTATE)
+    assert result["status"] == 0b100
+    assert 0 < result["count"] < 2000
+
+@pytest.mark.parametrize("revision,npins", [("0.1", 7), ("0.2", 13)])
+def test_gpio_pins(feather_soc, revision, npins):
+    soc = feather_soc(gpio=True, revision=revision)
+    assert len(soc.gpio.o) == npins
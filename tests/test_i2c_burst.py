@@ -0,0 +1,194 @@
+import pytest
+
+pytest.importorskip("litex")
+
+from migen import *
+
+from litex.soc.interconnect import wishbone
+
+from orangecrab_feather.i2c_burst import I2CBurst
+
+from gateware_sim import CSRBankDUT, simulate
+
+ADDRESS = 0x50
+EV_DONE = 0
+
+def cmd(data, start=0, stop=0, read=0):
+    return data | (start << 8) | (stop << 9) | (read << 10)
+
+# I2CBurst (with DMA) on an open-drain bus with a register-file target.
+class I2CBurstDUT(CSRBankDUT):
+    def __init__(self):
+        self.submodules.i2c  = I2CBurst(None, 48e6, fifo_depth=8, with_dma=True)
+        self.submodules.sram = wishbone.SRAM(1024, bus=self.i2c.bus)
+        self.target_scl_low = Signal()
+        self.target_sda_low = Signal()
+        self.scl = Signal()
+        self.sda = Signal()
+        self.comb += [
+            self.scl.eq(~(self.i2c.scl_oe | self.target_scl_low)),
+            self.sda.eq(~(self.i2c.sda_oe | self.target_sda_low)),
+            self.i2c.scl_i.eq(self.scl),
+            self.i2c.sda_i.eq(self.sda),
+        ]
+        self.add_csr_bank("i2c")
+
+    def wait_done(self):
+        yield from self.wait_event(EV_DONE, limit=200000)
+
+# An I2C target at ADDRESS with 32 byte registers and an auto-incrementing
+# register pointer. It stretches SCL after a read address. What it sees is
+# appended to log: S(TART), P (STOP), A<address byte><+/-> and W<byte>.
+class Target:
+    def __init__(self, dut):
+        self.dut  = dut
+        self.regs = list(range(0x10, 0x30))
+        self.log  = []
+
+    def drive_sda(self, low):
+        yield self.dut.target_sda_low.eq(low)
+
+    def next_read_bit(self, bit):
+        yield from self.drive_sda(not (self.byte_out >> (7 - bit)) & 1)
+
+    @passive
+    def run(self, dut, result):
+        prev_scl = prev_sda = 1
+        state, bit, byte, ptr, first, stretch = "idle", 0, 0, 0, True, 0
+        while True:
+            scl = yield dut.scl
+            sda = yield dut.sda
+            if stretch:
+                stretch -= 1
+                if stretch == 0:
+                    yield dut.target_scl_low.eq(0)
+            if prev_scl and scl and prev_sda and not sda:
+                self.log.append("S")
+                state, bit, byte, first = "address", -1, 0, True
+                yield from self.drive_sda(0)
+            elif prev_scl and scl and not prev_sda and sda:
+                self.log.append("P")
+                state = "idle"
+                yield from self.drive_sda(0)
+            elif not prev_scl and scl:
+                if state in ("address", "write") and bit < 8:
+                    byte = (byte << 1) | sda
+                if state == "read" and bit == 8:
+                    nack = sda
+            elif prev_scl and not scl and state != "idle":
+                bit += 1
+                if bit == 8:
+                    if state == "address":
+                        match = (byte >> 1) == ADDRESS
+                        self.log.append("A{:02x}{}".format(byte, "+" if match else "-"))
+                        yield from self.drive_sda(match)
+                    elif state == "write":
+                        self.log.append("W{:02x}".format(byte))
+                        if first:
+                            ptr, first = byte, False
+                        else:
+                            self.regs[ptr] = byte
+                            ptr += 1
+                        yield from self.drive_sda(1)
+                    else:
+                        yield from self.drive_sda(0)
+                elif bit == 9:
+                    bit, read, byte = 0, byte & 1, 0
+                    if state == "address" and not match:
+                        state = "idle"
+                        yield from self.drive_sda(0)
+                    elif state == "address" and read:
+                        state = "read"
+                        self.byte_out = self.regs[ptr]
+                        ptr += 1
+                        yield from self.next_read_bit(0)
+                        yield dut.target_scl_low.eq(1)
+                        stretch = 200
+                    elif state in ("address", "write"):
+                        state = "write"
+                        yield from self.drive_sda(0)
+                    elif nack:
+                        state = "idle"
+                        yield from self.drive_sda(0)
+                    else:
+                        self.byte_out = self.regs[ptr]
+                        ptr += 1
+                        yield from self.next_read_bit(0)
+                elif state == "read" and bit < 8:
+                    yield from self.next_read_bit(bit)
+            prev_scl, prev_sda = scl, sda
+            yield
+
+def run(generator):
+    dut = I2CBurstDUT()
+    target = Target(dut)
+    return target, simulate(dut, generator, target.run)
+
+def queue(dut, commands):
+    yield from dut.write("control", 0b10) # 1 MHz
+    for c in commands:
+        yield from dut.write("cmd", c)
+    yield from dut.wait_done()
+
+def test_write():
+    def generator(dut, result):
+        yield from queue(dut, [cmd(ADDRESS << 1, start=1), cmd(4), cmd(0xaa), cmd(0x55, stop=1)])
+        result["status"] = yield from dut.read("status")
+
+    target, result = run(generator)
+    assert result["status"] == 0
+    assert target.log == ["S", "Aa0+", "W04", "Waa", "W55", "P"]
+    assert target.regs[4:6] == [0xaa, 0x55]
+
+def test_read():
+    def generator(dut, result):
+        yield from queue(dut, [cmd(ADDRESS << 1, start=1), cmd(3),
+            cmd((ADDRESS << 1) | 1, start=1), cmd(3, stop=1, read=1)])
+        result["rx"] = []
+        for i in range((yield from dut.read("rx_level"))):
+            result["rx"].append((yield from dut.read("rx")))
+            yield from dut.write("rx", 0)
+
+    target, result = run(generator)
+    assert target.log == ["S", "Aa0+", "W03", "S", "Aa1+", "P"]
+    assert result["rx"] == target.regs[3:7]
+
+# A NACK ends the transaction and drops the commands queued after it.
+def test_nack():
+    def generator(dut, result):
+        yield from queue(dut, [cmd(0x21 << 1, start=1), cmd(1), cmd(2, stop=1)])
+        result["status"]    = yield from dut.read("status")
+        result["cmd_level"] = yield from dut.read("cmd_level")
+        yield from dut.write("control", 0b10010)
+        yield
+        result["reset_status"] = yield from dut.read("status")
+
+    target, result = run(generator)
+    assert target.log == ["S", "A42-", "P"]
+    assert result["status"] == 0b10
+    assert result["cmd_level"] == 0
+    assert result["reset_status"] == 0
+
+def test_dma():
+    commands = [cmd(ADDRESS << 1, start=1), cmd(0x10),
+        cmd((ADDRESS << 1) | 1, start=1), cmd(15, stop=1, read=1)]
+
+    def generator(dut, result):
+        for i, c in enumerate(commands):
+            yield dut.sram.mem[0x40 + i].eq(c)
+        yield
+        yield from dut.write("dma_cmd_base", 0x40*4)
+        yield from dut.write("dma_cmd_count", len(commands))
+        yield from dut.write("dma_rx_base", 0x80*4 + 1)
+        yield from dut.write("dma_control", 0b11)
+        yield from dut.wait_done()
+        result["count"] = yield from dut.read("dma_rx_count")
+        data = b""
+        for i in range(5):
+            data += (yield dut.sram.mem[0x80 + i]).to_bytes(4, "little")
+        result["rx"] = list(data[1:17])
+
+    target, result = run(generator)
+    assert target.log == ["S", "Aa0+", "W10", "S", "Aa1+", "P"]
+    assert result["count"] == 16
+    assert result["rx"] == target.regs[0x10:0x20]
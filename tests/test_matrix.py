@@ -0,0 +1,75 @@
+import json
+import argparse
+
+import pytest
+
+from orangecrab_feather.matrix import parse_matrix, variant_args, variant_name, print_summary
+
+def make_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--revision",                 default="0.2")
+    parser.add_argument("--integrated-main-ram-size", default=0x4000, type=lambda x: int(x, 0))
+    parser.add_argument("--spi-dma",                  action="store_true")
+    parser.add_argument("--no-pac",                   action="store_true")
+    parser.add_argument("--output-dir",               default=None)
+    parser.add_argument("--matrix",                   default=None)
+    parser.add_argument("--load",                     action="store_true")
+    parser.add_argument("--load-many",                action="store_true")
+    return parser
+
+def test_spec_string():
+    variants = parse_matrix("revision=0.1,0.2;--integrated-main-ram-size=0,0x4000")
+    assert variants == [
+        {"revision": "0.1", "integrated_main_ram_size": "0"},
+        {"revision": "0.1", "integrated_main_ram_size": "0x4000"},
+        {"revision": "0.2", "integrated_main_ram_size": "0"},
+        {"revision": "0.2", "integrated_main_ram_size": "0x4000"},
+    ]
+    assert variant_name(variants[1]) == "revision_0.1-integrated_main_ram_size_0x4000"
+
+def test_json_list(tmp_path):
+    path = tmp_path / "matrix.json"
+    path.write_text(json.dumps([{"spi-dma": True}, {"--revision": "0.1"}]))
+    assert parse_matrix(str(path)) == [{"spi_dma": True}, {"revision": "0.1"}]
+
+def test_types():
+    parser = make_parser()
+    args = parser.parse_args(["--load"])
+    vargs = variant_args(parser, args, {"integrated_main_ram_size": "0x100"}, "out")
+    assert vargs.integrated_main_ram_size == 0x100
+    assert vargs.output_dir == "out"
+    assert not vargs.load and not vargs.load_many
+    assert args.load
+
+@pytest.mark.parametrize("value,expected", [
+    (True, True), (False, False), ("true", True), ("false", False),
+    ("False", False), ("0", False), ("1", True), ("no", False), ("on", True),
+])
+def test_flags(value, expected):
+    parser = make_parser()
+    args = parser.parse_args(["--no-pac"])
+    vargs = variant_args(parser, args, {"spi_dma": value, "no_pac": value}, "out")
+    assert vargs.spi_dma is expected
+    assert vargs.no_pac is expected
+
+def test_bad_values():
+    parser = make_parser()
+    args = parser.parse_args([])
+    with pytest.raises(ValueError, match="boolean"):
+        variant_args(parser, args, {"spi_dma": "maybe"}, "out")
+    with pytest.raises(ValueError, match="Unknown"):
+        variant_args(parser, args, {"sdram_size": "1"}, "out")
+
+def test_empty_summary(capsys):
+    print_summary([])
+    assert "No variants" in capsys.readouterr().out
+
+def test_option_names():
+    parser = make_parser()
+    parser.add_argument("--with", dest="with_peripherals", action="append", default=[])
+    args = parser.parse_args([])
+    for variant in parse_matrix("with=spi,i2c"):
+        vargs = variant_args(parser, args, variant, "out")
+        assert vargs.with_peripherals == variant["with"]
+    vargs = variant_args(parser, args, {"with_peripherals": "spi,i2c"}, "out")
+    assert vargs.with_peripherals == "spi,i2c"
@@ -0,0 +1,139 @@
+import os
+import re
+import types
+import shutil
+import itertools
+import subprocess
+
+import pytest
+
+pytest.importorskip("litex")
+
+ITEM_RE = re.compile(r"^\s*(?:pub(?:\(crate\))? )?(?:unsafe )?"
+    r"(mod|struct|enum|type|trait|const|static mut|static|fn) (\w+)")
+STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"')
+
+# Items declared twice in the same scope, the way rustc reports E0428.
+# Good enough for generated code: scopes are tracked by braces, with string
+# literals and comments removed.
+def duplicate_items(source):
+    ids = itertools.count()
+    scope, seen, duplicates = [], set(), []
+    for line in source.splitlines():
+        line = STRING_RE.sub('""', line.split("//")[0])
+        m = ITEM_RE.match(line)
+        if m:
+            kind, name = m.groups()
+            namespace = "type" if kind in ("mod", "struct", "enum", "type", "trait") else "value"
+            key = (tuple(scope), namespace, name)
+            if key in seen:
+                duplicates.append("{} {}".format(kind, "::".join(scope + [name])))
+            seen.add(key)
+        for c in line:
+            if c == "{":
+                scope.append(m.group(2) if m and m.group(1) == "mod" else "#{}".format(next(ids)))
+                m = None
+            elif c == "}":
+                scope.pop()
+    return duplicates
+
+def generate_crates(soc, path):
+    from orangecrab_feather.pac import PacBuilder
+
+    software_dir = str(path / "software")
+    os.makedirs(os.path.join(software_dir, "rust"))
+    PacBuilder(soc, types.SimpleNamespace(software_dir=software_dir)).generate()
+    return os.path.join(software_dir, "rust")
+
+def test_rust_target():
+    from orangecrab_feather.pac import riscv_isa, rust_target
+
+    assert riscv_isa("-march=rv32i2p0_mac -mabi=ilp32") == "imac"
+    assert riscv_isa("-march=rv32im -mabi=ilp32") == "im"
+    assert rust_target("im") == ("riscv32i-unknown-none-elf", ["+m"])
+    assert rust_target("imac") == ("riscv32imac-unknown-none-elf", [])
+
+def test_picorv32_rejected():
+    from orangecrab_feather.pac import PacBuilder
+
+    soc = types.SimpleNamespace(cpu_type="picorv32")
+    builder = types.SimpleNamespace(software_dir="software")
+    with pytest.raises(ValueError, match="picorv32"):
+        PacBuilder(soc, builder).generate()
+
+def test_duplicate_items():
+    assert duplicate_items("pub mod A {\n}\npub mod A {\n}\n") == ["mod A"]
+    assert duplicate_items("pub mod A {\n}\npub const A: u32 = 0;\n") == []
+    assert duplicate_items("impl X {\n    fn f() {}\n}\nfn f() {}\n") == []
+
+@pytest.mark.parametrize("kwargs", [{}, {"with_perf": True}, {"spi_dma": True, "gpio": True}])
+def test_pac_items_unique(feather_soc, tmp_path, kwargs):
+    rust_dir = generate_crates(feather_soc(**kwargs), tmp_path)
+    for root, dirs, filenames in os.walk(rust_dir):
+        for filename in filenames:
+            if filename.endswith(".rs"):
+                path = os.path.join(root, filename)
+                with open(path) as f:
+                    assert duplicate_items(f.read()) == [], path
+
+def test_write_if_changed(tmp_path):
+    from orangecrab_feather.pac import write_if_changed
+
+    filename = str(tmp_path / "lib.rs")
+    assert write_if_changed(filename, "pub mod a;\n")
+    os.utime(filename, (0, 0))
+    assert not write_if_changed(filename, "pub mod a;\n")
+    assert os.stat(filename).st_mtime == 0
+    assert write_if_changed(filename, "pub mod b;\n")
+    with open(filename) as f:
+        assert f.read() == "pub mod b;\n"
+
+# Regenerating an unchanged SoC leaves the crates alone, so cargo doesn't
+# rebuild them, and removes files the SoC no longer generates.
+def test_regenerate(feather_soc, tmp_path):
+    from orangecrab_feather.pac import PacBuilder
+
+    soc = feather_soc()
+    rust_dir = generate_crates(soc, tmp_path)
+    mtimes = {}
+    for root, dirs, filenames in os.walk(rust_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            os.utime(path, (0, 0))
+            mtimes[path] = 0
+    stale = [os.path.join(rust_dir, "litex-pac", "src", "ethmac.rs"),
+             os.path.join(rust_dir, "litex-hal", "src", "old", "mod.rs")]
+    for path in stale:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write("// stale\n")
+
+    PacBuilder(soc, types.SimpleNamespace(software_dir=str(tmp_path / "software"))).generate()
+    for path in stale:
+        assert not os.path.exists(path)
+    assert not os.path.exists(os.path.join(rust_dir, "litex-hal", "src", "old"))
+    for path, mtime in mtimes.items():
+        assert os.stat(path).st_mtime == mtime, path
+
+def test_no_csr_memory_for_build_hash(feather_soc):
+    soc = feather_soc()
+    assert "build_hash" in soc.csr.regions
+    assert "build_hash_mem" not in soc.csr.regions
+
+# Needs the crates the PAC depends on in cargo's cache (or network access).
+@pytest.mark.parametrize("kwargs", [{}, {"with_perf": True}])
+def test_cargo_check(feather_soc, tmp_path, kwargs):
+    if shutil.which("cargo") is None:
+        pytest.skip("cargo not installed")
+    rust_dir = generate_crates(feather_soc(**kwargs), tmp_path)
+
+    for crate in ("litex-pac", "litex-hal"):
+        fetch = subprocess.run(["cargo", "fetch"], cwd=os.path.join(rust_dir, crate),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        if fetch.returncode != 0:
+            pytest.skip("can't fetch the crates {} depends on".format(crate))
+        check = subprocess.run(["cargo", "check", "--offline"], cwd=os.path.join(rust_dir, crate),
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        if "can't find crate for `core`" in check.stdout:
+            pytest.skip("Rust target of the SoC's CPU not installed")
+        assert check.returncode == 0, check.stdout
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("litex")
+
+from migen import *
+
+from litex.soc.interconnect import wishbone
+
+from orangecrab_feather.perf import PerfCounters, perf_counter_map
+
+from gateware_sim import CSRBankDUT, simulate, wb_read, wb_write
+
+ENABLE, CLEAR = 0b01, 0b10
+
+class PerfDUT(CSRBankDUT):
+    def __init__(self):
+        self.cpu = wishbone.Interface()
+        main_ram = wishbone.Interface(data_width=128)
+        self.submodules.l2 = wishbone.Cache(cachesize=64, master=self.cpu, slave=main_ram)
+        self.submodules.ram = wishbone.SRAM(4096*4, bus=main_ram)
+        self.submodules.perf = PerfCounters({"cpu": self.cpu}, {}, self.l2)
+        self.add_csr_bank("perf")
+
+def test_counters():
+    def generator(dut, counts):
+        yield from dut.write("control", ENABLE)
+        # The cache has 4 lines of 4 words and no valid bits, so the lines
+        # start out holding address 0 onwards: all hits.
+        for i in range(16):
+            yield from wb_read(dut.cpu, i)
+        for i in range(16):
+            yield from wb_read(dut.cpu, i)
+        # Refill every line and dirty it...
+        for i in range(4):
+            yield from wb_write(dut.cpu, 64 + 4*i, i)
+        # ...so bringing back the old lines writes them back.
+        for i in range(4):
+            yield from wb_read(dut.cpu, 4*i)
+        yield from dut.write("control", 0)
+        for name in ["cycles", "m_cpu_transactions", "l2_hits", "l2_misses", "l2_writebacks"]:
+            counts[name] = yield from dut.read(name)
+
+        yield from dut.write("control", CLEAR)
+        counts["cleared"] = yield from dut.read("cycles")
+
+    counts = simulate(PerfDUT(), generator)
+    assert counts["m_cpu_transactions"] == 40
+    assert counts["l2_hits"] == 32
+    assert counts["l2_misses"] == 8
+    assert counts["l2_writebacks"] == 4
+    assert counts["cycles"] > 40
+    assert counts["cleared"] == 0
+
+def test_perf_in_csr_map(feather_soc):
+    soc = feather_soc(with_perf=True)
+    assert "perf" in soc.csr.regions
+    names = [name for name, address, words in perf_counter_map(soc)]
+    assert names[0] == "cycles"
+    assert "m_cpu_bus0_transactions" in names
+    assert "s_main_ram_waits" in names
+
+def test_perf_left_out(feather_soc):
+    soc = feather_soc()
+    assert "perf" not in soc.csr.regions
@@ -0,0 +1,22 @@
+import sys
+
+from orangecrab_feather.phases import BuildTimer
+
+def run_phases():
+    timer = BuildTimer()
+    with timer.phase("build"):
+        with timer.phase("elaborate"):
+            sum(range(100000))
+    return timer
+
+def test_phases():
+    timer = run_phases()
+    assert set(timer.phases) == {"build", "elaborate"}
+    assert timer.total()["wall_s"] > 0
+
+def test_without_resource(monkeypatch):
+    # As on Windows, where there's no resource module.
+    monkeypatch.setitem(sys.modules, "resource", None)
+    timer = run_phases()
+    assert timer.phases["elaborate"]["cpu_s"] >= 0
+    assert timer.total()["peak_rss_kib"] == 0
@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import stat
+
+import pytest
+
+pytest.importorskip("litex")
+
+from orangecrab_feather.seeds import SeedSweep
+
+pytestmark = pytest.mark.skipif(sys.platform in ("win32", "cygwin"),
+    reason="Seed sweeps need bash build scripts")
+
+SCRIPT = """\
+# Autogenerated by LiteX / git: --------
+set -e
+yosys  -l top.rpt top.ys
+nextpnr-ecp5 --json top.json --lpf top.lpf --textcfg top.config  --25k --seed 1 
+ecppack  --bootaddr 0   --compress  top.config --svf top.svf --bit top.bit 
+"""
+
+# Stand-ins for the toolchain. Seed N reaches 40 + 5*N MHz against 48 MHz,
+# so seed 1 fails timing and seeds 2 and up pass.
+TOOLS = {
+    "yosys": """\
+echo synth >> synth_runs
+touch top.json
+""",
+    "nextpnr-ecp5": """\
+while [ $# -gt 0 ]; do
+    if [ "$1" = --seed ]; then seed=$2; fi
+    shift
+done
+mhz=$((40 + 5*seed))
+if [ $mhz -ge 48 ]; then status=PASS; else status=FAIL; fi
+echo "Info: Max frequency for clock 'sys': $mhz.00 MHz ($status at 48.00 MHz)"
+touch top.config
+""",
+    "ecppack": """\
+while [ $# -gt 0 ]; do
+    if [ "$1" = --bit ]; then basename "$PWD" > "$2"; fi
+    shift
+done
+""",
+}
+
+@pytest.fixture
+def gateware_dir(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    for name, body in TOOLS.items():
+        path = bin_dir / name
+        path.write_text("#!/bin/sh\n" + body)
+        path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", str(bin_dir) + os.pathsep + os.environ["PATH"])
+
+    gateware_dir = tmp_path / "gateware"
+    gateware_dir.mkdir()
+    (gateware_dir / "build_top.sh").write_text(SCRIPT)
+    return gateware_dir
+
+def test_split_script(gateware_dir):
+    sweep = SeedSweep(str(gateware_dir), "top", [7])
+    synth, pnr = sweep._split_script()
+    assert synth == SCRIPT.splitlines()[:3]
+    assert [cmd[0] for cmd in pnr] == ["nextpnr-ecp5", "ecppack"]
+
+    nextpnr = sweep._seed_cmd(pnr[0], 7)
+    assert nextpnr[nextpnr.index("--seed") + 1] == "7"
+    assert nextpnr.count("--seed") == 1
+    assert os.path.join("..", "top.json") in nextpnr
+    assert os.path.join("..", "top.lpf") in nextpnr
+    assert "top.config" in nextpnr
+    assert sweep._seed_cmd(pnr[1], 7) == pnr[1]
+
+def test_no_nextpnr(gateware_dir):
+    (gateware_dir / "build_top.sh").write_text("yosys -l top.rpt top.ys\n")
+    with pytest.raises(OSError, match="nextpnr"):
+        SeedSweep(str(gateware_dir), "top", [1]).run()
+
+@pytest.mark.parametrize("stop_on_pass,best,skipped", [
+    (False, 3, []),
+    (True,  2, [3]),
+])
+def test_sweep(gateware_dir, stop_on_pass, best, skipped):
+    sweep = SeedSweep(str(gateware_dir), "top", [1, 2, 3], jobs=1, stop_on_pass=stop_on_pass)
+    assert sweep.run()["seed"] == best
+
+    # Synthesis runs once; the bitstream is the best seed's.
+    assert (gateware_dir / "synth_runs").read_text() == "synth\n"
+    assert (gateware_dir / "top.bit").read_text() == "seed_{}\n".format(best)
+    assert [s for s in (1, 2, 3) if not (gateware_dir / "seed_{}".format(s) / "top.bit").exists()] == skipped
+    with open(gateware_dir / "seed_sweep.json") as f:
+        assert [r["seed"] for r in json.load(f) if r.get("skipped")] == skipped
@@ -0,0 +1,42 @@
+import os
+import time
+
+import pytest
+
+# Stands in for the Verilator model: run_sim() only needs a build script and
+# obj_dir/Vsim.
+def fake_sim(path, script):
+    (path / "build_sim.sh").write_text("")
+    os.makedirs(path / "obj_dir")
+    vsim = path / "obj_dir" / "Vsim"
+    vsim.write_text("#!/bin/sh\n" + script)
+    vsim.chmod(0o755)
+    return str(path)
+
+@pytest.fixture
+def run_sim():
+    pytest.importorskip("litex_boards.platforms.orangecrab")
+    pytest.importorskip("litedram")
+    from orangecrab_feather.sim import run_sim
+    return run_sim
+
+def test_results(run_sim, tmp_path):
+    gateware_dir = fake_sim(tmp_path, "\n".join([
+        "echo 'litex> '",
+        "echo 'BENCH {\"name\": \"spi\", \"cycles\": 10}'",
+        "echo 'BENCH {\"done\": true}'",
+        "sleep 60",
+    ]))
+    assert run_sim(gateware_dir, timeout=30) == [{"name": "spi", "cycles": 10}]
+
+def test_ended_early(run_sim, tmp_path):
+    gateware_dir = fake_sim(tmp_path, "echo 'BENCH {\"name\": \"spi\", \"cycles\": 10}'\n")
+    with pytest.raises(OSError, match="ended"):
+        run_sim(gateware_dir, timeout=30)
+
+def test_timeout_when_quiet(run_sim, tmp_path):
+    gateware_dir = fake_sim(tmp_path, "echo 'litex> '\nsleep 60\n")
+    start = time.monotonic()
+    with pytest.raises(OSError, match="timed out"):
+        run_sim(gateware_dir, timeout=1)
+    assert time.monotonic() - start < 10
@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("litex")
+
+from migen import *
+
+from litex.soc.interconnect import wishbone
+
+from orangecrab_feather.spi_dma import SPIDMA
+
+from gateware_sim import CSRBankDUT, simulate
+
+TX = [0x03020100, 0x07060504]
+
+START, TX_ENABLE, RX_ENABLE = 0b001, 0b010, 0b100
+BUSY, ERROR = 0b01, 0b10
+EV_DONE = 0
+
+# SPIDMA with MISO looped back to MOSI and a small SRAM: words 0-1 hold TX,
+# words 4-7 receive.
+class SPIDMADUT(CSRBankDUT):
+    def __init__(self):
+        self.submodules.spi  = SPIDMA(None, sys_clk_freq=4, spi_clk_freq=2)
+        self.submodules.sram = wishbone.SRAM(32, init=TX, bus=self.spi.bus)
+        self.comb += self.spi.pads.miso.eq(self.spi.pads.mosi)
+        self.bus_cycles = Signal(8)
+        self.sync += If(self.spi.bus.cyc & self.spi.bus.stb & self.spi.bus.ack,
+            self.bus_cycles.eq(self.bus_cycles + 1))
+        self.add_csr_bank("spi")
+
+def transfer(tx_base, rx_base, length):
+    def generator(dut, result):
+        yield from dut.write("tx_base", tx_base)
+        yield from dut.write("rx_base", rx_base)
+        yield from dut.write("length", length)
+        yield from dut.write("control", START | TX_ENABLE | RX_ENABLE)
+        yield from dut.wait_event(EV_DONE, limit=1000)
+        result["status"]     = yield from dut.read("status")
+        result["bus_cycles"] = yield dut.bus_cycles
+        result["rx"]         = []
+        for i in range(4, 8):
+            result["rx"].append((yield dut.sram.mem[i]))
+    return simulate(SPIDMADUT(), generator)
+
+def test_loopback():
+    result = transfer(0, 16, 6)
+    assert result["status"] == 0
+    assert result["rx"] == [0x03020100, 0x0504, 0, 0]
+
+@pytest.mark.parametrize("tx_base,rx_base", [(2, 16), (0, 17)])
+def test_unaligned_refused(tx_base, rx_base):
+    result = transfer(tx_base, rx_base, 6)
+    assert result["status"] == ERROR
+    assert result["bus_cycles"] == 0
+    assert result["rx"] == [0, 0, 0, 0]
+
+def test_zero_length():
+    result = transfer(0, 16, 0)
+    assert result["status"] == 0
+    assert result["bus_cycles"] == 0
+    assert result["rx"] == [0, 0, 0, 0]
@@ -0,0 +1,64 @@
+import pytest
+
+pytest.importorskip("litex")
+
+from migen import *
+
+from litex.soc.interconnect import wishbone
+
+from orangecrab_feather.uart_dma import UARTRXDMA
+
+from gateware_sim import CSRBankDUT, simulate
+
+class UARTRXDMADUT(CSRBankDUT):
+    def __init__(self):
+        self.submodules.dma  = UARTRXDMA(fifo_depth=16)
+        self.submodules.sram = wishbone.SRAM(64, bus=self.dma.bus)
+        self.add_csr_bank("dma")
+
+    def send(self, data):
+        sink = self.dma.sink
+        for byte in data:
+            yield sink.valid.eq(1)
+            yield sink.data.eq(byte)
+            yield
+            while not (yield sink.ready):
+                yield
+        yield sink.valid.eq(0)
+        for i in range(32):
+            yield
+
+    def ring(self, n):
+        ring = []
+        for offset in range(n):
+            word = yield self.sram.mem[offset//4]
+            ring.append((word >> 8*(offset % 4)) & 0xff)
+        return ring
+
+def test_ring():
+    def generator(dut, result):
+        yield from dut.write("size", 16)
+        yield from dut.write("control", 1)
+        yield from dut.send([1, 2, 3, 4, 5])
+        result["write_offset"] = yield from dut.read("write_offset")
+        result["level"]        = yield from dut.read("level")
+        result["ring"]         = yield from dut.ring(5)
+
+    result = simulate(UARTRXDMADUT(), generator)
+    assert result["write_offset"] == 5
+    assert result["level"] == 5
+    assert result["ring"] == [1, 2, 3, 4, 5]
+
+# Bytes received before the ring is set up mustn't end up in it.
+def test_dropped_while_disabled():
+    def generator(dut, result):
+        yield from dut.send([0xaa, 0xbb, 0xcc])
+        yield from dut.write("size", 16)
+        yield from dut.write("control", 1)
+        yield from dut.send([1, 2])
+        result["write_offset"] = yield from dut.read("write_offset")
+        result["ring"]         = yield from dut.ring(4)
+
+    result = simulate(UARTRXDMADUT(), generator)
+    assert result["write_offset"] == 2
+    assert result["ring"] == [1, 2, 0, 0]